@@ -191,20 +191,14 @@ if __name__=='__main__':
     #
 
     if rank==0:
-        print('Evaluating body wave misfit...\n')
+        print('Evaluating body and surface wave misfit...\n')
 
-    results_bw = grid_search(
-        data_bw, greens_bw, misfit_bw, origins, grid)
+    # body and surface wave misfit are summed in a single pass over the grid
+    results = grid_search(
+        [data_bw, data_sw], [greens_bw, greens_sw], [misfit_bw, misfit_sw],
+        origins, grid)
 
     if rank==0:
-        print('Evaluating surface wave misfit...\n')
-
-    results_sw = grid_search(
-        data_sw, greens_sw, misfit_sw, origins, grid)
-
-    if rank==0:
-        results = results_bw + results_sw
-
         # source index corresponding to minimum misfit
         idx = results.idxmin('source')
 
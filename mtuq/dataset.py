@@ -5,13 +5,13 @@ import numpy as np
 from copy import copy, deepcopy
 from mtuq.event import Origin
 from mtuq.station import Station
-from mtuq.util import warn
+from mtuq.util import MetadataIndexMixin, warn
 from obspy import Stream
 from obspy.geodetics import gps2dist_azimuth
 
 
 
-class Dataset(list):
+class Dataset(MetadataIndexMixin, list):
     """ Seismic data container
 
     A list of ObsPy streams in which each stream corresponds to a single
@@ -81,6 +81,13 @@ class Dataset(list):
 
     def select(self, selector):
         """ Selects streams that match the given station or origin
+
+        .. note::
+
+            Streams are looked up by station and origin keys, which are
+            computed when the lookup table is built.  If the station or 
+            origin attribute of a stream is replaced or modified in place
+            afterwards, call ``reset_index`` so that the change is seen
         """
         if type(selector) is Station:
            selected = lambda stream: stream.station==selector
@@ -89,14 +96,20 @@ class Dataset(list):
            selected = lambda stream: stream.origin==selector
 
         elif type(selector) is list:
-           selected = lambda stream: stream.id in selector
+           ids = set(selector)
+           return self.__class__(id=self.id, streams=filter(
+               lambda stream: stream.id in ids, self))
 
         else:
             raise ValueError(
                 "SELECTOR must be a Station, Origin or list")
 
+        # keys narrow the search down to candidates, and full comparison
+        # then gives the same result as filtering the whole list
+        candidates = self._lookup(selector)
+
         return self.__class__(
-            id=self.id, streams=filter(selected, self))
+            id=self.id, streams=filter(selected, candidates))
 
 
     def apply(self, function, *args, **kwargs):
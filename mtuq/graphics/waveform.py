@@ -670,6 +670,35 @@ def _get_tag(tags, pattern):
         return None
 
 def compute_time_shifts(data, greens, misfit, stations, origin, source):
-    raise NotImplementedError
+    """ Computes time shifts between data and synthetics for the given source
+
+    Returns a NumPy array of shape `(len(stations), 3)` holding time shifts
+    (s) of Z, R and T components, with NaN for components that are absent or
+    unused.  As a side effect, time shift and misfit attributes are attached
+    to data and synthetic traces.
+    """
+    greens = greens.select(origin)
+
+    misfit(data, greens, source, set_attributes=True)
+
+    time_shifts = np.empty((len(stations), 3))
+    time_shifts[:] = np.nan
+
+    for _i, station in enumerate(stations):
+        try:
+            stream = data.select(station)[0]
+            synthetics = greens.select(station)[0].get_synthetics(
+                source, inplace=True)
+        except IndexError:
+            continue
+
+        for _j, component in enumerate(['Z', 'R', 'T']):
+            try:
+                syn = synthetics.select(component=component)[0]
+            except IndexError:
+                continue
+            time_shifts[_i, _j] = getattr(syn, 'time_shift', np.nan)
+
+    return time_shifts
 
 
@@ -6,6 +6,7 @@ from copy import copy, deepcopy
 from mtuq.event import Origin
 from mtuq.station import Station
 from mtuq.dataset import Dataset
+from mtuq.util import MetadataIndexMixin
 from mtuq.util.signal import check_time_sampling
 from obspy.core import Stream, Trace
 from obspy.geodetics import gps2dist_azimuth
@@ -233,7 +234,7 @@ class GreensTensor(Stream):
 
 
 
-class GreensTensorList(list):
+class GreensTensorList(MetadataIndexMixin, list):
     """ Container for one or more `GreensTensor` objects
     """
 
@@ -262,18 +263,30 @@ class GreensTensorList(list):
 
     def select(self, selector):
         """ Selects `GreensTensors` that match the given station or origin
+
+        .. note::
+
+            Tensors are looked up by station and origin keys, which are
+            computed when the lookup table is built.  If the station or 
+            origin attribute of a tensor is replaced or modified in place
+            afterwards, call ``reset_index`` so that the change is seen
         """
         if type(selector) is Station:
-            selected = self.__class__(id=self.id, tensors=filter(
-                lambda tensor: tensor.station==selector, self))
+            selected = lambda tensor: tensor.station==selector
 
         elif type(selector) is Origin:
-            selected = self.__class__(id=self.id, tensors=filter(
-                lambda tensor: tensor.origin==selector, self))
+            selected = lambda tensor: tensor.origin==selector
 
         else:
             raise TypeError("Bad selector: %s" % type(selector).__name__)
 
+        # keys narrow the search down to candidates, and full comparison
+        # then gives the same result as filtering the whole list
+        candidates = self._lookup(selector)
+
+        selected = self.__class__(id=self.id, tensors=filter(
+            selected, candidates))
+
         if len(selected)==0:
             if len(self) > 0:
                 warnings.warn("Nothing found matching given selector "
@@ -92,13 +92,27 @@ class Grid(object):
         self.callback = callback
 
  
-    def to_array(self):
+    def to_array(self, callback=None):
         """ Returns the entire set of grid points as a NumPy array
+
+        .. rubric:: callback functions
+
+        If a vectorized ``callback`` function is given, it is applied to whole
+        coordinate arrays at once, i.e. it is called with one NumPy array per
+        axis and its result is returned instead.  The default callback given 
+        when creating the grid (which acts on individual grid points) is not 
+        used here.
         """
-        array = np.zeros((self.size, self.ndim))
-        for _i in range(self.size):
-            array[_i, :] = self.get(_i+self.start, callback=None)
-        return array
+        # all grid indices are converted to axis indices in a single pass
+        indices = np.unravel_index(
+            np.arange(self.start, self.stop), self.shape)
+
+        columns = [self.coords[_k][indices[_k]] for _k in range(self.ndim)]
+
+        if callback:
+            return callback(*columns)
+        else:
+            return np.column_stack(columns)
 
 
     def to_dataarray(self, values=None):
@@ -155,10 +169,10 @@ class Grid(object):
         vals = self.coords
         array = np.zeros(self.ndim)
 
-        for _k in range(self.ndim-1, -1, -1):
-            val = vals[_k]
-            array[_k] = val[int(i%len(val))]
-            i/=len(val)
+        indices = np.unravel_index(int(i), self.shape)
+
+        for _k in range(self.ndim):
+            array[_k] = vals[_k][indices[_k]]
 
         if callback:
             return callback(*array)
@@ -179,13 +193,10 @@ class Grid(object):
     def partition(self, nproc):
         """ Partitions grid for parallel processing
         """
-        if self.start!=0:
-            raise Exception
-
         subsets = []
         for iproc in range(nproc):
-            start = int(iproc*self.size/nproc)
-            stop = int((iproc+1)*self.size/nproc)
+            start = self.start + int(iproc*self.size/nproc)
+            stop = self.start + int((iproc+1)*self.size/nproc)
 
             subsets += [Grid(
                 self.dims, self.coords, start, stop, callback=self.callback)]
@@ -292,13 +303,23 @@ class UnstructuredGrid(object):
         self.callback = callback
 
 
-    def to_array(self):
+    def to_array(self, callback=None):
         """ Returns the entire set of grid points as a NumPy array
+
+        .. rubric:: callback functions
+
+        If a vectorized ``callback`` function is given, it is applied to whole
+        coordinate arrays at once, i.e. it is called with one NumPy array per
+        axis and its result is returned instead.  The default callback given 
+        when creating the grid (which acts on individual grid points) is not 
+        used here.
         """
-        array = np.zeros((self.size, self.ndim))
-        for _i in range(self.size):
-            array[_i, :] = self.get(_i+self.start, callback=None)
-        return array
+        columns = [array[:self.size] for array in self.coords]
+
+        if callback:
+            return callback(*columns)
+        else:
+            return np.column_stack(columns)
 
 
     def to_dataframe(self, values=None):
@@ -365,14 +386,16 @@ class UnstructuredGrid(object):
         """
         subsets = []
         for iproc in range(nproc):
-            start = int(iproc*self.size/nproc)
-            stop = int((iproc+1)*self.size/nproc)
+            # offsets relative to the first point of this grid
+            _start = int(iproc*self.size/nproc)
+            _stop = int((iproc+1)*self.size/nproc)
 
             coords = []
             for array in self.coords:
-                coords += [array[start:stop]]
+                coords += [array[_start:_stop]]
             subsets += [UnstructuredGrid(
-                self.dims, coords, start, stop, callback=self.callback)]
+                self.dims, coords, self.start+_start, self.start+_stop,
+                callback=self.callback)]
 
         return subsets
 
@@ -1,13 +1,21 @@
 
 import numpy as np
+import os
 import pandas
 import xarray
 
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor,\
+    as_completed
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
 from mtuq.event import Origin
 from mtuq.grid import Grid, UnstructuredGrid
-from mtuq.util import iterable, timer, remove_list, warn, ProgressCallback,\
-    dataarray_idxmin, dataarray_idxmax
+from mtuq.misfit import Misfit
+from mtuq.util import iterable, timer, remove_list, warn, Null,\
+    ProgressCallback, dataarray_idxmin, dataarray_idxmax, kth_lowest,\
+    mask_top_k
+from mtuq.util.signal import isempty
 from os.path import splitext
 from xarray.core.formatting import unindexed_dims_repr
 
@@ -16,7 +24,9 @@ xarray.set_options(keep_attrs=True)
 
 
 def grid_search(data, greens, misfit, origins, sources, 
-    msg_interval=25, timed=True, gather=True):
+    msg_interval=25, timed=True, gather=True, chunk_size=None,
+    output_filename=None, backend=None, max_workers=None, weights=None,
+    top_k=None):
 
     """ Evaluates misfit over grids
 
@@ -29,6 +39,19 @@ def grid_search(data, greens, misfit, origins, sources,
     containing misfit values and corresponding grid points. Otherwise, 
     an `MTUQDataFrame` is returned.
 
+    If `data`, `greens` and `misfit` are lists of equal length, the weighted
+    sum of all misfit terms is evaluated in a single pass over origins and
+    sources, for example
+
+    .. code::
+
+        results = grid_search(
+            [data_bw, data_sw], [greens_bw, greens_sw], [misfit_bw, misfit_sw],
+            origins, sources)
+
+    returns the same values as adding the results of separate body wave and
+    surface wave grid searches.
+
 
     .. rubric :: Input arguments
 
@@ -68,6 +91,58 @@ def grid_search(data, greens, misfit, origins, sources,
     (ignored outside MPI environment)
 
 
+    ``chunk_size`` (`int`):
+    If given, sources are passed to the misfit function in chunks of at most
+    this many points, so that memory usage is bounded by chunk size rather
+    than grid size
+
+
+    ``output_filename`` (`str`):
+    If given, misfit values are written to a memory-mapped NumPy file
+    (``.npy``) rather than held in memory.  Under MPI, each process
+    writes its own file, with the process number appended to the filename
+
+
+    ``backend`` (`str`):
+    How to parallelize outside an MPI environment
+
+    - ``None``: evaluate misfit serially (or, if invoked from an MPI 
+      environment, divide sources among MPI processes)
+
+    - ``'processes'``: divide sources among a pool of worker processes. 
+      For `mtuq.Misfit` functions, cross-correlations between data and 
+      Green's functions are computed once per origin and shared with 
+      workers through shared memory.  Other misfit functions receive their 
+      own copy of data and Green's functions
+
+    - ``'threads'``: divide sources among a pool of threads, which share 
+      cross-correlations directly.  Only worthwhile if the misfit function
+      releases the GIL, as the `mtuq.Misfit` C extensions do (in which case
+      ``Misfit.num_threads`` should usually be 1)
+
+
+    ``max_workers`` (`int`):
+    Number of worker processes or threads (defaults to the number of CPUs;
+    ignored unless ``backend`` is given)
+
+
+    ``weights`` (`list`):
+    If `data`, `greens` and `misfit` are lists, weights by which the 
+    corresponding misfit terms are multiplied before summing (defaults to 
+    one for all terms)
+
+
+    ``top_k`` (`int`):
+    If given, only the ``top_k`` lowest misfit values over all origins and
+    sources are returned, and all others are set to infinity.  (Values tied
+    with the ``top_k``-th lowest are all kept, so slightly more than 
+    ``top_k`` values may remain finite.)  With a single `mtuq.Misfit` term
+    using the L2 or hybrid norm, sources that cannot be among the best are 
+    abandoned partway through misfit evaluation, which can save much of the
+    computational work.  (Under MPI with ``gather=False``, each process 
+    returns its own ``top_k`` values.)
+
+
     .. note:
 
       If invoked from an MPI environment, the grid is partitioned between
@@ -83,6 +158,27 @@ def grid_search(data, greens, misfit, origins, sources,
     if type(sources) not in (Grid, UnstructuredGrid):
         raise TypeError
 
+    if backend not in [None, 'processes', 'threads']:
+        raise ValueError("Bad input argument: backend")
+
+    if backend and _is_mpi_env():
+        raise Exception("backend cannot be used in an MPI environment")
+
+    data, greens, misfit, weights = _get_terms(data, greens, misfit, weights)
+
+    if backend:
+        values = _grid_search_pool(
+            data, greens, misfit, weights, origins, sources, backend, 
+            max_workers, timed=timed, msg_interval=msg_interval, 
+            chunk_size=chunk_size, output_filename=output_filename,
+            top_k=top_k)
+
+        if issubclass(type(sources), Grid):
+            return _to_dataarray(origins, sources, values)
+
+        elif issubclass(type(sources), UnstructuredGrid):
+            return _to_dataframe(origins, sources, values)
+
     _subset = None
     if _is_mpi_env():
         from mpi4py import MPI
@@ -101,11 +197,17 @@ def grid_search(data, greens, misfit, origins, sources,
             timed = False
             msg_interval = 0
 
+        # each process writes its own output file
+        if output_filename:
+            output_filename = '%s.%d.npy' % (
+                splitext(output_filename)[0], iproc)
+
 
     # evaluate misfit over origins and sources
     values = _grid_search_serial(
-        data, greens, misfit, origins, _subset or sources, timed=timed, 
-        msg_interval=msg_interval)
+        data, greens, misfit, weights, origins, _subset or sources, 
+        timed=timed, msg_interval=msg_interval, chunk_size=chunk_size,
+        output_filename=output_filename, top_k=top_k)
 
     if _is_mpi_env() and gather:
         values = comm.gather(values, root=0)
@@ -114,6 +216,9 @@ def grid_search(data, greens, misfit, origins, sources,
         else:
             return
 
+        if top_k:
+            mask_top_k(values, top_k)
+
     # convert from NumPy array to DataArray or DataFrame
     if issubclass(type(sources), Grid):
         return _to_dataarray(origins, sources, values)
@@ -123,27 +228,516 @@ def grid_search(data, greens, misfit, origins, sources,
 
 
 
+def adaptive_grid_search(data, greens, misfit, origins, sources, 
+    nbest=10, nlevels=4, msg_interval=25, timed=True, weights=None):
+
+    """ Evaluates misfit over a coarse grid, then repeatedly refines the grid
+    around the best-fitting points
+
+    .. rubric :: Usage
+
+    Evaluates `misfit(data, greens.select(origin), sources)` over a coarse
+    regularly-spaced grid.  At each refinement level, grid spacing is halved
+    and new points are added around the ``nbest`` points with lowest 
+    misfit found so far.  Refinement takes place along the orientation and
+    source type axes (``kappa``, ``sigma``, ``h``, ``v``, ``w`` for moment 
+    tensors, or ``phi``, ``h`` for forces) that have more than one value in 
+    the coarse grid; magnitude remains as given by the coarse grid.
+
+    Because only the neighborhoods of the best-fitting points are refined, 
+    a coarse grid that brackets the minimum is typically enough to reach 
+    the same best-fitting source as a dense grid, with far fewer misfit
+    evaluations.
+
+    Returns an `MTUQDataFrame` containing misfit values at all evaluated
+    points.
+
+
+    .. rubric :: Input arguments
+
+    ``data``, ``greens``, ``misfit``, ``origins``, ``weights``:
+    Same as for ``grid_search``
+
+    ``sources`` (`mtuq.Grid`):
+    Coarse grid of source mechanisms
+
+    ``nbest`` (`int`):
+    Number of best-fitting points around which the grid is refined at each
+    level
+
+    ``nlevels`` (`int`):
+    Number of refinement levels
+
+    ``msg_interval`` (`int`):
+    How frequently, as a percentage of total evaluations, should progress 
+    messages be displayed while evaluating the coarse grid? (value between
+    0 and 100)
+
+    ``timed`` (`bool`):
+    Display elapsed time at end?
+
+
+    .. note:
+
+      Each origin is refined independently
+
+    """
+    origins = iterable(origins)
+    for origin in origins:
+        assert type(origin) is Origin
+
+    if type(sources) is not Grid:
+        raise TypeError
+
+    data, greens, misfit, weights = _get_terms(data, greens, misfit, weights)
+
+    points, values = _adaptive_search_serial(
+        data, greens, misfit, weights, origins, sources, nbest, nlevels,
+        msg_interval=msg_interval, timed=timed)
+
+    return _to_dataframe_adaptive(sources.dims, points, values)
+
+
+
 @timer
-def _grid_search_serial(data, greens, misfit, origins, sources, 
-    timed=True, msg_interval=25):
+def _grid_search_serial(data, greens, misfit, weights, origins, sources, 
+    timed=True, msg_interval=25, chunk_size=None, output_filename=None,
+    top_k=None):
     """ Evaluates misfit over origin and source grids 
     (serial implementation)
     """
     ni = len(origins)
     nj = len(sources)
 
-    values = []
+    # preallocate output array of shape `(len(sources), len(origins))`
+    values = _allocate(nj, ni, output_filename)
+
+    chunks = _get_chunks(sources, chunk_size)
+
+    # lowest misfit values found so far, which determine how soon sources can 
+    # be abandoned in later chunks
+    best = np.array([])
+
+    for _i, origin in enumerate(origins):
+        _greens = [term.select(origin) for term in greens]
+
+        # if possible, cross-correlate data and Green's functions once per 
+        # origin rather than once per chunk
+        _misfit = [_get_operator(*term, len(chunks))
+            for term in zip(misfit, data, _greens)]
+
+        for chunk in chunks:
+            offset = chunk.start - sources.start
+
+            msg_handle = ProgressCallback(
+                start=_i*nj+offset, stop=ni*nj, percent=msg_interval)
+
+            # evaluate misfit function
+            values[offset:offset+chunk.size, _i:_i+1] = _evaluate_terms(
+                data, _greens, _misfit, weights, chunk, msg_handle,
+                top_k=top_k, threshold=kth_lowest(best, top_k or 0))
+
+            if top_k:
+                best = np.concatenate(
+                    [best, values[offset:offset+chunk.size, _i]])
+                best = np.sort(best)[:top_k]
+
+    if top_k:
+        mask_top_k(values, top_k)
+
+    if output_filename:
+        values.flush()
+
+    return values
+
+
+@timer
+def _grid_search_pool(data, greens, misfit, weights, origins, sources, 
+    backend, max_workers=None, timed=True, msg_interval=25, chunk_size=None,
+    output_filename=None, top_k=None):
+    """ Evaluates misfit over origin and source grids 
+    (process or thread pool implementation)
+    """
+    ni = len(origins)
+    nj = len(sources)
+
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+
+    # preallocate output array of shape `(len(sources), len(origins))`
+    values = _allocate(nj, ni, output_filename)
+
+    # at least one task per worker, and none larger than chunk_size
+    ntasks = max(max_workers, len(_get_chunks(sources, chunk_size)))
+    tasks = sources.partition(min(ntasks, nj))
+
+    if backend=='processes':
+        executor = ProcessPoolExecutor(max_workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers)
+
+    with executor:
+        for _i, origin in enumerate(origins):
+            terms, blocks = [], []
+            for _misfit, _data, _greens in zip(misfit, data, greens):
+                func, args, _blocks = _get_task(
+                    _misfit, _data, _greens.select(origin), backend)
+                terms += [(func, args)]
+                blocks += _blocks
+
+            futures = {}
+            for _k, task in enumerate(tasks):
+                # as under MPI, only the first task displays progress messages
+                if _k==0:
+                    msg_handle = ProgressCallback(
+                        start=_i*task.size, stop=ni*task.size, 
+                        percent=msg_interval)
+                else:
+                    msg_handle = Null()
+
+                futures[executor.submit(_evaluate_joint, terms, weights,
+                    task, msg_handle, top_k)] = task
+
+            try:
+                for future in as_completed(futures):
+                    task = futures[future]
+                    offset = task.start - sources.start
+                    values[offset:offset+task.size, _i:_i+1] = future.result()
+
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+
+    if top_k:
+        mask_top_k(values, top_k)
+
+    if output_filename:
+        values.flush()
+
+    return values
+
+
+def _get_task(misfit, data, greens, backend):
+    """ Returns function, leading arguments and shared memory blocks used to 
+    evaluate misfit over a single task
+    """
+    if type(misfit) is not Misfit or isempty(data):
+        return _evaluate_misfit, (misfit, data, greens), []
+
+    try:
+        operator = misfit.precompute(data, greens)
+    except NotImplementedError:
+        # e.g. L1 norm without compiled extensions, for which Misfit.__call__
+        # falls back to a slower optimization level
+        return _evaluate_misfit, (misfit, data, greens), []
+
+    if backend=='threads':
+        return _evaluate_operator, (operator,), []
+
+    # copy cross-correlations to shared memory, so that worker processes can
+    # access them without pickling
+    arrays, scalars, blocks = {}, {}, []
+    for key, value in operator._cache.items():
+        if isinstance(value, np.ndarray):
+            block = SharedMemory(create=True, size=max(value.nbytes, 1))
+            np.ndarray(value.shape, value.dtype, buffer=block.buf)[...] = value
+            arrays[key] = (block.name, value.shape, value.dtype.str)
+            blocks += [block]
+        else:
+            scalars[key] = value
+
+    return _evaluate_shared, (misfit, operator.optimization_level, arrays,
+        scalars), blocks
+
+
+def _evaluate_terms(data, greens, misfit, weights, sources, msg_handle,
+    top_k=None, threshold=np.inf):
+    """ Evaluates weighted sum of misfit terms over sources
+    """
+    kwargs = _get_pruning(weights, top_k, threshold)
+
+    values = 0.
+    for _k in range(len(misfit)):
+        # only the first term displays progress messages
+        if _k > 0:
+            msg_handle = Null()
+
+        values = values + weights[_k]*misfit[_k](
+            data[_k], greens[_k], sources, msg_handle, **kwargs)
+
+    return values
+
+
+def _evaluate_joint(terms, weights, sources, msg_handle, top_k=None):
+    """ Evaluates weighted sum of misfit terms over sources, given the 
+    functions and leading arguments returned by ``_get_task``
+    """
+    kwargs = _get_pruning(weights, top_k)
+
+    values = 0.
+    for _k, (func, args) in enumerate(terms):
+        if _k > 0:
+            msg_handle = Null()
+
+        values = values + weights[_k]*func(*args, sources, msg_handle, 
+            **kwargs)
+
+    return values
+
+
+def _get_pruning(weights, top_k=None, threshold=np.inf):
+    """ Returns keyword arguments that allow misfit functions to abandon 
+    sources early
+    """
+    # the best sources of an individual term need not be the best sources of
+    # a weighted sum, so only single terms are pruned
+    if not top_k or len(weights)!=1 or weights[0] <= 0.:
+        return {}
+
+    return {'top_k': top_k, 'threshold': threshold/weights[0]}
+
+
+def _evaluate_misfit(misfit, data, greens, sources, msg_handle, top_k=None,
+    threshold=np.inf):
+    if type(misfit) is Misfit:
+        return misfit(data, greens, sources, msg_handle, top_k=top_k,
+            threshold=threshold)
+    else:
+        return misfit(data, greens, sources, msg_handle)
+
+
+def _evaluate_operator(operator, sources, msg_handle, **kwargs):
+    return operator(sources, msg_handle, **kwargs)
+
+
+def _evaluate_shared(misfit, optimization_level, arrays, scalars, sources,
+    msg_handle, **kwargs):
+    # attaches to cross-correlations in shared memory (see _get_task)
+    from mtuq.misfit import MisfitOperator
+
+    cache, blocks = dict(scalars), []
+    for key, (name, shape, dtype) in arrays.items():
+        block = SharedMemory(name=name)
+        cache[key] = np.ndarray(shape, dtype, buffer=block.buf)
+        blocks += [block]
+
+    try:
+        operator = MisfitOperator(misfit=misfit,
+            optimization_level=optimization_level, cache=cache)
+        values = operator(sources, msg_handle, **kwargs)
+
+    finally:
+        # arrays must be released before their memory can be
+        operator = cache = None
+        for block in blocks:
+            block.close()
+
+    return values
+
+
+def _allocate(nj, ni, output_filename=None):
+    """ Preallocates array of misfit values, optionally memory-mapped
+    """
+    if output_filename:
+        return np.lib.format.open_memmap(
+            output_filename, mode='w+', dtype='float64', shape=(nj, ni))
+    else:
+        return np.empty((nj, ni))
+
+
+def _get_operator(misfit, data, greens, nchunks):
+    """ Wraps misfit function so that cross-correlations are reused across
+    chunks
+    """
+    if nchunks < 2 or type(misfit) is not Misfit or isempty(data):
+        return partial(_evaluate_misfit, misfit)
+
+    try:
+        operator = misfit.precompute(data, greens)
+    except NotImplementedError:
+        # e.g. L1 norm without compiled extensions, for which Misfit.__call__
+        # falls back to a slower optimization level
+        return partial(_evaluate_misfit, misfit)
+
+    def _misfit(data, greens, sources, msg_handle, **kwargs):
+        return operator(sources, msg_handle, **kwargs)
+
+    return _misfit
+
+
+def _get_terms(data, greens, misfit, weights=None):
+    """ Returns lists of data, Green's functions, misfit functions and 
+    weights, one entry per misfit term
+    """
+    # Datasets and GreensTensorLists are themselves lists, so exact types 
+    # are checked
+    if type(data) in (list, tuple):
+        if type(greens) not in (list, tuple) or\
+           type(misfit) not in (list, tuple):
+            raise TypeError
+
+        if not len(data)==len(greens)==len(misfit):
+            raise ValueError("Inconsistent number of misfit terms")
+
+    else:
+        data, greens, misfit = [data], [greens], [misfit]
+
+    if weights is None:
+        weights = [1.]*len(data)
+
+    if len(weights)!=len(data):
+        raise ValueError("Inconsistent number of misfit terms")
+
+    return list(data), list(greens), list(misfit), list(weights)
+
+
+def _get_chunks(sources, chunk_size):
+    """ Divides sources into chunks of at most `chunk_size` points
+    """
+    if not chunk_size or chunk_size >= sources.size:
+        return [sources]
+
+    nchunks = int(np.ceil(sources.size/float(chunk_size)))
+    return sources.partition(nchunks)
+
+
+@timer
+def _adaptive_search_serial(data, greens, misfit, weights, origins, sources,
+    nbest, nlevels, msg_interval=25, timed=True):
+    """ Evaluates misfit over adaptively refined source grids
+    (serial implementation)
+    """
+    dims = sources.dims
+    coarse = sources.to_array()
+
+    # which axes are refined, and with what initial spacing and bounds?
+    axes, spacing, lower, upper, periodic = _get_refinement_axes(sources)
+
+    # offsets to all neighbors of a cell center (other than the center itself)
+    offsets = np.array(np.meshgrid(*[[-1., 0., 1.]]*len(axes), indexing='ij'))
+    offsets = offsets.reshape(len(axes), -1).T
+    offsets = offsets[np.any(offsets != 0., axis=1)]
+
+    points, values = [], []
     for _i, origin in enumerate(origins):
+        _greens = [term.select(origin) for term in greens]
 
+        # each level is evaluated separately, so cross-correlations are 
+        # reused across levels if possible
+        _misfit = [_get_operator(*term, nlevels+1)
+            for term in zip(misfit, data, _greens)]
+
+        # evaluate coarse grid
         msg_handle = ProgressCallback(
-            start=_i*nj, stop=ni*nj, percent=msg_interval)
+            start=_i*len(coarse), stop=len(origins)*len(coarse),
+            percent=msg_interval)
+
+        _points = [coarse]
+        _values = [_evaluate_terms(
+            data, _greens, _misfit, weights, sources, msg_handle)[:, 0]]
+
+        visited = set(map(tuple, np.round(coarse, 12)))
+
+        # evaluate successively finer grids around the best points so far
+        _spacing = spacing.copy()
+        for _level in range(nlevels):
+            _spacing /= 2.
+
+            best = np.concatenate(_points)[
+                np.argsort(np.concatenate(_values))[:nbest]]
 
-        # evaluate misfit function
-        values += [misfit(
-            data, greens.select(origin), sources, msg_handle)]
+            new = np.repeat(best, len(offsets), axis=0)
+            new[:, axes] += np.tile(offsets*_spacing, (len(best), 1))
 
-    # returns NumPy array of shape `(len(sources), len(origins))` 
-    return np.concatenate(values, axis=1)
+            # keep new points within parameter bounds
+            for _k, axis in enumerate(axes):
+                if periodic[_k]:
+                    new[:, axis] = lower[_k] +\
+                        (new[:, axis]-lower[_k]) % (upper[_k]-lower[_k])
+                else:
+                    new[:, axis] = np.clip(new[:, axis], lower[_k], upper[_k])
+
+            # skip points that have already been evaluated
+            new = np.unique(np.round(new, 12), axis=0)
+            new = new[[tuple(point) not in visited for point in new]]
+            visited.update(map(tuple, new))
+
+            if len(new)==0:
+                break
+
+            subset = UnstructuredGrid(
+                dims, [new[:, _k] for _k in range(len(dims))],
+                callback=sources.callback)
+
+            _points += [new]
+            _values += [_evaluate_terms(
+                data, _greens, _misfit, weights, subset, Null())[:, 0]]
+
+        points += [np.concatenate(_points)]
+        values += [np.concatenate(_values)]
+
+    return points, values
+
+
+def _get_refinement_axes(sources):
+    """ Returns indices, spacings and bounds of grid axes to be refined
+    """
+    if 'rho' in sources.dims:
+        # moment tensor parameters (see mtuq.grid.moment_tensor)
+        bounds = {
+            'v': (-1./3., 1./3., False),
+            'w': (-3./8.*np.pi, 3./8.*np.pi, False),
+            'kappa': (0., 360., True),
+            'sigma': (-90., 90., False),
+            'h': (0., 1., False),
+            }
+
+    elif 'F0' in sources.dims:
+        # force parameters (see mtuq.grid.force)
+        bounds = {
+            'phi': (0., 360., True),
+            'h': (-1., 1., False),
+            }
+
+    else:
+        raise ValueError
+
+    axes, spacing, lower, upper, periodic = [], [], [], [], []
+    for _k, dim in enumerate(sources.dims):
+        coords = np.unique(sources.coords[_k])
+        if dim not in bounds or len(coords) < 2:
+            continue
+
+        axes += [_k]
+        spacing += [np.max(np.diff(coords))]
+        lower += [bounds[dim][0]]
+        upper += [bounds[dim][1]]
+        periodic += [bounds[dim][2]]
+
+    return axes, np.array(spacing), lower, upper, periodic
+
+
+def _to_dataframe_adaptive(dims, points, values):
+    """ Converts adaptive_grid_search outputs to DataFrame
+    """
+    origin_idx, source_idx = [], []
+    for _i, _points in enumerate(points):
+        origin_idx += [np.repeat(_i, len(_points))]
+        source_idx += [np.arange(len(_points), dtype='int')]
+
+    points = np.concatenate(points)
+
+    data = {
+        'origin_idx': np.concatenate(origin_idx),
+        'source_idx': np.concatenate(source_idx),
+        }
+    data.update({dims[_k]: points[:, _k] for _k in range(len(dims))})
+    data.update({0: np.concatenate(values)})
+
+    df = MTUQDataFrame(data=data)
+    df = df.set_index(['origin_idx', 'source_idx'] + list(dims))
+    return df
 
 
 
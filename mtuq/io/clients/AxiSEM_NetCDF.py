@@ -53,7 +53,8 @@ class Client(ClientBase):
         self.include_force = include_force
 
 
-    def get_greens_tensors(self, stations=[], origins=[], verbose=False):
+    def get_greens_tensors(self, stations=[], origins=[], verbose=False,
+        max_workers=1):
         """ Reads Green's tensors from database
 
         Returns a ``GreensTensorList`` in which each element corresponds to a
@@ -66,8 +67,32 @@ class Client(ClientBase):
         ``origins`` (`list` of `mtuq.Origin` objects)
 
         ``verbose`` (`bool`)
+
+        ``max_workers`` (`int`)
+        Number of threads used to retrieve Green's tensors concurrently
         """
-        return super(Client, self).get_greens_tensors(stations, origins, verbose)
+        return super(Client, self).get_greens_tensors(
+            stations, origins, verbose, max_workers)
+
+
+    def _get_cache_key(self, station=None, origin=None):
+        # force responses are computed from source and receiver locations,
+        # rather than from epicentral distance only
+        if self.include_force:
+            return None
+
+        return (self.model, self._get_distance(station, origin),
+            float(origin.depth_in_m),
+            float(station.starttime) - float(origin.time),
+            float(station.endtime) - float(origin.time),
+            float(station.delta))
+
+
+    def _get_distance(self, station, origin):
+        # distances are rounded to 0.001 degrees (about 100 m), well below 
+        # the resolution of AxiSEM databases, so that stations at nearly the 
+        # same distance share a single read
+        return round(get_distance_in_deg(station, origin), 3)
 
 
     def _get_greens_tensor(self, station=None, origin=None):
@@ -76,7 +101,8 @@ class Client(ClientBase):
 
         if self.include_mt:
             stream += self.db.get_greens_function(
-                epicentral_distance_in_degree=get_distance_in_deg(station, origin),
+                epicentral_distance_in_degree=self._get_distance(
+                    station, origin),
                 source_depth_in_m=origin.depth_in_m, 
                 origin_time=origin.time,
                 kind='displacement',
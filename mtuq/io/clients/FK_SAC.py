@@ -83,7 +83,8 @@ class Client(ClientBase):
 
 
 
-    def get_greens_tensors(self, stations=[], origins=[], verbose=False):
+    def get_greens_tensors(self, stations=[], origins=[], verbose=False,
+        max_workers=1):
         """ Reads Green's tensors from database
 
         Returns a ``GreensTensorList`` in which each element corresponds to a
@@ -97,41 +98,68 @@ class Client(ClientBase):
 
         ``verbose`` (`bool`)
 
+        ``max_workers`` (`int`)
+        Number of threads used to retrieve Green's tensors concurrently
+
         """
-        return super(Client, self).get_greens_tensors(stations, origins, verbose)
+        return super(Client, self).get_greens_tensors(
+            stations, origins, verbose, max_workers)
 
 
-    def _get_greens_tensor(self, station=None, origin=None):
-        if station is None:
-            raise Exception("Missing station input argument")
+    def _get_cache_key(self, station=None, origin=None):
+        # Green's functions are read from files indexed by depth and distance
+        # (in km) and resampled to the time window of the data, so only the 
+        # window relative to the origin time is needed besides
+        dep, dst = self._get_depth_and_distance(station, origin)
 
-        if origin is None:
-            raise Exception("Missing station input argument")
+        return (self.model, dep, dst,
+            float(station.starttime) - float(origin.time),
+            float(station.endtime) - float(origin.time),
+            float(station.delta))
 
-        traces = []
 
+    def _get_depth_and_distance(self, station, origin):
         distance_in_m, _, _ = gps2dist_azimuth(
             origin.latitude,
             origin.longitude,
             station.latitude,
             station.longitude)
 
+        #dep = str(int(round(origin.depth_in_m/1000.)))
+        dep = str(int(np.ceil(origin.depth_in_m/1000.)))
+        #dst = str(int(round(distance_in_m/1000.)))
+        dst = str(int(np.ceil(distance_in_m/1000.)))
+
+        return dep, dst
+
+
+    def _read_trace(self, dep, dst, ext):
+        # reads a single time series from the FK directory tree
+        return obspy.read('%s/%s_%s/%s.grn.%s' %
+            (self.path, self.model, dep, dst, ext),
+            format='sac')[0]
+
+
+    def _get_greens_tensor(self, station=None, origin=None):
+        if station is None:
+            raise Exception("Missing station input argument")
+
+        if origin is None:
+            raise Exception("Missing station input argument")
+
+        traces = []
+
         # what are the start and end times of the data?
         t1_new = float(station.starttime)
         t2_new = float(station.endtime)
         dt_new = float(station.delta)
 
-        #dep = str(int(round(origin.depth_in_m/1000.)))
-        dep = str(int(np.ceil(origin.depth_in_m/1000.)))
-        #dst = str(int(round(distance_in_m/1000.)))
-        dst = str(int(np.ceil(distance_in_m/1000.)))
+        dep, dst = self._get_depth_and_distance(station, origin)
 
         if self.include_mt:
 
             for _i, ext in enumerate(EXTENSIONS):
-                trace = obspy.read('%s/%s_%s/%s.grn.%s' %
-                    (self.path, self.model, dep, dst, ext),
-                    format='sac')[0]
+                trace = self._read_trace(dep, dst, ext)
 
                 trace.stats.channel = CHANNELS[_i]
                 trace.stats._component = CHANNELS[_i][0]
@@ -0,0 +1,273 @@
+
+import json
+import os
+import obspy
+import numpy as np
+
+from functools import lru_cache
+from glob import glob
+from os.path import basename, exists, join
+from mtuq.io.clients.FK_SAC import Client as ClientBase, EXTENSIONS
+from obspy.core import AttribDict, Trace, UTCDateTime
+
+
+# A packed file begins with the following identifier, followed by the length
+# of a JSON index header (as an 8-byte little-endian integer), the header
+# itself, and then all time series as little-endian float32 values. For each
+# (depth, distance) pair, the header holds the position and time sampling of
+# the corresponding time series, together with the P and S arrival times
+# from SAC headers t1, t2
+MAGIC = b'MTUQ_FK_PACKED01'
+
+# time series start at a multiple of this many bytes
+ALIGNMENT = 64
+
+
+
+class Client(ClientBase):
+    """  Packed FK database client
+
+    .. rubric:: Usage
+
+    To create a packed database, supply the path to an FK directory tree and
+    the name of the file to be written:
+
+    .. code::
+
+        from mtuq.io.clients.FK_packed import pack
+        pack(path_to_FK_directory_tree, 'scak.fk')
+
+    To instantiate a database client, supply the name of the packed file:
+
+    .. code::
+
+        from mtuq.io.clients.FK_packed import Client
+        db = Client('scak.fk')
+
+    Then the database client can be used to generate GreensTensors:
+
+    .. code::
+
+        greens_tensors = db.get_greens_tensors(stations, origin)
+
+    When no longer needed, the memory-mapped file can be released:
+
+    .. code::
+
+        db.close()
+
+
+    .. note::
+
+      Reading an FK directory tree requires opening ten SAC files for each
+      station and origin, which can be slow on network filesystems.  A packed
+      database holds the same time series in a single file, which is memory
+      mapped, so that GreensTensors are obtained by slicing.  The packed file
+      can also be used as `FK_database` in ``mtuq.ProcessData``.
+
+    """
+    def __init__(self, path_or_url=None, model=None,
+        include_mt=True, include_force=False):
+
+        if not path_or_url:
+            raise Exception
+
+        if not exists(path_or_url):
+            raise Exception
+
+        if include_force:
+            raise NotImplementedError
+
+        header, _ = _read_header(path_or_url)
+
+        if not model:
+            model = header['model']
+
+        # path to packed file
+        self.path = path_or_url
+
+        # index header and memory-mapped time series, opened on first use
+        self._header = None
+        self._array = None
+
+        # model from which fk Green's functions were computed
+        self.model = model
+
+        self.include_mt = include_mt
+        self.include_force = include_force
+
+
+    def close(self):
+        """ Releases the memory-mapped file
+
+        The file is opened again if further GreensTensors are requested
+        """
+        self._header = None
+        self._array = None
+
+
+    def _open(self):
+        if self._array is None:
+            self._header, self._array = _open(self.path)
+        return self._header, self._array
+
+
+    def _read_trace(self, dep, dst, ext):
+        # slices a single time series from the memory-mapped file
+        header, array = self._open()
+        offset, npts, delta, starttime, t1, t2 = _get_entry(header, dep, dst)
+
+        start = offset + EXTENSIONS.index(ext)*npts
+
+        # like the SAC reader, keeps only defined header values
+        sac = AttribDict()
+        if t1 is not None:
+            sac.t1 = t1
+        if t2 is not None:
+            sac.t2 = t2
+
+        return Trace(np.array(array[start:start+npts]),
+            {'delta': delta, 'starttime': UTCDateTime(starttime), 'sac': sac})
+
+
+
+def pack(path, filename, model=None):
+    """ Packs FK directory tree into a single file
+
+    .. rubric :: Input arguments
+
+    ``path`` (`str`):
+    FK directory tree, with subdirectories ``<model>_<depth>`` holding SAC
+    files ``<distance>.grn.<extension>``
+
+    ``filename`` (`str`):
+    Name of packed file to be written
+
+    ``model`` (`str`):
+    Name of model (defaults to the basename of `path`)
+
+    """
+    if not model:
+        model = basename(path.rstrip('/'))
+
+    # the header is written first, so the index is built from SAC headers
+    # alone, and time series are read in a second pass
+    entries = {}
+    offset = 0
+    for dirname in sorted(glob(join(path, model+'_*'))):
+        dep = basename(dirname)[len(model)+1:]
+
+        for fullname in sorted(glob(join(dirname, '*.grn.0'))):
+            dst = basename(fullname).split('.')[0]
+
+            stats = [_read(dirname, dst, ext, headonly=True).stats
+                for ext in EXTENSIONS]
+
+            for _stats in stats[1:]:
+                if _stats.npts != stats[0].npts or\
+                   _stats.delta != stats[0].delta or\
+                   _stats.starttime != stats[0].starttime:
+                    raise Exception('Time sampling differs from trace to '
+                        'trace: %s' % fullname)
+
+            sac = stats[EXTENSIONS.index('0')].sac
+            npts = int(stats[0].npts)
+
+            entries['%s_%s' % (dep, dst)] = [offset, npts,
+                float(stats[0].delta), float(stats[0].starttime),
+                _float(sac.get('t1')), _float(sac.get('t2'))]
+
+            offset += len(EXTENSIONS)*npts
+
+    header = json.dumps({
+        'model': model,
+        'extensions': EXTENSIONS,
+        'entries': entries,
+        }).encode()
+
+    # writes to a temporary file first, so that clients which have the
+    # previous version memory-mapped are unaffected
+    tmpname = filename + '.tmp'
+
+    with open(tmpname, 'wb') as file:
+        file.write(MAGIC)
+        file.write(np.array(len(header), dtype='<u8').tobytes())
+        file.write(header)
+        file.write(b'\0'*(_get_start(len(header)) - file.tell()))
+
+        for key in entries:
+            dep, dst = key.split('_')
+            dirname = join(path, '%s_%s' % (model, dep))
+            for ext in EXTENSIONS:
+                file.write(np.asarray(_read(dirname, dst, ext).data,
+                    dtype='<f4').tobytes())
+
+    os.replace(tmpname, filename)
+
+
+def read_picks(filename, dep, dst):
+    """ Returns P and S arrival times (from SAC headers t1, t2) stored in
+    packed file for the given depth and distance
+    """
+    header, _ = _read_header(filename)
+    _, _, _, _, t1, t2 = _get_entry(header, dep, dst)
+    return t1, t2
+
+
+
+#
+# utility functions
+#
+
+def _open(filename):
+    # parses the header and memory-maps the time series
+    header, start = _read_header(filename)
+
+    array = np.memmap(filename, dtype='<f4', mode='r', offset=start)
+
+    return header, array
+
+
+def _read_header(filename):
+    # returns the header and the position of the first time series, parsing
+    # the header again only if the file has been modified
+    stats = os.stat(filename)
+    return _read_header_cached(
+        os.path.abspath(filename), stats.st_mtime_ns, stats.st_size)
+
+
+@lru_cache(maxsize=8)
+def _read_header_cached(filename, mtime, size):
+    with open(filename, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise Exception('Not a packed FK database: %s' % filename)
+        length = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+        header = json.loads(file.read(length).decode())
+
+    return header, _get_start(length)
+
+
+def _get_entry(header, dep, dst):
+    try:
+        return header['entries']['%s_%s' % (dep, dst)]
+    except KeyError:
+        raise Exception('Not found in packed FK database: depth %s km, '
+            'distance %s km' % (dep, dst))
+
+
+def _get_start(length):
+    # position of the first time series, given the header length
+    return int(ALIGNMENT*np.ceil((len(MAGIC)+8+length)/ALIGNMENT))
+
+
+def _float(value):
+    # SAC header values are single precision, and undefined ones are absent
+    if value is None:
+        return None
+    return float(value)
+
+
+def _read(dirname, dst, ext, **kwargs):
+    return obspy.read(join(dirname, '%s.grn.%s' % (dst, ext)), format='sac',
+        **kwargs)[0]
+
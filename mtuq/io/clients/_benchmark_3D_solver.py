@@ -110,7 +110,8 @@ class Client(ClientBase):
             (self.path, self._prefix1, depth_key, self._prefix2, offset_key)
 
 
-    def get_greens_tensors(self, stations=[], origins=[], verbose=False):
+    def get_greens_tensors(self, stations=[], origins=[], verbose=False,
+        max_workers=1):
         """ Reads Green's tensors
 
         Returns a ``GreensTensorList`` in which each element corresponds to a
@@ -124,8 +125,12 @@ class Client(ClientBase):
 
         ``verbose`` (`bool`)
 
+        ``max_workers`` (`int`)
+        Number of threads used to retrieve Green's tensors concurrently
+
         """
-        return super(Client, self).get_greens_tensors(stations, origins, verbose)
+        return super(Client, self).get_greens_tensors(
+            stations, origins, verbose, max_workers)
 
 
     def _get_greens_tensor(self, station=None, origin=None):
@@ -1,4 +1,7 @@
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from mtuq.greens_tensor import GreensTensorList
 from mtuq.util import iterable
 
@@ -10,13 +13,26 @@ class Client(object):
     Details regarding how the GreenTensors are created--whether they are 
     downloaded, read from disk, or computed on-the-fly--are deferred to the 
     subclass.
+
+    .. note::
+
+        For 1D Earth models, Green's functions depend only on source depth and
+        epicentral distance, with azimuth entering only later when the time
+        series are combined.  Subclasses that define ``_get_cache_key`` keep
+        up to ``cache_size`` recently read Green's tensors in memory, so that
+        origins and stations sharing the same key are read only once.
     """
 
+    # maximum number of Green's tensors kept in memory for reuse
+    cache_size = 128
+
+
     def __init__(self, path_or_url='', **kwargs):
         raise NotImplementedError("Must be implemented by subclass")
 
 
-    def get_greens_tensors(self, stations=[], origins=[], verbose=False):
+    def get_greens_tensors(self, stations=[], origins=[], verbose=False,
+        max_workers=1):
         """ Reads Green's tensors from database
 
         Returns a ``GreensTensorList`` in which each element corresponds to the
@@ -30,24 +46,75 @@ class Client(object):
 
         ``verbose`` (`bool`)
 
+        ``max_workers`` (`int`)
+        Number of threads used to retrieve Green's tensors concurrently
+
+        .. note::
+
+          Reading files, decompressing downloads and waiting on web services
+          mostly take place outside the Python interpreter lock, so with
+          ``max_workers > 1``, such work overlaps across stations and origins.
+          Green's tensors are returned in the same order either way
+
         """
         origins = iterable(origins)
         stations = iterable(stations)
         ni = len(origins)
         nj = len(stations)
 
+        executor = None
+        if max_workers > 1:
+            # all requests are submitted at once, so that work on one origin
+            # can begin while the previous one is still being read
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            futures = []
+            pending = {}
+            for origin in origins:
+                futures += [[]]
+                for station in stations:
+                    key = None
+                    if self.cache_size:
+                        key = self._get_cache_key(station, origin)
+
+                    # requests that would hit the cache once an earlier 
+                    # request completes share its result instead
+                    if key is not None and key in pending:
+                        futures[-1] += [(pending[key], True)]
+                        continue
+
+                    future = executor.submit(
+                        self._get_greens_tensor_cached, station, origin)
+                    futures[-1] += [(future, False)]
+
+                    if key is not None:
+                        pending[key] = future
+
         tensors = []
-        for _i, origin in enumerate(origins):
-            if verbose:
-                if len(origins) > 1:
-                    print("  reading %d of %d" % (_i+1, ni))
-                    print("  origin latitude: %.1f" % origin.latitude)
-                    print("  origin longitude: %.1f" % origin.longitude)
-                    print("  origin depth (km): %d" % int(origin.depth_in_m/1000.))
-                    print("")
-
-            for _j, station in enumerate(stations):
-                tensors += [self._get_greens_tensor(station, origin)]
+        try:
+            for _i, origin in enumerate(origins):
+                if verbose:
+                    if len(origins) > 1:
+                        print("  reading %d of %d" % (_i+1, ni))
+                        print("  origin latitude: %.1f" % origin.latitude)
+                        print("  origin longitude: %.1f" % origin.longitude)
+                        print("  origin depth (km): %d" % int(origin.depth_in_m/1000.))
+                        print("")
+
+                for _j, station in enumerate(stations):
+                    if executor:
+                        future, shared = futures[_i][_j]
+                        if shared:
+                            tensors += [_reuse(
+                                future.result(), station, origin)]
+                        else:
+                            tensors += [future.result()]
+                    else:
+                        tensors += [
+                            self._get_greens_tensor_cached(station, origin)]
+
+        finally:
+            if executor:
+                executor.shutdown()
 
         return GreensTensorList(tensors)
 
@@ -56,3 +123,67 @@ class Client(object):
         raise NotImplementedError("Must be implemented by subclass")
 
 
+    def _get_cache_key(self, station=None, origin=None):
+        """ Returns hashable key such that Green's tensors with equal keys
+        differ only in station and origin metadata, or `None` if Green's 
+        tensors cannot be reused
+        """
+        return None
+
+
+    def _get_greens_tensor_cached(self, station, origin):
+        key = self._get_cache_key(station, origin)
+
+        if key is None or not self.cache_size:
+            return self._get_greens_tensor(station, origin)
+
+        # subclass constructors do not call the base class constructor, so
+        # the cache is created on first use (the lock allows concurrent
+        # retrieval, see get_greens_tensors)
+        with _lock:
+            if '_cache' not in self.__dict__:
+                self._cache = OrderedDict()
+
+            cached = self._cache.get(key, None)
+            if cached is not None:
+                self._cache.move_to_end(key)
+
+        if cached is not None:
+            return _reuse(cached, station, origin)
+
+        tensor = self._get_greens_tensor(station, origin)
+
+        # a copy is cached, since the returned tensor may later be processed
+        # in place
+        cached = _reuse(tensor, station, origin)
+
+        with _lock:
+            self._cache[key] = cached
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return tensor
+
+
+
+# guards Green's tensor caches against concurrent access
+_lock = Lock()
+
+
+def _reuse(tensor, station, origin):
+    """ Copies Green's tensor, attaching new station and origin metadata
+    """
+    # time series start at the same time relative to the origin
+    shift = float(origin.time) - float(tensor.origin.time)
+
+    traces = []
+    for trace in tensor:
+        trace = trace.copy()
+        trace.stats.starttime += shift
+        traces += [trace]
+
+    return type(tensor)(traces=traces, station=station, origin=origin,
+        tags=list(tensor.tags), include_mt=tensor.include_mt,
+        include_force=tensor.include_force)
+
+
@@ -7,7 +7,7 @@ from mtuq.greens_tensor.syngine import GreensTensor
 from mtuq.io.clients.base import Client as ClientBase
 from mtuq.util.signal import resample
 from mtuq.util.syngine import download_greens_tensor, download_force_response,\
-     resolve_model,\
+     get_rounded_distance, resolve_model,\
      GREENS_TENSOR_FILENAMES, SYNTHETICS_FILENAMES
 from mtuq.util import unzip
 
@@ -56,7 +56,8 @@ class Client(ClientBase):
         self.include_force = include_force
 
 
-    def get_greens_tensors(self, stations=[], origins=[], verbose=False):
+    def get_greens_tensors(self, stations=[], origins=[], verbose=False,
+        max_workers=1):
         """ Downloads Green's tensors
 
         Returns a ``GreensTensorList`` in which each element corresponds to a
@@ -70,8 +71,27 @@ class Client(ClientBase):
 
         ``verbose`` (`bool`)
 
+        ``max_workers`` (`int`)
+        Number of threads used to retrieve Green's tensors concurrently
+
         """
-        return super(Client, self).get_greens_tensors(stations, origins, verbose)
+        return super(Client, self).get_greens_tensors(
+            stations, origins, verbose, max_workers)
+
+
+    def _get_cache_key(self, station=None, origin=None):
+        # force responses are computed from source and receiver locations,
+        # rather than from epicentral distance only
+        if self.include_force:
+            return None
+
+        # same parameters as in the download URL, except that the time 
+        # window is taken relative to the origin time
+        return (self.model, str(get_rounded_distance(station, origin)),
+            int(round(origin.depth_in_m)),
+            float(station.starttime) - float(origin.time),
+            float(station.endtime) - float(origin.time),
+            float(station.delta))
 
 
     def _get_greens_tensor(self, station=None, origin=None):
@@ -1,10 +1,12 @@
 
 import numpy as np
 
-from mtuq.misfit import level0, level1, level2
-from mtuq.util import Null, iterable, warn
+from mtuq.misfit import level0, level1, level2, level3
+from mtuq.misfit.operator import MisfitOperator, open_operator, reweight
+from mtuq.util import Null, iterable, mask_top_k, warn
 from mtuq.util.math import isclose, list_intersect_with_indices
-from mtuq.util.signal import check_padding, get_components, isempty
+from mtuq.util.signal import check_padding, get_components, get_time_sampling,\
+    isempty
 
 
 
@@ -40,7 +42,8 @@ class Misfit(object):
     - ``'L2'``: conventional L2 norm (fast)
     ..  r1**2 + r1**2 + ...
 
-    - ``'L1'``: conventional L1 norm (slow)
+    - ``'L1'``: conventional L1 norm (slower than the other two, since 
+      synthetics must be generated for each source)
     ..  \|r1\| + \|r2\| + ...
 
     - ``'hybrid'``: hybrid L1-L2 norm (much faster than L1 but still robust)
@@ -61,6 +64,21 @@ class Misfit(object):
 
     ``time_shift_max`` (`float`): maximum allowable time shift (s)
 
+    ``precision`` (`str`)
+
+    - ``'float64'``: cross-correlation and source arrays are stored in double
+      precision
+
+    - ``'float32'``: cross-correlation and source arrays are stored in single
+      precision, which halves their memory footprint and memory bandwidth, 
+      while misfit values are still accumulated in double precision 
+      (ignored unless ``optimization_level=2``)
+
+    ``num_threads`` (`int`): number of threads used by the C extension to 
+    evaluate misfit over sources in parallel. If `None`, the OpenMP runtime 
+    default is used (typically set by the ``OMP_NUM_THREADS`` environment
+    variable). (Ignored unless ``optimization_level=2``)
+
 
     .. note:: 
 
@@ -69,10 +87,19 @@ class Misfit(object):
       data. 
 
 
+    .. rubric:: Trace attributes
+
+    If ``set_attributes=True`` is passed when evaluating misfit, optimal 
+    time shifts and misfit values for the last source are attached to data
+    and synthetic traces (as used by ``mtuq.graphics.plot_data_greens``).
+    For the L2 and hybrid norms, these are obtained from the C extension; 
+    otherwise the pure Python version ``level0`` is used.
+
+
     .. rubric:: Optimization Levels
 
     Misfit evaluation is the most complex and computationally expensive task
-    performed by this software. As a result we offer three different
+    performed by this software. As a result we offer four different
     implementations:
 
     - a readable pure Python version (``mtuq.misfit.level0``)
@@ -81,8 +108,10 @@ class Misfit(object):
 
     - a very fast Python/C++ version (``mtuq.misfit.level2``)
 
+    - a batched NumPy/BLAS version (``mtuq.misfit.level3``)
+
 
-    While the same in terms of input argument syntax, these three versions
+    While the same in terms of input argument syntax, these four versions
     differ in terms of performance:
 
     - ``level0`` provides a reference for understanding what the code is doing
@@ -95,9 +124,60 @@ class Misfit(object):
     - ``level2`` is an optimized Python/C++ implementation, in which a Python 
       wrapper is used to combine obspy traces into multidimensional arrays.
       These arrays are passed to a C++ extension module, which does the
-      main computational work. Unlike the other two versions, this 
-      implementation requires that all obspy Traces have the same time
-      discretization
+      main computational work. Traces of the same station must have the 
+      same time discretization, but stations can differ in sampling rate
+      and window length (except with the L1 norm). The C extension can divide sources among 
+      ``num_threads`` threads, which is often a simpler alternative to 
+      running ``grid_search`` under MPI on a single node
+
+      Because time shifts do not depend on source magnitude, grids that
+      contain each orientation at several magnitudes are evaluated once 
+      per orientation, after which misfit for all magnitudes follows at
+      negligible extra cost (L2 and hybrid norms)
+
+      The L1 norm is handled by a separate C extension, which generates
+      synthetics at the optimal time shift by linear combination of Green's
+      functions and sums absolute residuals
+
+    - ``level3`` uses the same multidimensional arrays as ``level2``, but 
+      rather than looping over sources one at a time, processes blocks of
+      sources through matrix-matrix products (L2 and hybrid norms only). For very large grids, this
+      moves the bottleneck from scalar loops to BLAS throughput (which may
+      be multithreaded, depending on the BLAS library NumPy is linked to).
+      As with ``level2``, grids with several magnitudes are evaluated once 
+      per orientation
+
+    With the L1 norm, ``optimization_level=3`` falls back to ``level2``,
+    and ``level2`` falls back to ``level0`` if stations differ in sampling.
+    If the C extensions are not available (for example, because they could 
+    not be compiled during installation), ``optimization_level=2`` 
+    automatically falls back to ``level3`` (or, for the L1 norm, ``level0``)
+
+
+    .. rubric:: Screening decimated data
+
+    Body wave windows are often sampled much more finely than their 
+    frequency content requires.  ``screen`` first evaluates misfit over all
+    sources using decimated data and Green's functions, and then reevaluates
+    only the sources close to the coarse minimum at full resolution:
+
+    .. code::
+
+        values, exact = function_handle.screen(data, greens, sources,
+            decimation=4, tolerance=0.1)
+
+    Decimation does not apply an anti-aliasing filter, so the decimated 
+    Nyquist frequency should lie well above the upper corner of the 
+    bandpass filter applied to data and Green's functions
+
+
+    .. rubric:: Reusing cross-correlations
+
+    ``level2`` and ``level3`` spend part of their time cross-correlating data
+    and Green's functions, which does not depend on sources.  If misfit will 
+    be evaluated repeatedly with the same data and Green's functions, 
+    ``precompute`` returns a `MisfitOperator` that caches these 
+    cross-correlations and can be evaluated over any number of source batches
       
 
     """
@@ -107,6 +187,8 @@ class Misfit(object):
         time_shift_groups=['ZRT'],
         time_shift_min=0.,
         time_shift_max=0.,
+        precision='float64',
+        num_threads=1,
         ):
         """ Function handle constructor
         """
@@ -126,6 +208,9 @@ class Misfit(object):
                 "norm='L1' but still robust against outliers."
                 )
 
+        assert precision in ['float32', 'float64'],\
+            ValueError("Bad input argument: precision")
+
         if type(time_shift_groups) not in (list, tuple):
             raise TypeError
 
@@ -138,11 +223,21 @@ class Misfit(object):
         self.time_shift_min = time_shift_min
         self.time_shift_max = time_shift_max
         self.time_shift_groups = time_shift_groups
+        self.precision = precision
+        self.num_threads = num_threads
 
 
     def __call__(self, data, greens, sources, progress_handle=Null(), 
-        set_attributes=False, optimization_level=2):
+        set_attributes=False, optimization_level=2, top_k=None,
+        threshold=np.inf):
         """ Evaluates misfit on given data
+
+        If `top_k` is given, only the `top_k` lowest misfit values that do 
+        not exceed `threshold` are returned, and all others are set to 
+        infinity (with ``optimization_level=2`` and the L2 or hybrid norm, 
+        sources that cannot be among the best are abandoned early, saving 
+        time).  Values tied with the `top_k`-th lowest are all kept, so 
+        slightly more than `top_k` values may remain finite
         """
         # Normally misfit is evaluated over a grid of sources; `iterable`
         # makes things work if just a single source is given
@@ -157,20 +252,119 @@ class Misfit(object):
         # shift bounds
         check_padding(greens, self.time_shift_min, self.time_shift_max)
 
-        if optimization_level==0 or set_attributes:
-            return level0.misfit(
+        # Falls back to NumPy implementations if C extensions are missing
+        optimization_level = _get_optimization_level(
+            self.norm, optimization_level, data)
+
+        if set_attributes and optimization_level!=0 and\
+           self.norm in ['L2', 'hybrid'] and level2.c_ext_L2 is not None:
+            # time shifts and per-trace misfit values are reported by the 
+            # C extension
+            values = level2.misfit(
+                data, greens, sources, self.norm, self.time_shift_groups,
+                self.time_shift_min, self.time_shift_max, progress_handle,
+                num_threads=self.num_threads, precision=self.precision,
+                set_attributes=True)
+
+        elif optimization_level==0 or set_attributes:
+            values = level0.misfit(
                 data, greens, sources, self.norm, self.time_shift_groups, 
                 self.time_shift_min, self.time_shift_max, progress_handle,
                 set_attributes)
 
-        if optimization_level==1:
-            return level1.misfit(
+        elif optimization_level==1:
+            values = level1.misfit(
                 data, greens, sources, self.norm, self.time_shift_groups, 
                 self.time_shift_min, self.time_shift_max, progress_handle)
 
-        if optimization_level==2:
-            return level2.misfit(
+        elif optimization_level==2:
+            values = level2.misfit(
+                data, greens, sources, self.norm, self.time_shift_groups,
+                self.time_shift_min, self.time_shift_max, progress_handle,
+                num_threads=self.num_threads, precision=self.precision,
+                top_k=top_k, threshold=threshold)
+
+        elif optimization_level==3:
+            values = level3.misfit(
                 data, greens, sources, self.norm, self.time_shift_groups,
                 self.time_shift_min, self.time_shift_max, progress_handle)
 
+        else:
+            raise ValueError("Bad input argument: optimization_level")
+
+        if top_k:
+            values[values > threshold] = np.inf
+            mask_top_k(values, top_k)
+
+        return values
+
+
+    def precompute(self, data, greens, optimization_level=2):
+        """ Returns `MisfitOperator` with cached cross-correlations
+        """
+        return MisfitOperator(data, greens, self, optimization_level)
+
+
+    def screen(self, data, greens, sources, decimation=4, tolerance=0.1,
+        progress_handle=Null()):
+        """ Evaluates misfit in two stages: first over all sources using
+        data and Green's functions decimated by the factor `decimation`,
+        then at full resolution for sources whose coarse misfit lies within
+        a relative `tolerance` of the coarse minimum
+
+        Returns a tuple `(values, exact)`, where `exact` is a boolean array 
+        that is `True` for sources reevaluated at full resolution (see 
+        ``mtuq.misfit.level2.screen``)
+        """
+        if self.norm not in ['L2', 'hybrid']:
+            raise NotImplementedError
+
+        sources = iterable(sources)
+
+        # Checks that dataset is nonempty
+        if isempty(data):
+            warn("Empty data set. No misfit evaluations will be carried out")
+            return np.zeros((len(sources), 1)), np.ones(len(sources), bool)
+
+        # Checks that optional Green's function padding is consistent with time 
+        # shift bounds
+        check_padding(greens, self.time_shift_min, self.time_shift_max)
+
+        return level2.screen(
+            data, greens, sources, self.norm, self.time_shift_groups,
+            self.time_shift_min, self.time_shift_max, progress_handle,
+            decimation=decimation, tolerance=tolerance,
+            num_threads=self.num_threads, precision=self.precision)
+
+
+
+def _get_optimization_level(norm, optimization_level, data=None):
+    """ Replaces ``optimization_level=2`` with the fastest available 
+    alternative if the C extensions could not be built or do not support the
+    given data, and ``optimization_level=3`` with ``optimization_level=2`` 
+    for norms that ``level3`` does not implement
+    """
+    if optimization_level==3 and norm not in ['L2', 'hybrid']:
+        warn("optimization_level=3 supports only the L2 and hybrid norms. "
+             "Using optimization_level=2 instead.")
+        optimization_level = 2
+
+    if optimization_level==2 and norm=='L1' and data is not None and\
+       len(set(get_time_sampling(stream) for stream in data
+               if len(stream) > 0)) > 1:
+        warn("L1 norm with optimization_level=2 requires all stations to "
+             "have the same time sampling. Using optimization_level=0 "
+             "instead.")
+        return 0
+
+    if optimization_level!=2 or level2.c_ext_L2 is not None:
+        return optimization_level
+
+    if norm in ['L2', 'hybrid']:
+        warn("C extensions not found. Using optimization_level=3 instead.")
+        return 3
+
+    else:
+        warn("C extensions not found. Using optimization_level=0 instead.")
+        return 0
 
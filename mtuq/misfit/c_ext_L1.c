@@ -0,0 +1,392 @@
+#include <Python.h>
+#include <numpy/arrayobject.h>
+#include <numpy/npy_math.h>
+#include <math.h>
+#include <stdlib.h>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+
+//
+// array access macros
+//
+#define greens_data(i0,i1,i2,i3)\
+    (*(npy_float64*)((PyArray_DATA(greens_data)+\
+    (i0) * PyArray_STRIDES(greens_data)[0]+\
+    (i1) * PyArray_STRIDES(greens_data)[1]+\
+    (i2) * PyArray_STRIDES(greens_data)[2]+\
+    (i3) * PyArray_STRIDES(greens_data)[3])))
+
+#define sources(i0,i1)\
+    (*(npy_float64*)((PyArray_DATA(sources)+\
+    (i0) * PyArray_STRIDES(sources)[0]+\
+    (i1) * PyArray_STRIDES(sources)[1])))
+
+#define groups(i0,i1)\
+    (*(npy_float64*)((PyArray_DATA(groups)+\
+    (i0) * PyArray_STRIDES(groups)[0]+\
+    (i1) * PyArray_STRIDES(groups)[1])))
+
+#define weights(i0,i1)\
+    (*(npy_float64*)((PyArray_DATA(weights)+\
+    (i0) * PyArray_STRIDES(weights)[0]+\
+    (i1) * PyArray_STRIDES(weights)[1])))
+
+#define results(i0)\
+    (*(npy_float64*)((PyArray_DATA(results)+\
+    (i0) * PyArray_STRIDES(results)[0])))
+
+// the innermost loops run over time samples, so data and Green's function
+// traces are accessed through pointers to their first sample (which requires
+// C-contiguous arrays)
+#define data_trace(i0,i1)\
+    ((npy_float64*) PyArray_GETPTR3(data, (i0), (i1), 0))
+
+#define greens_trace(i0,i1,i2,i3)\
+    ((npy_float64*) PyArray_GETPTR4(greens, (i0), (i1), (i2), (i3)))
+
+
+
+//
+//
+// L1 misfit function
+//
+//
+
+static PyObject *misfit(PyObject *self, PyObject *args) {
+
+  // trace input arrays
+  PyArrayObject *data, *greens;
+
+  // cross-correlation input array
+  PyArrayObject *greens_data;
+
+  // other input arrays
+  PyArrayObject *sources, *groups, *weights;
+
+  // output array
+  PyArrayObject *results;
+
+  // scalar input arguments
+  npy_float64 dt;
+  int NPAD1, NPAD2;
+  int debug_level;
+  int msg_start, msg_stop, msg_percent;
+  int num_threads;
+
+  int NSRC, NSTA, NC, NG, NGRP, NPAD, NT;
+  int nd, nthreads, failed;
+
+  float msg_interval;
+  int msg_count;
+
+
+  // parse arguments
+  if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!diiiiiii",
+                        &PyArray_Type, &data,
+                        &PyArray_Type, &greens,
+                        &PyArray_Type, &greens_data,
+                        &PyArray_Type, &sources,
+                        &PyArray_Type, &groups,
+                        &PyArray_Type, &weights,
+                        &dt,
+                        &NPAD1,
+                        &NPAD2,
+                        &debug_level,
+                        &msg_start,
+                        &msg_stop,
+                        &msg_percent,
+                        &num_threads)) {
+    return NULL;
+  }
+
+
+  // all arrays must be float64, and trace arrays must be C-contiguous
+  if (PyArray_TYPE(data) != NPY_FLOAT64 ||
+      PyArray_TYPE(greens) != NPY_FLOAT64 ||
+      PyArray_TYPE(greens_data) != NPY_FLOAT64 ||
+      PyArray_TYPE(sources) != NPY_FLOAT64 ||
+      PyArray_TYPE(groups) != NPY_FLOAT64 ||
+      PyArray_TYPE(weights) != NPY_FLOAT64) {
+    PyErr_SetString(PyExc_TypeError, "all arrays must be float64");
+    return NULL;
+  }
+
+  if (!PyArray_IS_C_CONTIGUOUS(data) || !PyArray_IS_C_CONTIGUOUS(greens)) {
+    PyErr_SetString(PyExc_TypeError,
+        "data and greens must be C-contiguous");
+    return NULL;
+  }
+
+
+  NSRC = (int) PyArray_SHAPE(sources)[0];
+  NSTA = (int) PyArray_SHAPE(weights)[0];
+  NC = (int) PyArray_SHAPE(weights)[1];
+  NG = (int) PyArray_SHAPE(sources)[1];
+  NGRP = (int) PyArray_SHAPE(groups)[0];
+  NT = (int) PyArray_SHAPE(data)[2];
+
+  NPAD = (int) NPAD1+NPAD2+1;
+
+  // Green's functions must be padded on both sides by the maximum time shifts
+  if ((int) PyArray_SHAPE(greens)[3] != NT+NPAD-1) {
+    PyErr_SetString(PyExc_ValueError,
+        "Green's functions are inconsistent with data and time shifts");
+    return NULL;
+  }
+
+  // a nonpositive value means "use the OpenMP runtime default"
+  nthreads = 1;
+#ifdef _OPENMP
+  if (num_threads > 0) {
+    nthreads = num_threads;
+  }
+  else {
+    nthreads = omp_get_max_threads();
+  }
+#endif
+
+  if (debug_level>1) {
+    printf(" number of sources:  %d\n", NSRC);
+    printf(" number of stations:  %d\n", NSTA);
+    printf(" number of components:  %d\n", NC);
+    printf(" number of Green's functions:  %d\n\n", NG);
+    printf(" number of component groups:  %d\n", NGRP);
+    printf(" number of time samples:  %d\n", NT);
+    printf(" number of threads:  %d\n", nthreads);
+  }
+
+
+  // allocate arrays
+  nd = 2;
+  npy_intp dims_results[] = {(int)NSRC, 1};
+  results = (PyArrayObject *) PyArray_SimpleNew(nd, dims_results, NPY_DOUBLE);
+  if (results == NULL) {
+    return NULL;
+  }
+
+
+  // initialize progress messages (see c_ext_L2_kernel.h)
+  msg_interval = 0.;
+  msg_count = 0;
+  if (msg_percent > 0) {
+    msg_interval = msg_percent/100.*msg_stop;
+    msg_count = (int) ((100LL*msg_start + (long long) msg_percent*msg_stop - 1)
+      / ((long long) msg_percent*msg_stop));
+  }
+
+  failed = 0;
+
+
+  // the main work starts now; no Python objects are created or destroyed
+  // here, so other Python threads are allowed to run meanwhile
+  Py_BEGIN_ALLOW_THREADS
+
+#ifdef _OPENMP
+  #pragma omp parallel num_threads(nthreads) reduction(|:failed)
+#endif
+  {
+  int isrc, ista, ic, ig, igrp;
+  int cc_argmax, it, itpad;
+  int ithread, nthreads_actual;
+  npy_float64 cc_max, L1_sum, L1_tmp, weight, source;
+  npy_float64 *d, *g;
+  float iter, next_iter;
+  int msg_count_local;
+
+  // each thread gets its own scratch buffers for cross-correlations and
+  // synthetics
+  npy_float64 *cc = (npy_float64 *) malloc(NPAD*sizeof(npy_float64));
+  npy_float64 *s = (npy_float64 *) malloc(NT*sizeof(npy_float64));
+
+  ithread = 0;
+  nthreads_actual = 1;
+#ifdef _OPENMP
+  ithread = omp_get_thread_num();
+  nthreads_actual = omp_get_num_threads();
+#endif
+
+  msg_count_local = msg_count;
+  iter = (float) msg_start;
+  if (ithread == 0 && msg_percent > 0) {
+    next_iter = (float) msg_count_local*msg_interval;
+  }
+  else {
+    next_iter = INFINITY;
+  }
+
+  if (cc == NULL || s == NULL) {
+    failed = 1;
+  }
+
+  //
+  // Iterate over sources
+  //
+
+#ifdef _OPENMP
+  #pragma omp for schedule(static)
+#endif
+  for(isrc=0; isrc<NSRC; ++isrc) {
+
+    if (cc == NULL || s == NULL) {
+      continue;
+    }
+
+    // display progress message
+    if (iter >= next_iter) {
+        printf("  about %d percent finished\n", msg_percent*msg_count_local);
+        msg_count_local += 1;
+        next_iter = msg_count_local*msg_interval;
+    }
+    iter += nthreads_actual;
+
+
+    L1_sum = 0.;
+
+    for (ista=0; ista<NSTA; ista++) {
+      for (igrp=0; igrp<NGRP; igrp++) {
+
+        /*
+
+        Finds the shift between data and synthetics that yields the maximum
+        cross-correlation value across all components in the given component
+        group, subject to the (time_shift_min, time_shift_max) constraint
+
+        */
+
+        for (it=0; it<NPAD; it++) {
+          cc[it] = 0.;
+        }
+
+        for (ic=0; ic<NC; ic++) {
+
+          // Skip components not in the component group being considered
+          if (((int) groups(igrp,ic))==0) {
+            continue;
+          }
+
+          // Skip traces that have been assigned zero weight
+          if (((int) weights(ista,ic))==0) {
+            continue;
+          }
+
+          // Sum cross-correlations of all components being considered
+          for (ig=0; ig<NG; ig++) {
+            for (it=0; it<NPAD; it++) {
+                cc[it] += greens_data(ista,ic,ig,it) * sources(isrc,ig);
+            }
+          }
+        }
+        cc_max = -NPY_INFINITY;
+        cc_argmax = 0;
+        for (it=0; it<NPAD; it++) {
+          if (cc[it] > cc_max) {
+            cc_max = cc[it];
+            cc_argmax= it;
+          }
+        }
+        itpad = cc_argmax;
+
+
+        /*
+
+        Calculates L1 norm of difference between data and synthetics
+        for all components in the given component group
+
+        Unlike the L2 norm, there is no shortcut based on precomputed
+        correlations, so synthetics are generated at the optimal time shift
+        by linear combination of Green's functions
+
+        */
+        for (ic=0; ic<NC; ic++) {
+
+          // Skip components not in the component group being considered
+          if (((int) groups(igrp,ic))==0) {
+            continue;
+          }
+
+          // Skip traces that have been assigned zero weight
+          weight = weights(ista,ic);
+          if (((int) weight)==0) {
+              continue;
+          }
+
+          // generate shifted synthetics
+          for (it=0; it<NT; it++) {
+            s[it] = 0.;
+          }
+          for (ig=0; ig<NG; ig++) {
+            g = greens_trace(ista,ic,ig,itpad);
+            source = sources(isrc,ig);
+            for (it=0; it<NT; it++) {
+              s[it] += g[it] * source;
+            }
+          }
+
+          // sum absolute residuals
+          d = data_trace(ista,ic);
+          L1_tmp = 0.;
+          for (it=0; it<NT; it++) {
+            L1_tmp += fabs(s[it] - d[it]);
+          }
+
+          L1_sum += dt * weight * L1_tmp;
+        }
+
+      }
+    }
+    results(isrc) = L1_sum;
+
+  }
+
+  free(cc);
+  free(s);
+  }
+
+  Py_END_ALLOW_THREADS
+
+  if (failed) {
+    Py_DECREF(results);
+    return PyErr_NoMemory();
+  }
+
+  return (PyObject *) results;
+
+}
+
+
+//
+// Boilerplate
+//
+
+static PyMethodDef methods[] = {
+    { "misfit", misfit, METH_VARARGS, "L1 misfit function (fast C implementation)."},
+    { NULL, NULL, 0, NULL }
+  };
+
+
+#if PY_MAJOR_VERSION >= 3
+static struct PyModuleDef misfit_module = {
+  PyModuleDef_HEAD_INIT,
+  "c_ext_L1",
+  "L1 misfit function (fast C implementation)",
+  -1,                  /* m_size */
+  methods,             /* m_methods */
+  };
+#endif
+
+
+#if PY_MAJOR_VERSION >= 3
+PyMODINIT_FUNC PyInit_c_ext_L1(void) {
+  Py_Initialize();
+  import_array();
+  return PyModule_Create(&misfit_module);
+  }
+#else
+PyMODINIT_FUNC initc_ext_L1(void) {
+  (void) Py_InitModule("c_ext_L1", methods);
+  import_array();
+  }
+#endif
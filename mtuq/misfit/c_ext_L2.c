@@ -3,35 +3,42 @@
 #include <numpy/arrayobject.h>
 #include <numpy/npy_math.h>
 #include <math.h>
+#include <stdlib.h>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 
 //
 // array access macros
 //
+// Cross-correlation and source arrays can be stored in either single or 
+// double precision, so are accessed through the type REAL, which is defined
+// separately for each version of the misfit kernel (see below)
+//
+// Cross-correlation and source arrays must be C-contiguous.  Rather than 
+// going through strides, they are accessed through pointers to their 
+// innermost axes, which are then traversed by unit-stride loops that the
+// compiler can vectorize.  The dimensions NC, NG, NP and NPAD must be 
+// defined wherever these macros are used
+//
 #define data_data(i0,i1)\
-    (*(npy_float64*)((PyArray_DATA(data_data)+\
-    (i0) * PyArray_STRIDES(data_data)[0]+\
-    (i1) * PyArray_STRIDES(data_data)[1])))
-
-#define greens_data(i0,i1,i2,i3)\
-    (*(npy_float64*)((PyArray_DATA(greens_data)+\
-    (i0) * PyArray_STRIDES(greens_data)[0]+\
-    (i1) * PyArray_STRIDES(greens_data)[1]+\
-    (i2) * PyArray_STRIDES(greens_data)[2]+\
-    (i3) * PyArray_STRIDES(greens_data)[3])))
-
-#define greens_greens(i0,i1,i2,i3,i4)\
-    (*(npy_float64*)((PyArray_DATA(greens_greens)+\
-    (i0) * PyArray_STRIDES(greens_greens)[0]+\
-    (i1) * PyArray_STRIDES(greens_greens)[1]+\
-    (i2) * PyArray_STRIDES(greens_greens)[2]+\
-    (i3) * PyArray_STRIDES(greens_greens)[3]+\
-    (i4) * PyArray_STRIDES(greens_greens)[4])))
-
-#define sources(i0,i1)\
-    (*(npy_float64*)((PyArray_DATA(sources)+\
-    (i0) * PyArray_STRIDES(sources)[0]+\
-    (i1) * PyArray_STRIDES(sources)[1])))
+    (((npy_float64*) PyArray_DATA(data_data))[(i0)*NC + (i1)])
+
+// pointer to lags of shape (NPAD,)
+#define greens_data(i0,i1,i2)\
+    ((REAL*) PyArray_DATA(greens_data) + ((i0)*NC + (i1))*NG*NPAD + (i2)*NPAD)
+
+// pointer to the upper triangle of a symmetric matrix of shape (NG, NG),
+// packed row by row into NP = NG*(NG+1)/2 entries (or, for the unpacked 
+// layout, the full matrix in NP = NG*NG entries)
+#define greens_greens(i0,i1,i2)\
+    ((REAL*) PyArray_DATA(greens_greens) + (((i0)*NC + (i1))*NPAD + (i2))*NP)
+
+// pointer to source of shape (NG,)
+#define sources(i0)\
+    ((REAL*) PyArray_DATA(sources) + (i0)*NG)
 
 #define groups(i0,i1)\
     (*(npy_float64*)((PyArray_DATA(groups)+\
@@ -43,13 +50,110 @@
     (i0) * PyArray_STRIDES(weights)[0]+\
     (i1) * PyArray_STRIDES(weights)[1])))
 
-#define results(i0)\
+#define dt(i0)\
+    (*(npy_float64*)((PyArray_DATA(dt)+\
+    (i0) * PyArray_STRIDES(dt)[0])))
+
+#define npad(i0)\
+    (*(npy_int32*)((PyArray_DATA(npad)+\
+    (i0) * PyArray_STRIDES(npad)[0])))
+
+#define rho(i0)\
+    (*(npy_float64*)((PyArray_DATA(rho)+\
+    (i0) * PyArray_STRIDES(rho)[0])))
+
+#define results(i0,i1)\
     (*(npy_float64*)((PyArray_DATA(results)+\
-    (i0) * PyArray_STRIDES(results)[0])))
+    (i0) * PyArray_STRIDES(results)[0]+\
+    (i1) * PyArray_STRIDES(results)[1])))
+
+#define order(i0)\
+    (*(npy_int32*)((PyArray_DATA(order)+\
+    (i0) * PyArray_STRIDES(order)[0])))
+
+#define shifts(i0,i1,i2)\
+    (*(npy_int32*)((PyArray_DATA(shifts)+\
+    (i0) * PyArray_STRIDES(shifts)[0]+\
+    (i1) * PyArray_STRIDES(shifts)[1]+\
+    (i2) * PyArray_STRIDES(shifts)[2])))
+
+#define contributions(i0,i1,i2,i3)\
+    (*(npy_float32*)((PyArray_DATA(results)+\
+    (i0) * PyArray_STRIDES(results)[0]+\
+    (i1) * PyArray_STRIDES(results)[1]+\
+    (i2) * PyArray_STRIDES(results)[2]+\
+    (i3) * PyArray_STRIDES(results)[3])))
 
-#define cc(i0)\
-    (*(npy_float64*)((PyArray_DATA(cc)+\
-    (i0) * PyArray_STRIDES(cc)[0])))
+
+
+//
+// norm types
+//
+#define NORM_L2 0
+#define NORM_HYBRID 1
+#define NORM_COEFFICIENTS 2
+
+
+
+//
+// keeps the k lowest values pushed so far in a max-heap, so that once the 
+// heap is full, heap[0] is the k-th lowest value
+//
+static void heap_push(npy_float64 *heap, int *n, int k, npy_float64 value) {
+  int i, j;
+  npy_float64 tmp;
+
+  if (*n < k) {
+    // sift up
+    i = (*n)++;
+    heap[i] = value;
+    while (i > 0) {
+      j = (i-1)/2;
+      if (heap[j] >= heap[i]) {
+        break;
+      }
+      tmp = heap[i]; heap[i] = heap[j]; heap[j] = tmp;
+      i = j;
+    }
+  }
+  else if (value < heap[0]) {
+    // sift down
+    heap[0] = value;
+    i = 0;
+    while (1) {
+      j = 2*i+1;
+      if (j >= k) {
+        break;
+      }
+      if (j+1 < k && heap[j+1] > heap[j]) {
+        j++;
+      }
+      if (heap[i] >= heap[j]) {
+        break;
+      }
+      tmp = heap[i]; heap[i] = heap[j]; heap[j] = tmp;
+      i = j;
+    }
+  }
+}
+
+
+
+//
+// misfit kernels, one for each supported floating-point type
+//
+
+#define REAL npy_float64
+#define KERNEL misfit_float64
+#include "c_ext_L2_kernel.h"
+#undef REAL
+#undef KERNEL
+
+#define REAL npy_float32
+#define KERNEL misfit_float32
+#include "c_ext_L2_kernel.h"
+#undef REAL
+#undef KERNEL
 
 
 
@@ -65,41 +169,88 @@ static PyObject *misfit(PyObject *self, PyObject *args) {
   PyArrayObject *data_data, *greens_data, *greens_greens;
 
   // other input arrays
-  PyArrayObject *sources, *groups, *weights;
+  PyArrayObject *sources, *groups, *weights, *rho, *order;
+
+  // sampling intervals and numbers of time shifts of individual stations
+  PyArrayObject *dt, *npad;
+
+  // output arrays
+  PyArrayObject *results, *shifts;
 
   // scalar input arguments
-  int hybrid_norm;
-  npy_float64 dt;
-  int NPAD1, NPAD2;
+  int norm_type, per_trace, time_shifts;
   int debug_level;
   int msg_start, msg_stop, msg_percent;
+  int num_threads;
+  int top_k;
+  npy_float64 threshold;
 
-  int NSRC, NSTA, NC, NG, NGRP;
-  int isrc, ista, ic, ig, igrp;
-
-  int cc_argmax, it, itpad, j1, j2, nd, NPAD;
-  npy_float64 cc_max, L2_sum, L2_tmp;
-
-  float iter, next_iter;
-  int msg_count, msg_interval;
+  int NSRC, NSTA, NC, NG, NGRP, NPAD, NRHO, NOUT;
+  int nd, nthreads, failed, typenum, ista;
 
 
   // parse arguments
-  if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!idiiiiii",
+  if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!O!O!O!iiiiiiiiidO!",
                         &PyArray_Type, &data_data,
                         &PyArray_Type, &greens_data,
                         &PyArray_Type, &greens_greens,
                         &PyArray_Type, &sources,
                         &PyArray_Type, &groups,
                         &PyArray_Type, &weights,
-                        &hybrid_norm,
-                        &dt,
-                        &NPAD1,
-                        &NPAD2,
+                        &PyArray_Type, &rho,
+                        &PyArray_Type, &dt,
+                        &PyArray_Type, &npad,
+                        &norm_type,
+                        &per_trace,
+                        &time_shifts,
                         &debug_level,
                         &msg_start,
                         &msg_stop,
-                        &msg_percent)) {
+                        &msg_percent,
+                        &num_threads,
+                        &top_k,
+                        &threshold,
+                        &PyArray_Type, &order)) {
+    return NULL;
+  }
+
+
+  // cross-correlation and source arrays must all have the same type, either
+  // float32 or float64; all other arrays must be float64
+  typenum = PyArray_TYPE(sources);
+
+  if (!PyArray_IS_C_CONTIGUOUS(data_data) || 
+      !PyArray_IS_C_CONTIGUOUS(greens_data) ||
+      !PyArray_IS_C_CONTIGUOUS(greens_greens) ||
+      !PyArray_IS_C_CONTIGUOUS(sources)) {
+    PyErr_SetString(PyExc_TypeError, 
+        "data_data, greens_data, greens_greens and sources must be "
+        "C-contiguous");
+    return NULL;
+  }
+
+  if ((typenum != NPY_FLOAT64 && typenum != NPY_FLOAT32) ||
+      PyArray_TYPE(greens_data) != typenum ||
+      PyArray_TYPE(greens_greens) != typenum) {
+    PyErr_SetString(PyExc_TypeError, 
+        "greens_data, greens_greens and sources must all be float32 or all "
+        "be float64");
+    return NULL;
+  }
+
+  if (PyArray_TYPE(data_data) != NPY_FLOAT64 ||
+      PyArray_TYPE(groups) != NPY_FLOAT64 ||
+      PyArray_TYPE(weights) != NPY_FLOAT64 ||
+      PyArray_TYPE(rho) != NPY_FLOAT64 ||
+      PyArray_TYPE(dt) != NPY_FLOAT64) {
+    PyErr_SetString(PyExc_TypeError, 
+        "data_data, groups, weights, rho and dt must be float64");
+    return NULL;
+  }
+
+  if (PyArray_NDIM(rho) != 1 || PyArray_SHAPE(rho)[0] < 1) {
+    PyErr_SetString(PyExc_ValueError, 
+        "rho must be a nonempty one-dimensional array");
     return NULL;
   }
 
@@ -110,7 +261,93 @@ static PyObject *misfit(PyObject *self, PyObject *args) {
   NG = (int) PyArray_SHAPE(sources)[1];
   NGRP = (int) PyArray_SHAPE(groups)[0];
 
-  NPAD = (int) NPAD1+NPAD2+1;
+  NRHO = (int) PyArray_SHAPE(rho)[0];
+
+  // stations with different time sampling can have different numbers of
+  // time shifts, of which the largest determines the array shapes
+  NPAD = (int) PyArray_SHAPE(greens_data)[3];
+
+  if (PyArray_NDIM(dt) != 1 || (int) PyArray_SHAPE(dt)[0] != NSTA ||
+      PyArray_TYPE(npad) != NPY_INT32 || PyArray_NDIM(npad) != 1 ||
+      (int) PyArray_SHAPE(npad)[0] != NSTA) {
+    PyErr_SetString(PyExc_ValueError, 
+        "dt and npad must have one entry per station");
+    return NULL;
+  }
+
+  for (ista=0; ista<NSTA; ista++) {
+    if (npad(ista) < 1 || npad(ista) > NPAD) {
+      PyErr_SetString(PyExc_ValueError, 
+          "npad is inconsistent with cross-correlation arrays");
+      return NULL;
+    }
+  }
+
+  // pointer arithmetic in the kernels relies on consistent shapes; 
+  // greens_greens is either packed, of shape (NSTA, NC, NPAD, NG*(NG+1)/2),
+  // or unpacked, of shape (NSTA, NC, NPAD, NG, NG)
+  if (PyArray_NDIM(data_data) != 2 ||
+      (int) PyArray_SHAPE(data_data)[0] != NSTA ||
+      (int) PyArray_SHAPE(data_data)[1] != NC ||
+      PyArray_NDIM(greens_data) != 4 ||
+      (int) PyArray_SHAPE(greens_data)[0] != NSTA ||
+      (int) PyArray_SHAPE(greens_data)[1] != NC ||
+      (int) PyArray_SHAPE(greens_data)[2] != NG ||
+      (int) PyArray_SHAPE(greens_data)[3] != NPAD ||
+      (int) PyArray_SHAPE(greens_greens)[0] != NSTA ||
+      (int) PyArray_SHAPE(greens_greens)[1] != NC ||
+      (int) PyArray_SHAPE(greens_greens)[2] != NPAD ||
+      !((PyArray_NDIM(greens_greens) == 4 &&
+        (int) PyArray_SHAPE(greens_greens)[3] == NG*(NG+1)/2) ||
+       (PyArray_NDIM(greens_greens) == 5 &&
+        (int) PyArray_SHAPE(greens_greens)[3] == NG &&
+        (int) PyArray_SHAPE(greens_greens)[4] == NG))) {
+    PyErr_SetString(PyExc_ValueError, 
+        "cross-correlation arrays are inconsistent with sources and weights");
+    return NULL;
+  }
+
+  // one output column per magnitude, or three columns of misfit terms
+  if (norm_type == NORM_COEFFICIENTS) {
+    NOUT = 3;
+  }
+  else {
+    NOUT = NRHO;
+  }
+
+  if (PyArray_TYPE(order) != NPY_INT32 || PyArray_NDIM(order) != 1 ||
+      (int) PyArray_SHAPE(order)[0] != NSTA) {
+    PyErr_SetString(PyExc_ValueError, 
+        "order must be an int32 array with one entry per station");
+    return NULL;
+  }
+
+  if (top_k > 0 && (per_trace || norm_type == NORM_COEFFICIENTS)) {
+    PyErr_SetString(PyExc_ValueError, 
+        "top_k is available only for misfit values");
+    return NULL;
+  }
+
+  if (top_k < 0) {
+    top_k = 0;
+  }
+
+  if (per_trace && norm_type == NORM_COEFFICIENTS) {
+    PyErr_SetString(PyExc_ValueError, 
+        "per-trace output is not available for misfit coefficients");
+    return NULL;
+  }
+
+  // a nonpositive value means "use the OpenMP runtime default"
+  nthreads = 1;
+#ifdef _OPENMP
+  if (num_threads > 0) {
+    nthreads = num_threads;
+  }
+  else {
+    nthreads = omp_get_max_threads();
+  }
+#endif
 
   if (debug_level>1) {
     printf(" number of sources:  %d\n", NSRC);
@@ -118,156 +355,73 @@ static PyObject *misfit(PyObject *self, PyObject *args) {
     printf(" number of components:  %d\n", NC);
     printf(" number of Green's functions:  %d\n\n", NG);
     printf(" number of component groups:  %d\n", NGRP);
+    printf(" number of magnitudes:  %d\n", NRHO);
+    printf(" number of threads:  %d\n", nthreads);
+    printf(" single precision:  %d\n", typenum == NPY_FLOAT32);
+    printf(" packed storage:  %d\n", PyArray_NDIM(greens_greens) == 4);
   }
 
 
-  // allocate arrays
-  nd = 1;
-  npy_intp dims_cc[] = {(int)NPAD};
-  PyObject *cc = PyArray_SimpleNew(nd, dims_cc, NPY_DOUBLE);
+  // allocate arrays (per-trace contributions are stored in single
+  // precision to keep the output compact)
+  if (per_trace) {
+    nd = 4;
+    npy_intp dims_results[] = {(int)NSRC, (int)NOUT, (int)NSTA, (int)NC};
+    results = (PyArrayObject *) PyArray_ZEROS(nd, dims_results, NPY_FLOAT32, 0);
+  }
+  else {
+    nd = 2;
+    npy_intp dims_results[] = {(int)NSRC, (int)NOUT};
+    results = (PyArrayObject *) PyArray_SimpleNew(nd, dims_results, NPY_DOUBLE);
+  }
+  if (results == NULL) {
+    return NULL;
+  }
 
-  nd = 2;
-  npy_intp dims_results[] = {(int)NSRC, 1};
-  PyObject *results = PyArray_SimpleNew(nd, dims_results, NPY_DOUBLE);
+  // optional time shift indices
+  shifts = NULL;
+  if (time_shifts) {
+    npy_intp dims_shifts[] = {(int)NSRC, (int)NSTA, (int)NGRP};
+    shifts = (PyArrayObject *) PyArray_ZEROS(3, dims_shifts, NPY_INT32, 0);
+    if (shifts == NULL) {
+      Py_DECREF(results);
+      return NULL;
+    }
+  }
 
 
-  // initialize progress messages
-  if (msg_percent > 0) {
-    msg_interval = msg_percent/100.*msg_stop;
-    msg_count = 100./msg_percent*msg_start/msg_stop;
-    iter = (float) msg_start;
-    next_iter = (float) msg_count*msg_interval;
+  // the main work starts now; no Python objects are created or destroyed
+  // by the kernels, so other Python threads are allowed to run meanwhile
+  Py_BEGIN_ALLOW_THREADS
 
+  if (typenum == NPY_FLOAT32) {
+    failed = misfit_float32(
+        data_data, greens_data, greens_greens, sources, groups, weights,
+        rho, dt, npad, results, shifts, norm_type, per_trace, NPAD, 
+        debug_level, msg_start, msg_stop, msg_percent, nthreads, top_k, 
+        threshold, order);
   }
   else {
-    iter = 0;
-    next_iter = INFINITY;
+    failed = misfit_float64(
+        data_data, greens_data, greens_greens, sources, groups, weights,
+        rho, dt, npad, results, shifts, norm_type, per_trace, NPAD, 
+        debug_level, msg_start, msg_stop, msg_percent, nthreads, top_k, 
+        threshold, order);
   }
 
-  //
-  // Iterate over sources
-  //
-
-  for(isrc=0; isrc<NSRC; ++isrc) {
-
+  Py_END_ALLOW_THREADS
 
-    // display progress message
-    if (iter >= next_iter) {
-        printf("  about %d percent finished\n", msg_percent*msg_count);
-        msg_count += 1;
-        next_iter = msg_count*msg_interval;
-    }
-    iter += 1;
-
-
-    L2_sum = (npy_float64) 0.;
-
-    for (ista=0; ista<NSTA; ista++) {
-      for (igrp=0; igrp<NGRP; igrp++) {
-
-        /*
-
-        Finds the shift between data and synthetics that yields the maximum
-        cross-correlation value across all components in the given component 
-        group, subject to the (time_shift_min, time_shift_max) constraint
-
-        */
-
-        for (it=0; it<NPAD; it++) {
-          cc(it) = (npy_float64) 0.;
-        }
-
-        for (ic=0; ic<NC; ic++) {
-
-          // Skip components not in the component group being considered
-          if (((int) groups(igrp,ic))==0) {
-            continue;
-           }
-
-          // Skip traces that have been assigned zero weight
-          if (((int) weights(ista,ic))==0) {
-              if (debug_level>1) {
-                if (isrc==0) {
-                  printf(" skipping trace: %d %d\n", ista, ic);
-                }
-              }
-              continue;
-           }
-
-          // Sum cross-correlations of all components being considered
-          for (ig=0; ig<NG; ig++) {
-            for (it=0; it<NPAD; it++) {
-                cc(it) += greens_data(ista,ic,ig,it) * sources(isrc,ig);
-            }
-          }
-        }
-        cc_max = -NPY_INFINITY;
-        cc_argmax = 0;
-        for (it=0; it<NPAD; it++) {
-          if (cc(it) > cc_max) {
-            cc_max = cc(it);
-            cc_argmax= it;
-          }
-        }
-        itpad = cc_argmax;
-
-
-        /*
-
-        Calculates L2 norm of difference between data and synthetics
-        for all components in the given component group
-
-        Rather than storing (s - d) directly for all time samples, we use a
-        computational shortcut based on
-
-        ||s - d||^2 = s^2 + d^2 - 2sd
-
-        */
-        for (ic=0; ic<NC; ic++) {
-          L2_tmp = 0.;
-
-          // Skip components not in the component group being considered
-          if (((int) groups(igrp,ic))==0) {
-            continue;
-          } 
-
-          // Skip traces that have been assigned zero weight
-          if (((int) weights(ista,ic))==0) {
-              continue;
-          }
-
-          // calculate s^2
-          for (j1=0; j1<NG; j1++) {
-            for (j2=0; j2<NG; j2++) {
-              L2_tmp += sources(isrc, j1) * sources(isrc, j2) *
-                  greens_greens(ista,ic,itpad,j1,j2);
-            }
-          }
-
-          // calculate d^2
-          L2_tmp += data_data(ista,ic);
-
-          // calculate sd
-          for (ig=0; ig<NG; ig++) {
-            L2_tmp -= 2.*greens_data(ista,ic,ig,itpad) * sources(isrc, ig); 
-          }
-
-          if (hybrid_norm==0) {
-              // L2 norm
-              L2_sum += dt * weights(ista,ic) * L2_tmp;
-          }
-          else {
-              // hybrid L1-L2 norm
-              L2_sum += dt * weights(ista,ic) * pow(L2_tmp, 0.5);
-          }
-        }
-
-      }
-    }
-    results(isrc) = L2_sum;
+  if (failed) {
+    Py_DECREF(results);
+    Py_XDECREF(shifts);
+    return PyErr_NoMemory();
+  }
 
+  if (shifts != NULL) {
+    return Py_BuildValue("NN", results, shifts);
   }
-  return results;
+
+  return (PyObject *) results;
 
 }
 
@@ -0,0 +1,372 @@
+//
+// L2 misfit kernel
+//
+// This file is included by c_ext_L2.c once for each supported floating-point
+// type.  Before each inclusion, REAL must be defined as the type in which the 
+// cross-correlation and source arrays are stored, and KERNEL as the name of
+// the resulting function.  Regardless of REAL, misfit values are accumulated
+// in double precision.
+//
+// Each source is evaluated at all magnitudes in the rho array.  Scaling a 
+// source by a positive factor scales its cross-correlation with data by the
+// same factor, so the optimal time shift is unchanged, and the terms of
+//
+// ||rho*s - d||^2 = rho^2 s^2 + d^2 - 2 rho sd
+//
+// need to be computed only once for all magnitudes.  If norm_type is
+// NORM_COEFFICIENTS, the terms s^2, sd and d^2 themselves are summed over
+// all traces instead (from which misfit at any magnitude, or the optimal 
+// magnitude, follows in closed form).
+//
+// If per_trace is nonzero, contributions of individual traces are stored in 
+// a single precision array of shape (NSRC, NRHO, NSTA, NC) rather than
+// summed, so that traces can later be reweighted without reevaluating misfit.
+//
+// If shifts is not NULL, the time shift index that maximizes cross-correlation
+// is stored for each source, station and component group.
+//
+// greens_greens holds, for each trace and time shift, a symmetric matrix of
+// Green's function cross-correlations, which is stored either packed (upper
+// triangle only) or unpacked.  In both cases s^2 is obtained as a dot product
+// with products of source weights that are computed once per source.
+//
+// Stations can differ in time sampling.  Each station has its own sampling
+// interval dt and number of time shifts npad (no larger than NPAD, the 
+// length of the lag axes of the cross-correlation arrays).
+//
+// If top_k is positive, only the top_k lowest misfit values are needed.
+// Stations are visited in the given order, and because contributions of 
+// individual traces are nonnegative, a source is abandoned as soon as its 
+// partial sums for all magnitudes exceed the current threshold (the smaller
+// of the given threshold and the top_k-th lowest misfit value found so far 
+// by the same thread).  Abandoned sources are assigned infinite misfit.
+//
+
+static int KERNEL(
+    PyArrayObject *data_data,
+    PyArrayObject *greens_data,
+    PyArrayObject *greens_greens,
+    PyArrayObject *sources,
+    PyArrayObject *groups,
+    PyArrayObject *weights,
+    PyArrayObject *rho,
+    PyArrayObject *dt,
+    PyArrayObject *npad,
+    PyArrayObject *results,
+    PyArrayObject *shifts,
+    int norm_type,
+    int per_trace,
+    int NPAD,
+    int debug_level,
+    int msg_start,
+    int msg_stop,
+    int msg_percent,
+    int nthreads,
+    int top_k,
+    npy_float64 threshold,
+    PyArrayObject *order) {
+
+  int NSRC, NSTA, NC, NG, NGRP, NRHO, NOUT, NP;
+  int packed, failed;
+
+  float msg_interval;
+  int msg_count;
+
+  NSRC = (int) PyArray_SHAPE(sources)[0];
+  NSTA = (int) PyArray_SHAPE(weights)[0];
+  NC = (int) PyArray_SHAPE(weights)[1];
+  NG = (int) PyArray_SHAPE(sources)[1];
+  NGRP = (int) PyArray_SHAPE(groups)[0];
+  NRHO = (int) PyArray_SHAPE(rho)[0];
+  NOUT = (int) PyArray_SHAPE(results)[1];
+
+  packed = PyArray_NDIM(greens_greens) == 4;
+  if (packed) {
+    NP = NG*(NG+1)/2;
+  }
+  else {
+    NP = NG*NG;
+  }
+
+
+  // initialize progress messages
+  //
+  // messages are displayed by the first thread only; because the source loop 
+  // is statically scheduled, each thread carries out about the same number of
+  // iterations, so the first thread's progress stands in for everyone's
+  msg_interval = 0.;
+  msg_count = 0;
+  if (msg_percent > 0) {
+    msg_interval = msg_percent/100.*msg_stop;
+    // rounded up, so that messages already displayed for earlier
+    // iterations are not repeated
+    msg_count = (int) ((100LL*msg_start + (long long) msg_percent*msg_stop - 1)
+      / ((long long) msg_percent*msg_stop));
+  }
+
+  failed = 0;
+
+#ifdef _OPENMP
+  #pragma omp parallel num_threads(nthreads) reduction(|:failed)
+#endif
+  {
+  int isrc, ista, jsta, ic, ig, igrp, irho;
+  int cc_argmax, it, itpad, j1, j2, ip, npad_sta;
+  int ithread, nthreads_actual;
+  REAL cc_max, source;
+  REAL *s, *g, *gg;
+  npy_float64 ss, sd, dd, L2_tmp, L2_min, weight, dt_sta, threshold_local;
+  int abandoned, nheap;
+  float iter, next_iter;
+  int msg_count_local;
+
+  // each thread gets its own scratch buffers for cross-correlations, 
+  // products of source weights and misfit sums
+  REAL *cc = (REAL *) malloc(NPAD*sizeof(REAL));
+  npy_float64 *ssrc = (npy_float64 *) malloc(NP*sizeof(npy_float64));
+  npy_float64 *L2_sum = (npy_float64 *) malloc(NOUT*sizeof(npy_float64));
+
+  // lowest misfit values found so far by this thread
+  npy_float64 *heap = (npy_float64 *) malloc((top_k+1)*sizeof(npy_float64));
+  nheap = 0;
+
+  ithread = 0;
+  nthreads_actual = 1;
+#ifdef _OPENMP
+  ithread = omp_get_thread_num();
+  nthreads_actual = omp_get_num_threads();
+#endif
+
+  msg_count_local = msg_count;
+  iter = (float) msg_start;
+  if (ithread == 0 && msg_percent > 0) {
+    next_iter = (float) msg_count_local*msg_interval;
+  }
+  else {
+    next_iter = INFINITY;
+  }
+
+  if (cc == NULL || ssrc == NULL || L2_sum == NULL || heap == NULL) {
+    failed = 1;
+  }
+
+  //
+  // Iterate over sources
+  //
+
+#ifdef _OPENMP
+  #pragma omp for schedule(static)
+#endif
+  for(isrc=0; isrc<NSRC; ++isrc) {
+
+    if (cc == NULL || ssrc == NULL || L2_sum == NULL || heap == NULL) {
+      continue;
+    }
+
+    // display progress message
+    if (iter >= next_iter) {
+        printf("  about %d percent finished\n", msg_percent*msg_count_local);
+        msg_count_local += 1;
+        next_iter = msg_count_local*msg_interval;
+    }
+    iter += nthreads_actual;
+
+    s = sources(isrc);
+
+    // products of source weights, so that s^2 for any trace and time shift
+    // is a single dot product with greens_greens (off-diagonal entries of 
+    // the packed upper triangle stand for two entries of the full matrix)
+    ip = 0;
+    for (j1=0; j1<NG; j1++) {
+      for (j2=(packed ? j1 : 0); j2<NG; j2++) {
+        ssrc[ip] = (npy_float64) s[j1] * (npy_float64) s[j2];
+        if (packed && j2 != j1) {
+          ssrc[ip] *= 2.;
+        }
+        ip++;
+      }
+    }
+
+    for (irho=0; irho<NOUT; irho++) {
+      L2_sum[irho] = (npy_float64) 0.;
+    }
+
+    threshold_local = threshold;
+    if (top_k > 0 && nheap == top_k && heap[0] < threshold_local) {
+      threshold_local = heap[0];
+    }
+    abandoned = 0;
+
+    for (jsta=0; jsta<NSTA; jsta++) {
+      ista = (int) order(jsta);
+
+      dt_sta = dt(ista);
+      npad_sta = (int) npad(ista);
+
+      for (igrp=0; igrp<NGRP; igrp++) {
+
+        /*
+
+        Finds the shift between data and synthetics that yields the maximum
+        cross-correlation value across all components in the given component 
+        group, subject to the (time_shift_min, time_shift_max) constraint
+
+        */
+
+        for (it=0; it<npad_sta; it++) {
+          cc[it] = (REAL) 0.;
+        }
+
+        for (ic=0; ic<NC; ic++) {
+
+          // Skip components not in the component group being considered
+          if (((int) groups(igrp,ic))==0) {
+            continue;
+           }
+
+          // Skip traces that have been assigned zero weight
+          if (((int) weights(ista,ic))==0) {
+              if (debug_level>1) {
+                if (isrc==0) {
+                  printf(" skipping trace: %d %d\n", ista, ic);
+                }
+              }
+              continue;
+           }
+
+          // Sum cross-correlations of all components being considered
+          for (ig=0; ig<NG; ig++) {
+            g = greens_data(ista,ic,ig);
+            source = s[ig];
+            for (it=0; it<npad_sta; it++) {
+                cc[it] += g[it] * source;
+            }
+          }
+        }
+        cc_max = -NPY_INFINITY;
+        cc_argmax = 0;
+        for (it=0; it<npad_sta; it++) {
+          if (cc[it] > cc_max) {
+            cc_max = cc[it];
+            cc_argmax= it;
+          }
+        }
+        itpad = cc_argmax;
+
+        if (shifts != NULL) {
+          shifts(isrc,ista,igrp) = (npy_int32) itpad;
+        }
+
+
+        /*
+
+        Calculates L2 norm of difference between data and synthetics
+        for all components in the given component group
+
+        Rather than storing (s - d) directly for all time samples, we use a
+        computational shortcut based on
+
+        ||s - d||^2 = s^2 + d^2 - 2sd
+
+        */
+        for (ic=0; ic<NC; ic++) {
+
+          // Skip components not in the component group being considered
+          if (((int) groups(igrp,ic))==0) {
+            continue;
+          } 
+
+          // Skip traces that have been assigned zero weight
+          weight = weights(ista,ic);
+          if (((int) weight)==0) {
+              continue;
+          }
+
+          // calculate s^2
+          gg = greens_greens(ista,ic,itpad);
+          ss = 0.;
+          for (ip=0; ip<NP; ip++) {
+            ss += ssrc[ip] * (npy_float64) gg[ip];
+          }
+
+          // calculate d^2
+          dd = data_data(ista,ic);
+
+          // calculate sd
+          sd = 0.;
+          for (ig=0; ig<NG; ig++) {
+            sd += (npy_float64) greens_data(ista,ic,ig)[itpad] * 
+                (npy_float64) s[ig]; 
+          }
+
+          if (norm_type==NORM_COEFFICIENTS) {
+              L2_sum[0] += dt_sta * weight * ss;
+              L2_sum[1] += dt_sta * weight * sd;
+              L2_sum[2] += dt_sta * weight * dd;
+              continue;
+          }
+
+          for (irho=0; irho<NRHO; irho++) {
+            L2_tmp = rho(irho)*rho(irho)*ss + dd - 2.*rho(irho)*sd;
+
+            if (norm_type==NORM_L2) {
+                // L2 norm
+                L2_tmp = dt_sta * weight * L2_tmp;
+            }
+            else {
+                // hybrid L1-L2 norm
+                L2_tmp = dt_sta * weight * pow(L2_tmp, 0.5);
+            }
+
+            if (per_trace) {
+                contributions(isrc,irho,ista,ic) += (npy_float32) L2_tmp;
+            }
+            else {
+                L2_sum[irho] += L2_tmp;
+            }
+          }
+        }
+
+      }
+
+      // abandon sources that cannot be among the top_k best
+      if (top_k > 0) {
+        L2_min = L2_sum[0];
+        for (irho=1; irho<NRHO; irho++) {
+          if (L2_sum[irho] < L2_min) {
+            L2_min = L2_sum[irho];
+          }
+        }
+        if (L2_min > threshold_local) {
+          abandoned = 1;
+          break;
+        }
+      }
+    }
+
+    if (abandoned) {
+      for (irho=0; irho<NOUT; irho++) {
+        results(isrc,irho) = NPY_INFINITY;
+      }
+    }
+    else if (!per_trace) {
+      for (irho=0; irho<NOUT; irho++) {
+        results(isrc,irho) = L2_sum[irho];
+        if (top_k > 0) {
+          heap_push(heap, &nheap, top_k, L2_sum[irho]);
+        }
+      }
+    }
+
+  }
+
+  free(cc);
+  free(ssrc);
+  free(L2_sum);
+  free(heap);
+  }
+
+  return failed;
+
+}
+
@@ -7,26 +7,140 @@ See ``mtuq/misfit/__init__.py`` for more information
 import numpy as np
 import time
 from copy import deepcopy
-from mtuq.misfit.level1 import correlate
+from scipy.fft import irfft, next_fast_len, rfft
+from mtuq.grid.base import Grid
+from mtuq.util import Null
 from mtuq.util.math import to_mij, to_rtp
 from mtuq.util.signal import get_components, get_time_sampling
-from mtuq.misfit import c_ext_L2
+
+try:
+    from mtuq.misfit import c_ext_L1, c_ext_L2
+except ImportError:
+    # if the C extensions could not be built, mtuq.misfit falls back to the
+    # NumPy implementation in level3 (see mtuq/misfit/__init__.py)
+    c_ext_L1 = c_ext_L2 = None
 
 
 def misfit(data, greens, sources, norm, time_shift_groups,
-    time_shift_min, time_shift_max, msg_handle, debug_level=0):
+    time_shift_min, time_shift_max, msg_handle, debug_level=0, num_threads=1,
+    precision='float64', set_attributes=False, top_k=None, 
+    threshold=np.inf):
     """
     Data misfit function (fast Python/C version)
 
     See ``mtuq/misfit/__init__.py`` for more information
     """
+    # cross-correlate data and synthetics (the L1 norm also requires the 
+    # traces themselves)
+    cache = _precompute(data, greens, time_shift_groups,
+        time_shift_min, time_shift_max, precision,
+        include_traces=(norm=='L1'))
+
+    # sources can be abandoned early only for the L2 and hybrid norms
+    if norm not in ['L2', 'hybrid']:
+        top_k = None
+
+    # evaluate misfit over sources
+    values = _evaluate_grid(cache, sources, norm, msg_handle,
+        debug_level, num_threads, top_k=top_k, threshold=threshold)
+
+    if set_attributes:
+        # as in level0, attributes correspond to the last source
+        if hasattr(sources, 'dims'):
+            source = sources.get(sources.stop-1)
+        else:
+            source = sources[-1]
+
+        # per-trace attributes are computed in double precision, as in level0
+        if precision!='float64':
+            cache = _precompute(data, greens, time_shift_groups,
+                time_shift_min, time_shift_max, 'float64',
+                include_traces=(norm=='L1'))
+
+        _set_attributes(data, greens, source, cache, norm,
+            time_shift_min, time_shift_max)
+
+    return values
+
+
+def screen(data, greens, sources, norm, time_shift_groups,
+    time_shift_min, time_shift_max, msg_handle, decimation=4, tolerance=0.1,
+    num_threads=1, precision='float64'):
+    """
+    Two-stage data misfit function (fast Python/C version)
+
+    Evaluates misfit over all sources using data and Green's functions 
+    decimated by the given factor, then reevaluates at full resolution all
+    sources whose coarse misfit is within a relative `tolerance` of the 
+    coarse minimum.
+
+    Returns a tuple `(values, exact)`, in which `values` is an array of 
+    shape `(len(sources), 1)` and `exact` is a boolean array of shape 
+    `(len(sources),)` that is `True` for sources reevaluated at full 
+    resolution (all other values come from the decimated evaluation)
+
+    See ``mtuq/misfit/__init__.py`` for more information
+    """
+    if norm not in ['L2', 'hybrid']:
+        raise NotImplementedError
+
+    # without the C extensions, both stages are evaluated by level3
+    if c_ext_L2 is None:
+        from mtuq.misfit import level3
+        evaluate_grid, evaluate = level3._evaluate_grid, level3._evaluate
+        kwargs = {}
+    else:
+        evaluate_grid, evaluate = _evaluate_grid, _evaluate
+        kwargs = {'num_threads': num_threads}
+
+    # screen all sources using decimated data and Green's functions
+    cache = _precompute(data, greens, time_shift_groups,
+        time_shift_min, time_shift_max, precision, decimation=decimation)
+
+    values = evaluate_grid(cache, sources, norm, msg_handle, **kwargs)
+
+    # hybrid norm terms are proportional to dt*sqrt(npts), so scale as the
+    # square root of the decimation factor
+    if norm=='hybrid':
+        values /= decimation**0.5
+
+    # reevaluate the best sources at full resolution
+    threshold = values.min() + tolerance*abs(values.min())
+    exact = values[:, 0] <= threshold
+
+    cache = _precompute(data, greens, time_shift_groups,
+        time_shift_min, time_shift_max, precision)
+
+    values[exact, :] = evaluate(cache, _select(sources, np.flatnonzero(exact)),
+        norm, Null(), **kwargs)
+
+    return values, exact
+
+
+def _precompute(data, greens, time_shift_groups, time_shift_min,
+    time_shift_max, precision='float64', include_traces=False, decimation=1):
+    """ Collapses data and Green's functions into NumPy arrays and 
+    cross-correlates them
+
+    Returns a dictionary of arrays that depends only on data, Green's
+    functions and time shift parameters, not on sources, and so can be 
+    reused for any number of source evaluations.  If `include_traces` is 
+    `True`, data and Green's function arrays are included as well.
+
+    If `decimation` is greater than one, data and Green's functions are 
+    first subsampled by that factor (without filtering, so their frequency
+    content must lie well below the reduced Nyquist frequency), and time 
+    shifts are rounded to the coarser sampling.
+    """
     #
     # collect metadata
     #
-    nt, dt = _get_time_sampling(data)
     stations = _get_stations(data)
     components = _get_components(data)
 
+    # station labels, in the same order as the array axes
+    station_ids = [stream.id for stream in data if len(stream) > 0]
+
 
     # which components are absent from the data (boolean array)?
     mask = _get_mask(data, stations, components)
@@ -38,35 +152,191 @@ def misfit(data, greens, sources, norm, time_shift_groups,
     #
     # collapse main structures into NumPy arrays
     #
-    data = _get_data(data, stations, components)
-    greens = _get_greens(greens, stations, components)
-    sources = _to_array(sources)
+    # stations can differ in time sampling, so stations with the same number
+    # of samples and sampling interval are collapsed together, and their 
+    # cross-correlations are later placed in arrays with the largest number 
+    # of time shifts of any station
+    #
+    subsets = []
+    for (nt, dt), indices in _get_samplings(data, stations).items():
+        _stations = [stations[_i] for _i in indices]
+
+        _data = _get_data(data, _stations, components)
+        _greens = _get_greens(greens, _stations, components)
+
+        # sanity checks
+        _check(_data, _greens)
+
+        padding = _get_padding(time_shift_min, time_shift_max, dt)
+
+        if decimation > 1:
+            _data, _greens, padding = _decimate(
+                _data, _greens, padding, decimation)
+            dt *= decimation
+
+        subsets += [(indices, _data, _greens, dt, padding)]
 
-    # sanity checks
-    _check(data, greens, sources)
+    if include_traces and len(subsets) > 1:
+        raise NotImplementedError(
+            "L1 norm requires all stations to have the same time sampling")
+
+
+    # single precision requires rescaling to stay well within the range of 
+    # normal float32 values (Green's functions in SI units are so small that
+    # their products would otherwise underflow)
+    scale = 1.
+    if precision=='float32':
+        scale = max(_get_scale(_greens) for _, _, _greens, _, _ in subsets)
 
 
     #
     # cross-correlate data and synthetics
     #
-    padding = _get_padding(time_shift_min, time_shift_max, dt)
-    data_data = _autocorr_1(data)
-    greens_greens = _autocorr_2(greens, padding)
-    greens_data = _corr_1_2(data, greens, padding)
+    nsta, nc = mask.shape
+    ng = subsets[0][2].shape[2]
+    npad = max(sum(padding)+1 for _, _, _, _, padding in subsets)
+
+    data_data = np.zeros((nsta, nc))
+    greens_data = np.zeros((nsta, nc, ng, npad), dtype=precision)
+    greens_greens = np.zeros((nsta, nc, npad, ng*(ng+1)//2), dtype=precision)
+    dt_array = np.zeros(nsta)
+    padding_array = np.zeros((nsta, 2), dtype=int)
+
+    for indices, _data, _greens, dt, padding in subsets:
+        _greens = _greens/scale
+        _npad = sum(padding)+1
+
+        data_data[indices] = _autocorr_1(_data)
+        greens_greens[indices, :, :_npad] = _autocorr_2(
+            _greens, padding, precision)
+        greens_data[indices, ..., :_npad] = _corr_1_2(
+            _data, _greens, padding, precision)
+
+        dt_array[indices] = dt
+        padding_array[indices] = padding
+
+    cache = {
+        'data_data': data_data,
+        'greens_data': greens_data,
+        'greens_greens': greens_greens,
+        'groups': groups,
+        'mask': mask,
+        'dt': dt_array,
+        'padding': padding_array,
+        'scale': scale,
+        'stations': np.array(station_ids, dtype=str),
+        'components': np.array(components, dtype=str),
+        }
+
+    if include_traces:
+        _, _data, _greens, _, _ = subsets[0]
+        cache.update({
+            'data': _data,
+            'greens': _greens/scale,
+            })
+
+    return cache
+
+
+def _evaluate_grid(cache, sources, norm, msg_handle, debug_level=0,
+    num_threads=1, per_trace=False, top_k=None, threshold=np.inf):
+    """ Evaluates misfit over a `Grid` or `UnstructuredGrid` using 
+    precomputed cross-correlations
+
+    For the L2 and hybrid norms, if the grid contains each orientation at
+    several magnitudes, each orientation is evaluated only once (see
+    ``_factor_magnitudes``)
+
+    If `per_trace` is `True`, returns a single precision array of shape
+    `(len(sources), NSTA, NC)` of contributions from individual traces 
+    rather than misfit values
+
+    If `top_k` is given, sources that cannot be among the `top_k` best, or
+    whose misfit exceeds `threshold`, may be abandoned early and assigned 
+    infinite misfit (see ``_evaluate``)
+    """
+    nsta, nc = cache['mask'].shape
+
+    factors = None
+    if norm in ['L2', 'hybrid'] and hasattr(sources, 'dims'):
+        factors = _factor_magnitudes(sources)
+
+    if factors is None:
+        results = _evaluate(cache, _to_array(sources), norm, msg_handle,
+            debug_level, num_threads, per_trace=per_trace, top_k=top_k,
+            threshold=threshold)
+
+        if per_trace:
+            return results[:, 0, :, :]
+        else:
+            return results
+
+    orientations, rho, indices = factors
+
+    # progress messages refer to orientations rather than grid points
+    msg_args = _get_msg_args(msg_handle, len(orientations)/len(indices))
+
+    results = _evaluate(cache, orientations, norm, msg_handle,
+        debug_level, num_threads, rho=rho, msg_args=msg_args, 
+        per_trace=per_trace, top_k=top_k, threshold=threshold)
+
+    if per_trace:
+        return results.reshape(-1, nsta, nc)[indices]
+    else:
+        return results.reshape(-1)[indices].reshape(-1, 1)
+
+
+def _evaluate(cache, sources, norm, msg_handle, debug_level=0, num_threads=1,
+    rho=None, msg_args=None, per_trace=False, time_shifts=False, top_k=None,
+    threshold=np.inf):
+    """ Evaluates misfit over an array of sources using precomputed 
+    cross-correlations
+
+    If an array of magnitude factors `rho` is given (L2 and hybrid norms 
+    only), each source is evaluated at all of them, and an array of shape 
+    `(len(sources), len(rho))` is returned
+
+    If `per_trace` is `True` (L2 and hybrid norms only), contributions from
+    individual traces are returned in a single precision array of shape
+    `(len(sources), len(rho), NSTA, NC)` instead
+
+    If `time_shifts` is `True` (L2 and hybrid norms only), a tuple is 
+    returned whose second element holds, for each source, station and time
+    shift group, the index of the time shift that maximizes 
+    cross-correlation
+
+    If `top_k` is given (L2 and hybrid norms only), stations are visited in
+    order of decreasing data energy, and sources are abandoned as soon as 
+    their partial misfit sums exceed `threshold` or the `top_k`-th lowest 
+    misfit found so far.  Misfit values of abandoned sources are infinite;
+    all other values are exact.
+    """
+    greens_data = cache['greens_data']
+    padding = cache['padding']
+
+    sources = _cast(cache, sources)
+
+    if norm not in ['L2', 'hybrid'] and (
+       rho is not None or per_trace or time_shifts or top_k):
+        raise NotImplementedError
+
+    if rho is None:
+        rho = np.ones(1)
+    rho = np.ascontiguousarray(rho, dtype='float64')
 
     if norm=='hybrid':
-        hybrid_norm = 1
+        norm_type = 1
     else:
-        hybrid_norm = 0
+        norm_type = 0
+
+    # nonpositive values tell the C extension to use the OpenMP default
+    num_threads = int(num_threads or 0)
 
     #
     # collect message attributes
     #
-    try:
-        msg_args = [getattr(msg_handle, attrib) for attrib in 
-            ['start', 'stop', 'percent']]
-    except:
-        msg_args = [0, 0, 0]
+    if msg_args is None:
+        msg_args = _get_msg_args(msg_handle)
 
     #
     # call C extension
@@ -76,11 +346,26 @@ def misfit(data, greens, sources, norm, time_shift_groups,
 
     if norm in ['L2', 'hybrid']:
         results = c_ext_L2.misfit(
-           data_data, greens_data, greens_greens, sources, groups, mask,
-           hybrid_norm, dt, padding[0], padding[1], debug_level, *msg_args)
+           cache['data_data'], greens_data, cache['greens_greens'], sources,
+           cache['groups'], cache['mask'], rho, *_get_sampling_args(cache),
+           norm_type, int(per_trace), int(time_shifts), debug_level, 
+           *msg_args, num_threads, int(top_k or 0), float(threshold), 
+           _get_order(cache, top_k))
 
     elif norm in ['L1']:
-        raise NotImplementedError
+        # the L1 kernel works in double precision throughout
+        if 'data' not in cache:
+            raise ValueError("L1 norm requires data and Green's functions")
+
+        # (traces are included only if all stations share one time 
+        # sampling, see _precompute)
+        results = c_ext_L1.misfit(
+           cache['data'], cache['greens'],
+           np.ascontiguousarray(greens_data, dtype='float64'),
+           np.ascontiguousarray(sources, dtype='float64'),
+           cache['groups'], cache['mask'], float(cache['dt'][0]),
+           int(padding[0, 0]), int(padding[0, 1]), debug_level, *msg_args,
+           num_threads)
 
     if debug_level > 0:
       print('  Elapsed time (C extension) (s): %f' % \
@@ -89,14 +374,156 @@ def misfit(data, greens, sources, norm, time_shift_groups,
     return results
 
 
+def _evaluate_coefficients(cache, sources, msg_handle, debug_level=0,
+    num_threads=1):
+    """ Evaluates L2 misfit terms over an array of sources using precomputed
+    cross-correlations
+
+    Returns an array of shape `(len(sources), 3)` whose columns are the sums
+    of `s^2`, `sd` and `d^2` over all traces, each taken at the time shift 
+    that maximizes cross-correlation.  Misfit of the `i`-th source scaled by 
+    `rho` is then ``rho**2*A[i] - 2*rho*B[i] + C[i]``.
+    """
+    greens_data = cache['greens_data']
+
+    sources = _cast(cache, sources)
+
+    num_threads = int(num_threads or 0)
+
+    results = c_ext_L2.misfit(
+       cache['data_data'], greens_data, cache['greens_greens'], sources,
+       cache['groups'], cache['mask'], np.ones(1), *_get_sampling_args(cache),
+       2, 0, 0, debug_level, *_get_msg_args(msg_handle), num_threads, 0, 
+       np.inf, _get_order(cache))
+
+    return results
+
+
+def _set_attributes(data, greens, source, cache, norm, time_shift_min,
+    time_shift_max):
+    """ Attaches time shifts and misfit values to data and synthetic traces
+
+    Sets the same trace attributes as ``level0.misfit`` does when 
+    `set_attributes` is `True`, using time shift indices and per-trace 
+    contributions from the C extension
+    """
+    contributions, shifts = _evaluate(
+        cache, np.atleast_2d(source.as_vector()), norm, None,
+        per_trace=True, time_shifts=True)
+
+    stations = _get_stations(data)
+    components = [str(component) for component in cache['components']]
+    groups = cache['groups']
+    mask = cache['mask']
+
+    for _i, station in enumerate(stations):
+        stream = data.select(station)[0]
+
+        nt, dt = get_time_sampling(stream)
+        padding_left = int(cache['padding'][_i, 0])
+
+        # generate synthetics in place, as level0 does, so that the traces
+        # carrying the attributes are those returned by later in-place calls
+        tensor = greens.select(station)[0]
+        tensor._set_components(get_components(stream))
+        synthetics = tensor.get_synthetics(source, inplace=True)
+
+        for _k in range(groups.shape[0]):
+            start = int(shifts[0, _i, _k])
+            stop = start + nt
+
+            npts_shift = padding_left - start
+            time_shift = npts_shift*dt - (time_shift_min + time_shift_max)
+
+            for _j, component in enumerate(components):
+                if not groups[_k, _j] or not mask[_i, _j]:
+                    continue
+
+                value = float(contributions[0, 0, _i, _j])
+
+                d = stream.select(component=component)[0]
+                s = synthetics.select(component=component)[0]
+
+                d.misfit = value
+                s.misfit = value
+                s.time_shift = time_shift
+                s.start = start
+                s.stop = stop
+
+
+def _cast(cache, sources):
+    # sources must match the (possibly rescaled) precision of the 
+    # cross-correlations
+    greens_data = cache['greens_data']
+
+    if greens_data.shape[2] != sources.shape[1]:
+        print()
+        print('Number of Green''s functions in linear combination: %d' % greens_data.shape[2])
+        print('Number of weights in linear combination: %d' % sources.shape[1])
+        print()
+        raise TypeError('Inconsistent shape')
+
+    if greens_data.dtype==np.float32:
+        return np.ascontiguousarray(
+            sources*cache['scale'], dtype='float32')
+    else:
+        return np.ascontiguousarray(sources, dtype='float64')
+
+
+def _get_sampling_args(cache):
+    # sampling intervals and numbers of time shifts of individual stations,
+    # as passed to the C extension
+    dt = cache['dt']
+    npad = cache['padding'].sum(axis=1) + 1
+    return [
+        np.ascontiguousarray(dt, dtype='float64'),
+        np.ascontiguousarray(npad, dtype='int32'),
+        ]
+
+
+def _get_order(cache, top_k=None):
+    # order in which the C extension visits stations; when searching for the
+    # best sources, stations with the most data energy come first, since 
+    # they tend to contribute the most misfit and so allow poorly-fitting
+    # sources to be abandoned soonest
+    nsta = cache['mask'].shape[0]
+
+    if not top_k:
+        return np.arange(nsta, dtype='int32')
+
+    energy = np.sum(cache['data_data']*cache['mask'], axis=1)
+    return np.argsort(-energy, kind='stable').astype('int32')
+
+
+def _get_msg_args(msg_handle, ratio=1.):
+    # progress message attributes passed to the C extensions; if fewer
+    # sources are evaluated than there are grid points, start and stop are
+    # rescaled accordingly
+    try:
+        start, stop, percent = [getattr(msg_handle, attrib) for attrib in 
+            ['start', 'stop', 'percent']]
+    except:
+        return [0, 0, 0]
+
+    if ratio != 1.:
+        start = int(start*ratio)
+        stop = max(int(np.ceil(stop*ratio)), 1)
+
+    return [start, stop, percent]
+
+
 #
 # utility functions
 #
 
-def _get_time_sampling(dataset):
-    for stream in dataset:
-        if len(stream) > 0:
-            return get_time_sampling(stream)
+def _get_samplings(data, stations):
+    # groups station indices by time sampling, i.e. by number of samples and
+    # sampling interval
+    samplings = {}
+    for _i, station in enumerate(stations):
+        stream = data.select(station)[0]
+        samplings.setdefault(get_time_sampling(stream), []).append(_i)
+    return samplings
 
 
 def _get_padding(time_shift_min, time_shift_max, dt):
@@ -105,10 +532,35 @@ def _get_padding(time_shift_min, time_shift_max, dt):
     return [padding_left, padding_right]
 
 
+def _decimate(data, greens, padding, factor):
+    # subsamples data and Green's functions by the given factor
+    #
+    # data sample j corresponds to Green's function sample j+padding[0], so
+    # Green's functions are subsampled starting from an offset that keeps
+    # the retained samples aligned, and padding is rounded down to whole
+    # coarse samples
+    left, right = padding[0]//factor, padding[1]//factor
+    start = padding[0] - factor*left
+
+    data = data[..., ::factor]
+    greens = greens[..., start::factor][..., :data.shape[-1]+left+right]
+
+    return data, greens, [left, right]
+
+
+def _get_scale(greens):
+    # maximum Green's function amplitude
+    scale = np.abs(greens).max()
+    if scale > 0.:
+        return scale
+    else:
+        return 1.
+
+
 def _get_greens(greens, stations, components):
     Ncomponents = len(components)
     Nstations = len(stations)
-    Npts = len(greens[0][0])
+    Npts = len(greens.select(stations[0])[0][0])
 
     Ngreens = 0
     if greens[0].include_mt:
@@ -140,27 +592,33 @@ def _get_data(data, stations, components):
 
     #.. warning::
 
-    #    Requires that all streams have the same time discretization
-    #    (or else an error is raised)
+    #    Requires that all given stations have the same time discretization
+    #    (see _get_samplings)
 
-    nt, dt = _get_time_sampling(data)
+    nt, dt = get_time_sampling(data.select(stations[0])[0])
 
     ns = len(stations)
     nc = len(components)
     array = np.zeros((ns, nc, nt))
 
     for _i, station in enumerate(stations):
-        stream = data.select(station)[0]
+        traces = _get_traces(data.select(station)[0])
         for _j, component in enumerate(components):
-            try:
-                trace = stream.select(component=component)[0]
-            except:
-                continue
-            array[_i, _j, :] = trace.data
+            if component in traces:
+                array[_i, _j, :] = traces[component].data
 
     return array
 
 
+def _get_traces(stream):
+    # maps each component to the first trace of that component, so that
+    # streams need not be searched once per component
+    traces = {}
+    for trace in stream:
+        traces.setdefault(trace.stats.channel[-1:].upper(), trace)
+    return traces
+
+
 
 def _get_components(data):
     components = list()
@@ -189,12 +647,9 @@ def _get_mask(data, stations, components):
         ))
 
     for _i, station in enumerate(stations):
+        traces = _get_traces(data.select(station)[0])
         for _j, component in enumerate(components):
-
-            stream = data.select(station)[0]
-            stream = stream.select(component=component)
-
-            if len(stream)==0:
+            if component not in traces:
                 mask[_i, _j] = 0.
 
     return mask
@@ -226,7 +681,7 @@ def _get_groups(groups, components):
     return array
 
 
-def _check(data, greens, sources):
+def _check(data, greens, sources=None):
     # array shape sanity checks
 
     if data.shape[0] != greens.shape[0]:
@@ -243,7 +698,7 @@ def _check(data, greens, sources):
         print()
         raise TypeError('Inconsistent shape')
 
-    if greens.shape[2] != sources.shape[1]:
+    if sources is not None and greens.shape[2] != sources.shape[1]:
         print()
         print('Number of Green''s functions in linear combination: %d' % greens.shape[2])
         print('Number of weights in linear combination: %d' % sources.shape[1])
@@ -251,25 +706,136 @@ def _check(data, greens, sources):
 
 
 def _to_array(sources):
+    if not hasattr(sources, 'dims'):
+        # list of source objects rather than a grid
+        return np.ascontiguousarray(
+            [source.as_vector() for source in sources], dtype='float64')
+
     dims = sources.dims
-    df = sources.to_dataframe()
+    return sources.to_array(
+        callback=lambda *columns: _to_vectors(dims, columns))
+
+
+def _select(sources, indices):
+    # source vectors at the given indices of a grid or list of sources
+    if not hasattr(sources, 'dims'):
+        return _to_array([sources[_i] for _i in indices])
+
+    points = sources.to_array()[indices]
+    return _to_vectors(sources.dims, list(points.T))
+
+
+def _to_vectors(dims, columns):
+    # coordinate arrays are passed to the conversion function by name, so
+    # axes can be in any order
+    if _type(dims)=='MomentTensor':
+        return np.ascontiguousarray(to_mij(**dict(zip(dims, columns))))
+
+    elif _type(dims)=='Force':
+        return np.ascontiguousarray(to_rtp(**dict(zip(dims, columns))))
+
+
+def _factor_magnitudes(sources):
+    """ Splits grid points into orientations and magnitudes
+
+    Scaling a source by a positive factor scales its cross-correlations with
+    data by the same factor, so the time shifts that maximize 
+    cross-correlation do not depend on magnitude.  If a grid contains each
+    orientation at several magnitudes, misfit can therefore be evaluated once
+    per orientation and then for all magnitudes at negligible extra cost.
+
+    Returns a tuple `(orientations, rho, indices)`, in which `orientations` 
+    is an array of sources at a common reference magnitude, `rho` holds 
+    magnitudes relative to the reference magnitude, and `indices` maps grid 
+    points to a flattened array of shape `(len(orientations), len(rho))`.
+    Returns `None` if nothing would be gained.
+    """
+    dims = list(sources.dims)
+    axis = dims.index(_magnitude_axis(dims))
+
+    if isinstance(sources, Grid):
+        factors = _factor_grid(sources, axis)
+    else:
+        factors = _factor_points(sources.to_array(), axis)
+
+    if factors is None:
+        return None
+
+    magnitudes, imag, others, iorient = factors
 
+    # orientations are evaluated at the largest magnitude, which keeps
+    # source amplitudes in the same range as for the grid itself
+    reference = magnitudes[-1]
+
+    columns = list(others)
+    columns.insert(axis, np.full(len(others[0]), reference))
+
+    orientations = _to_vectors(dims, columns)
+    rho = magnitudes/reference
+    indices = iorient.ravel()*len(rho) + imag.ravel()
+
+    return orientations, rho, indices
+
+
+def _factor_grid(grid, axis):
+    # for regular grids, orientations and magnitudes follow from grid axes,
+    # without sorting grid points
+    if grid.size==0:
+        return None
+
+    magnitudes, imag = np.unique(grid.coords[axis], return_inverse=True)
+
+    if len(magnitudes) < 2 or magnitudes[0] <= 0.:
+        return None
+
+    indices = np.unravel_index(np.arange(grid.start, grid.stop), grid.shape)
+
+    axes = [_k for _k in range(grid.ndim) if _k!=axis]
+    shape = [grid.shape[_k] for _k in axes]
+
+    iorient = np.ravel_multi_index([indices[_k] for _k in axes], shape)
+
+    # partitioned grids (see Grid.partition) need not contain every
+    # orientation
+    if grid.size < np.prod(grid.shape):
+        used, iorient = np.unique(iorient, return_inverse=True)
+    else:
+        used = np.arange(np.prod(shape))
+
+    if len(used)==grid.size:
+        return None
+
+    others = [grid.coords[_k][_i] for _k, _i in
+        zip(axes, np.unravel_index(used, shape))]
+
+    return magnitudes, imag[indices[axis]], others, iorient
+
+
+def _factor_points(points, axis):
+    # for unstructured grids, orientations are found by sorting grid points
+    if len(points)==0:
+        return None
+
+    magnitudes, imag = np.unique(points[:, axis], return_inverse=True)
+
+    if len(magnitudes) < 2 or magnitudes[0] <= 0.:
+        return None
+
+    others = np.delete(points, axis, axis=1)
+    others, iorient = np.unique(others, axis=0, return_inverse=True)
+
+    if len(others)==len(points):
+        return None
+
+    return magnitudes, imag, list(others.T), iorient
+
+
+def _magnitude_axis(dims):
     if _type(dims)=='MomentTensor':
-        return np.ascontiguousarray(to_mij(
-            df['rho'].to_numpy(),
-            df['v'].to_numpy(),
-            df['w'].to_numpy(),
-            df['kappa'].to_numpy(),
-            df['sigma'].to_numpy(),
-            df['h'].to_numpy(),
-            ))
+        return 'rho'
 
     elif _type(dims)=='Force':
-        return np.ascontiguousarray(to_rtp(
-            df['F0'].to_numpy(),
-            df['phi'].to_numpy(),
-            df['h'].to_numpy(),
-            ))
+        return 'F0'
 
 
 def _type(dims):
@@ -294,79 +860,91 @@ def _type(dims):
 # cross-correlation utilities
 #
 
-def _corr_1_2(data, greens, padding):
+def _corr_1_2(data, greens, padding, dtype='float64'):
     # correlates 1D and 2D data structures
-    Ncomponents = greens.shape[1]
-    Nstations = greens.shape[0]
-    Ngreens = greens.shape[2]
+    #
+    # all traces are correlated at once in the frequency domain; since only
+    # lags 0, 1, ..., sum(padding) are needed, a transform length no shorter
+    # than the Green's functions avoids any circular wraparound
+    Npts = greens.shape[3]
+    Npad = padding[0]+padding[1]+1
 
-    corr = np.zeros((
-        Nstations,
-        Ncomponents,
-        Ngreens,
-        padding[0]+padding[1]+1,
-        ))
+    nfft = next_fast_len(Npts, real=True)
 
-    for _i in range(Nstations):
-        for _j in range(Ncomponents):
-            for _k in range(Ngreens):
+    # data transforms are computed once and reused for all Green's functions
+    data_fft = np.conj(rfft(data, nfft, axis=-1))
+    greens_fft = rfft(greens, nfft, axis=-1)
 
-                corr[_i, _j, _k, :] = correlate(
-                    greens[_i, _j, _k, :], data[_i, _j, :])
+    corr = irfft(greens_fft*data_fft[:, :, None, :], nfft, axis=-1)
 
-    return corr
+    return np.ascontiguousarray(corr[..., :Npad], dtype=dtype)
 
 
 def _autocorr_1(data):
     # autocorrelates 1D data strucutres (reduces to dot product)
-    Ncomponents = data.shape[1]
-    Nstations = data.shape[0]
+    return np.einsum('ijk,ijk->ij', data, data)
 
-    corr = np.zeros((
-        Nstations,
-        Ncomponents,
-        ))
 
-    for _i in range(Nstations):
-        for _j in range(Ncomponents):
-            corr[_i, _j] = np.dot(
-                data[_i, _j, :], data[_i, _j, :])
+def _autocorr_2(greens, padding, dtype='float64'):
+    # autocorrelates 2D data structures
+    #
+    # for each time shift, sums products of Green's functions over the window
+    # of length Npts-sum(padding) that is compared with data
+    #
+    # all windows share the samples between the largest start index and the
+    # smallest stop index, so products over these samples are summed once,
+    # as a batched matrix product; only the samples at the window edges, 
+    # which vary with time shift, are summed separately
+    #
+    # because the products are symmetric in the two Green's functions, only
+    # the upper triangle is computed and stored (see _pack)
 
-    return corr
+    Npts = greens.shape[3]
 
+    Npad = padding[0]+padding[1]+1
+    Nwin = Npts-Npad+1
 
-def _autocorr_2(greens, padding):
-    # autocorrelates 2D data structures
+    i1, i2 = np.triu_indices(greens.shape[2])
 
-    Ncomponents = greens.shape[1]
-    Nstations = greens.shape[0]
-    Ngreens = greens.shape[2]
-    Npts = greens.shape[3]
+    # sums over samples common to all windows (if windows are shorter than
+    # the time shift range, there are no such samples, and the overlap 
+    # between edges is subtracted instead)
+    if Nwin >= Npad-1:
+        core = greens[..., Npad-1:Nwin]
+        common = +np.matmul(core, np.swapaxes(core, -1, -2))
+    else:
+        core = greens[..., Nwin:Npad-1]
+        common = -np.matmul(core, np.swapaxes(core, -1, -2))
 
-    ones = np.pad(np.ones(Npts), 
-        (padding[0], padding[1]), 'constant')
+    # products at the left and right window edges
+    head = greens[..., :Npad-1]
+    head = head[:, :, i1, :]*head[:, :, i2, :]
 
-    corr = np.zeros((
-        Nstations,
-        Ncomponents, 
-        padding[0]+padding[1]+1, 
-        Ngreens, 
-        Ngreens,
-        ))
+    tail = greens[..., Nwin:]
+    tail = tail[:, :, i1, :]*tail[:, :, i2, :]
+
+    # the window for the k-th time shift includes left edge samples k, ..., 
+    # Npad-2 and right edge samples 0, ..., k-1
+    corr = np.zeros(head.shape[:3] + (Npad,))
+    corr[..., :-1] += np.cumsum(head[..., ::-1], axis=-1)[..., ::-1]
+    corr[..., 1:] += np.cumsum(tail, axis=-1)
+    corr += common[:, :, i1, i2, None]
 
-    for _i in range(Nstations):
-        for _j in range(Ncomponents):
-            for _k1 in range(Ngreens):
-                for _k2 in range(Ngreens):
+    # reorder axes as (Nstations, Ncomponents, Npad, Ngreens*(Ngreens+1)/2)
+    return np.ascontiguousarray(np.moveaxis(corr, 3, 2), dtype=dtype)
 
-                    if _k1<=_k2:
-                        corr[_i, _j, :, _k1, _k2] = correlate(
-                            greens[_i, _j, _k1, :]*greens[_i, _j, _k2, :],
-                            ones)
 
-                    else:
-                        corr[_i, _j, :, _k1, _k2] = corr[_i, _j, :, _k2, _k1]
+def _pack(greens_greens):
+    # packs symmetric matrices along the last two axes into their upper 
+    # triangles, stored row by row
+    i1, i2 = np.triu_indices(greens_greens.shape[-1])
+    return np.ascontiguousarray(greens_greens[..., i1, i2])
 
-    return corr
 
+def _products(sources):
+    # products of source weights corresponding to packed entries (see _pack),
+    # so that s^2 = sum(_products(s)*packed); off-diagonal entries stand for
+    # two entries of the full matrix and so are counted twice
+    i1, i2 = np.triu_indices(sources.shape[-1])
+    return np.where(i1==i2, 1., 2.)*sources[..., i1]*sources[..., i2]
 
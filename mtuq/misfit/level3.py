@@ -0,0 +1,151 @@
+"""
+Data misfit module (batched NumPy/BLAS version)
+
+See ``mtuq/misfit/__init__.py`` for more information
+"""
+
+import numpy as np
+from mtuq.misfit.level2 import _precompute, _factor_magnitudes, _products,\
+    _to_array
+
+
+def misfit(data, greens, sources, norm, time_shift_groups,
+    time_shift_min, time_shift_max, msg_handle, block_size=1024):
+    """
+    Data misfit function (batched NumPy/BLAS version)
+
+    See ``mtuq/misfit/__init__.py`` for more information
+    """
+    if norm not in ['L2', 'hybrid']:
+        raise NotImplementedError
+
+    # cross-correlate data and synthetics
+    cache = _precompute(data, greens, time_shift_groups,
+        time_shift_min, time_shift_max)
+
+    # evaluate misfit over sources
+    return _evaluate_grid(cache, sources, norm, msg_handle, block_size)
+
+
+def _evaluate_grid(cache, sources, norm, msg_handle, block_size=1024):
+    """ Evaluates misfit over a `Grid` or `UnstructuredGrid`, evaluating 
+    each orientation only once if the grid contains several magnitudes
+    (see ``mtuq.misfit.level2._factor_magnitudes``)
+    """
+    factors = None
+    if hasattr(sources, 'dims'):
+        factors = _factor_magnitudes(sources)
+
+    if factors is None:
+        return _evaluate(cache, _to_array(sources), norm, msg_handle, 
+            block_size)
+
+    orientations, rho, indices = factors
+
+    results = _evaluate(cache, orientations, norm, msg_handle, block_size,
+        rho=rho)
+
+    return results.reshape(-1)[indices].reshape(-1, 1)
+
+
+def _evaluate(cache, sources, norm, msg_handle, block_size=1024, rho=None):
+    """ Evaluates misfit over blocks of sources
+
+    Within each block, cross-correlations of all sources with all lags are
+    obtained from a single matrix-matrix product, so that most of the work is
+    carried out by BLAS rather than by loops over individual sources
+
+    If an array of magnitude factors `rho` is given, each source is evaluated
+    at all of them, and an array of shape `(len(sources), len(rho))` is 
+    returned
+    """
+    data_data = cache['data_data']
+    greens_data = cache['greens_data']
+    greens_greens = cache['greens_greens']
+    groups = cache['groups']
+    mask = cache['mask']
+
+    # stations can differ in sampling interval and number of time shifts
+    dt = cache['dt']
+    npad = cache['padding'].sum(axis=1) + 1
+
+    # sources must match the (possibly rescaled) cross-correlations
+    sources = np.asarray(sources, dtype='float64')*cache['scale']
+
+    nsrc = sources.shape[0]
+    nsta, nc = mask.shape
+    ngrp = groups.shape[0]
+
+    if rho is None:
+        rho = np.ones(1)
+    nrho = len(rho)
+
+    results = np.zeros((nsrc, nrho))
+
+    # which traces contribute to each (station, group) pair?
+    active = []
+    for _i in range(nsta):
+        active += [[]]
+        for _k in range(ngrp):
+            active[_i] += [[_j for _j in range(nc)
+                if groups[_k, _j] and mask[_i, _j]]]
+
+    # because cross-correlation is linear, the Green's function correlations
+    # can be summed over components once and for all, rather than for every
+    # block of sources
+    greens_data_sum = {}
+    for _i in range(nsta):
+        for _k in range(ngrp):
+            if active[_i][_k]:
+                greens_data_sum[_i, _k] = np.ascontiguousarray(
+                    greens_data[_i, active[_i][_k], :, :npad[_i]].sum(axis=0))
+
+    for start in range(0, nsrc, block_size):
+        stop = min(start+block_size, nsrc)
+        block = sources[start:stop, :]
+
+        values = np.zeros((stop-start, nrho))
+
+        # greens_greens is stored as packed upper triangles, so s^2 reduces
+        # to a dot product with products of source weights
+        products = _products(block)
+
+        for _i in range(nsta):
+            for _k in range(ngrp):
+                if not active[_i][_k]:
+                    continue
+
+                # cross-correlations of all sources in the block, as a single
+                # (block, NG) x (NG, NPAD) matrix-matrix product
+                cc = np.dot(block, greens_data_sum[_i, _k])
+
+                # time shifts that maximize cross-correlation
+                itpad = cc.argmax(axis=1)
+
+                for _j in active[_i][_k]:
+                    # ||s - d||^2 = s^2 + d^2 - 2sd
+                    ss = np.einsum('bp,bp->b',
+                        products, greens_greens[_i, _j, itpad, :])
+
+                    sd = np.einsum('bi,ib->b',
+                        block, greens_data[_i, _j][:, itpad])
+
+                    # time shifts do not depend on magnitude, so scaling 
+                    # sources by rho scales ss by rho**2 and sd by rho
+                    L2 = np.outer(ss, rho**2) + data_data[_i, _j]\
+                       - 2.*np.outer(sd, rho)
+
+                    if norm=='L2':
+                        values += dt[_i] * mask[_i, _j] * L2
+
+                    elif norm=='hybrid':
+                        values += dt[_i] * mask[_i, _j] * L2**0.5
+
+        results[start:stop, :] = values
+
+        # optional progress message
+        for _ in range((stop-start)*nrho):
+            msg_handle()
+
+    return results
+
@@ -0,0 +1,375 @@
+"""
+Misfit operator with precomputed cross-correlations
+
+See ``mtuq/misfit/__init__.py`` for more information
+"""
+
+import numpy as np
+
+from mtuq.misfit import level2, level3
+from mtuq.util import Null, iterable, mask_top_k, warn
+from mtuq.util.signal import check_padding
+
+
+class MisfitOperator(object):
+    """ Data misfit function with cached cross-correlations
+
+    For fixed data, Green's functions and time shift parameters, the
+    cross-correlations between data and Green's functions do not depend on
+    the sources being evaluated.  A `MisfitOperator` computes these
+    cross-correlations once, and can then be evaluated over any number of
+    source batches.
+
+    .. rubric:: Usage
+
+    .. code::
+
+        misfit = Misfit(**parameters)
+        operator = MisfitOperator(data, greens, misfit)
+
+        values1 = operator(sources1)
+        values2 = operator(sources2)
+
+    Cross-correlations can be saved to disk, so they need not be recomputed
+    in later sessions:
+
+    .. code::
+
+        operator.save('operator.npz')
+        operator = open_operator('operator.npz')
+
+    For the L2 norm, the magnitude that minimizes misfit for each source
+    orientation follows in closed form:
+
+    .. code::
+
+        values, magnitudes = operator.optimal_magnitude(sources)
+
+    Contributions of individual traces can be stored, so that station weights
+    can later be changed, or stations dropped or resampled, without 
+    reevaluating misfit:
+
+    .. code::
+
+        contributions = operator.contributions(sources)
+
+        weights = operator.station_weights(exclude=['IU.ANMO.00'])
+        values = reweight(contributions, weights)
+
+
+    .. rubric:: Input arguments
+
+    ``data`` (`mtuq.Dataset`):
+    The observed data to be compared with synthetic data
+
+    ``greens`` (`mtuq.GreensTensorList`):
+    Green's functions corresponding to a single origin
+
+    ``misfit`` (`mtuq.Misfit`):
+    Misfit function whose norm, time shift parameters and precision are used
+
+    ``optimization_level`` (`int`):
+    Which implementation to use for evaluating sources (``2`` or ``3``, see
+    ``mtuq.misfit.Misfit``)
+
+
+    .. note::
+
+      ``norm='L1'`` is supported only with ``optimization_level=2``, which
+      falls back to ``optimization_level=3`` if the C extensions are not 
+      available
+
+    """
+
+    def __init__(self, data=None, greens=None, misfit=None,
+        optimization_level=2, cache=None):
+
+        if optimization_level not in [2, 3]:
+            raise ValueError("Bad input argument: optimization_level")
+
+        # without the C extensions, only level3 is available
+        if optimization_level==2 and level2.c_ext_L2 is None:
+            warn("C extensions not found. Using optimization_level=3 instead.")
+            optimization_level = 3
+
+        if misfit.norm=='L1' and optimization_level==3:
+            raise NotImplementedError
+
+        self.norm = misfit.norm
+        self.time_shift_groups = misfit.time_shift_groups
+        self.time_shift_min = misfit.time_shift_min
+        self.time_shift_max = misfit.time_shift_max
+        self.precision = misfit.precision
+        self.num_threads = misfit.num_threads
+        self.optimization_level = optimization_level
+
+        if cache is not None:
+            # reuse previously computed cross-correlations
+            self._cache = cache
+            return
+
+        # checks that optional Green's function padding is consistent with
+        # time shift bounds
+        check_padding(greens, self.time_shift_min, self.time_shift_max)
+
+        # level3 evaluates in double precision
+        if optimization_level==3:
+            precision = 'float64'
+        else:
+            precision = self.precision
+
+        self._cache = level2._precompute(
+            data, greens, self.time_shift_groups,
+            self.time_shift_min, self.time_shift_max, precision,
+            include_traces=(self.norm=='L1'))
+
+
+    def __call__(self, sources, progress_handle=Null(), top_k=None,
+        threshold=np.inf):
+        """ Evaluates misfit over sources
+
+        ``sources`` can be a `Grid`, an `UnstructuredGrid` or a NumPy array
+        of shape `(len(sources), 6)` (moment tensors) or
+        `(len(sources), 3)` (forces)
+
+        If `top_k` is given, only the `top_k` lowest misfit values that do
+        not exceed `threshold` are returned, and all others are set to 
+        infinity (values tied with the `top_k`-th lowest are all kept).  For
+        the L2 and hybrid norms at ``optimization_level=2``, sources that 
+        cannot be among the best are abandoned early.
+        """
+        # sources can be abandoned early only by the level2 L2 and hybrid 
+        # norm implementations
+        if self.optimization_level==2 and self.norm in ['L2', 'hybrid']:
+            kwargs = {'top_k': top_k, 'threshold': threshold}
+        else:
+            kwargs = {}
+
+        if isinstance(sources, np.ndarray):
+            sources = np.atleast_2d(sources)
+
+        # grid points that differ only in magnitude share a single evaluation
+        elif self.optimization_level==2:
+            values = level2._evaluate_grid(
+                self._cache, iterable(sources), self.norm, progress_handle,
+                num_threads=self.num_threads, **kwargs)
+
+            return _mask(values, top_k, threshold)
+
+        else:
+            values = level3._evaluate_grid(
+                self._cache, iterable(sources), self.norm, progress_handle)
+
+            return _mask(values, top_k, threshold)
+
+        if self.optimization_level==2:
+            values = level2._evaluate(
+                self._cache, sources, self.norm, progress_handle,
+                num_threads=self.num_threads, **kwargs)
+
+        elif self.optimization_level==3:
+            values = level3._evaluate(
+                self._cache, sources, self.norm, progress_handle)
+
+        return _mask(values, top_k, threshold)
+
+
+    @property
+    def stations(self):
+        """ Station identifiers, in the order used by ``contributions``
+        """
+        return [str(station) for station in self._cache['stations']]
+
+
+    @property
+    def components(self):
+        """ Components, in the order used by ``contributions``
+        """
+        return [str(component) for component in self._cache['components']]
+
+
+    def contributions(self, sources, progress_handle=Null()):
+        """ Evaluates contributions of individual traces to misfit
+
+        Returns a single precision array of shape 
+        `(len(sources), len(stations), len(components))`, whose sums over
+        the last two axes are the misfit values returned by ``__call__``.
+        Traces absent from the data contribute zero.
+
+        .. note::
+
+          Available only for ``norm='L2'`` or ``norm='hybrid'`` and
+          ``optimization_level=2``
+
+        """
+        if self.norm not in ['L2', 'hybrid'] or self.optimization_level!=2:
+            raise NotImplementedError
+
+        if isinstance(sources, np.ndarray):
+            results = level2._evaluate(
+                self._cache, np.atleast_2d(sources), self.norm,
+                progress_handle, num_threads=self.num_threads, 
+                per_trace=True)
+            return results[:, 0, :, :]
+
+        else:
+            return level2._evaluate_grid(
+                self._cache, iterable(sources), self.norm, progress_handle,
+                num_threads=self.num_threads, per_trace=True)
+
+
+    def station_weights(self, exclude=[]):
+        """ Returns station weights for use with ``reweight``, in which 
+        stations with identifiers in `exclude` are assigned zero weight
+        """
+        return np.array([0. if station in exclude else 1.
+            for station in self.stations])
+
+
+    def optimal_magnitude(self, sources, progress_handle=Null()):
+        """ Evaluates misfit over sources, with each source rescaled to the
+        magnitude that minimizes misfit
+
+        For a fixed orientation, L2 misfit is a quadratic function
+        ``rho**2*A - 2*rho*B + C`` of the scalar moment `rho` (time shifts do 
+        not depend on `rho`), and so is minimized by ``rho = B/A``.  Returns 
+        a tuple `(values, rho)` of optimal misfit values and magnitudes, 
+        where `rho` is the Frobenius norm of the moment tensor (or the force
+        magnitude).  Magnitudes of the given sources are ignored.
+
+        .. note::
+
+          Available only for ``norm='L2'`` and ``optimization_level=2``
+
+        """
+        if self.norm!='L2' or self.optimization_level!=2:
+            raise NotImplementedError
+
+        if isinstance(sources, np.ndarray):
+            sources = np.atleast_2d(sources)
+        else:
+            sources = level2._to_array(iterable(sources))
+
+        coefficients = level2._evaluate_coefficients(
+            self._cache, sources, progress_handle,
+            num_threads=self.num_threads)
+
+        A, B, C = coefficients.T
+
+        # negative factors would reverse polarity, which changes time shifts,
+        # so the best admissible choice is then the smallest magnitude
+        factor = np.zeros(len(A))
+        valid = (A > 0.) & (B > 0.)
+        factor[valid] = B[valid]/A[valid]
+
+        values = C - factor*B
+
+        return values.reshape(-1, 1), factor*_norm(sources)
+
+
+    def save(self, filename):
+        """ Saves cross-correlations and parameters to NumPy file (``.npz``)
+        """
+        print('  saving NPZ file: %s' % filename)
+        np.savez(filename,
+            norm=self.norm,
+            time_shift_groups=np.array(self.time_shift_groups),
+            time_shift_min=self.time_shift_min,
+            time_shift_max=self.time_shift_max,
+            precision=self.precision,
+            optimization_level=self.optimization_level,
+            **self._cache)
+
+
+
+def reweight(contributions, weights):
+    """ Recombines per-trace misfit contributions using new weights
+
+    ``contributions`` (`numpy.ndarray`):
+    Array of shape `(NSRC, NSTA, NC)` returned by 
+    ``MisfitOperator.contributions``
+
+    ``weights`` (`numpy.ndarray`):
+    Station weights of shape `(NSTA,)` or trace weights of shape 
+    `(NSTA, NC)`, which multiply the original weights
+
+    Returns misfit values of shape `(NSRC, 1)`, obtained from a single
+    matrix-vector product
+    """
+    nsrc, nsta, nc = contributions.shape
+
+    weights = np.asarray(weights, dtype='float64')
+    if weights.shape==(nsta,):
+        weights = np.repeat(weights[:, None], nc, axis=1)
+
+    if weights.shape!=(nsta, nc):
+        raise TypeError('Inconsistent shape')
+
+    # matching dtypes avoid copying the (possibly very large) contributions
+    # array
+    values = np.dot(contributions.reshape(nsrc, nsta*nc),
+        weights.reshape(nsta*nc).astype(contributions.dtype))
+
+    return values.astype('float64').reshape(-1, 1)
+
+
+def _mask(values, top_k=None, threshold=np.inf):
+    # sets all but the top_k lowest values not exceeding threshold to infinity
+    if top_k:
+        values[values > threshold] = np.inf
+        mask_top_k(values, top_k)
+    return values
+
+
+def _norm(sources):
+    # Frobenius norm of moment tensors (off-diagonal elements appear twice in
+    # the full tensor) or Euclidean norm of forces
+    if sources.shape[1]==6:
+        weights = np.array([1., 1., 1., 2., 2., 2.])
+    else:
+        weights = np.ones(sources.shape[1])
+    return np.sqrt(np.sum(weights*sources**2, axis=1))
+
+
+def open_operator(filename, num_threads=1):
+    """ Reads `MisfitOperator` from NumPy file (``.npz``) written by
+    ``MisfitOperator.save``
+    """
+    from mtuq.misfit import Misfit
+
+    with np.load(filename) as npz:
+        misfit = Misfit(
+            norm=str(npz['norm']),
+            time_shift_groups=[str(group) for group in npz['time_shift_groups']],
+            time_shift_min=float(npz['time_shift_min']),
+            time_shift_max=float(npz['time_shift_max']),
+            precision=str(npz['precision']),
+            num_threads=num_threads,
+            )
+
+        cache = {key: npz[key] for key in [
+            'data_data', 'greens_data', 'greens_greens', 'groups', 'mask',
+            'padding', 'stations', 'components']}
+
+        # files written before greens_greens was stored in packed form
+        if cache['greens_greens'].ndim==5:
+            cache['greens_greens'] = level2._pack(cache['greens_greens'])
+
+        # data and Green's functions are saved only for the L1 norm
+        for key in ['data', 'greens']:
+            if key in npz:
+                cache[key] = npz[key]
+
+        cache['scale'] = float(npz['scale'])
+
+        # files written before stations could differ in time sampling hold
+        # a single sampling interval and padding
+        nsta = cache['mask'].shape[0]
+        cache['dt'] = np.broadcast_to(npz['dt'], (nsta,)).astype(float)
+        cache['padding'] = np.broadcast_to(cache['padding'], (nsta, 2)).copy()
+
+        optimization_level = int(npz['optimization_level'])
+
+    return MisfitOperator(misfit=misfit,
+        optimization_level=optimization_level, cache=cache)
+
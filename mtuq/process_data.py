@@ -7,7 +7,7 @@ import warnings
 from copy import deepcopy
 from obspy import taup
 from obspy.geodetics import gps2dist_azimuth
-from os.path import basename, exists
+from os.path import basename, exists, isfile
 from mtuq.util import AttribDict, warn
 from mtuq.util.cap import WeightParser, taper
 from mtuq.util.signal import cut, get_arrival, m_to_deg
@@ -100,6 +100,17 @@ class ProcessData(object):
     whether or not to apply distance-dependent amplitude scaling
 
 
+    ``decimate`` (`bool`)
+    whether or not to downsample data and Green's functions after filtering, 
+    to twice the Nyquist rate of the highest passband frequency (requires
+    `filter_type=bandpass` or `filter_type=lowpass`); traces that are already
+    sampled more coarsely are left unchanged
+
+    ``target_dt`` (`float`)
+    sampling interval in seconds to which data and Green's functions will be
+    resampled after filtering, overrides `decimate`
+
+
 
     .. rubric:: Other input arguments that may be required, depending on the above
 
@@ -122,7 +133,8 @@ class ProcessData(object):
     Name of ObsPy TauP model, required for `pick_type=taup`
 
     ``FK_database`` (`str`)
-    Path to FK database, required for `pick_type=FK_metadata`
+    Path to FK directory tree or packed FK database, required for 
+    `pick_type=FK_metadata`
 
     ``capuaf_file`` (`str`)
     Path to `CAPUAF`-style text file, required for `pick_type=user_supplied`
@@ -144,6 +156,8 @@ class ProcessData(object):
          scaling_power=None,
          scaling_coefficient=None,
          capuaf_file=None,
+         decimate=False,
+         target_dt=None,
          **parameters):
 
         if not filter_type:
@@ -176,6 +190,8 @@ class ProcessData(object):
         self.scaling_power = scaling_power
         self.scaling_coefficient = scaling_coefficient
         self.capuaf_file = capuaf_file
+        self.decimate = decimate
+        self.target_dt = target_dt
 
 
         #
@@ -226,6 +242,33 @@ class ProcessData(object):
              raise ValueError('Bad parameter: filter_type')
 
 
+        #
+        # check resampling parameters
+        #
+
+        if self.filter_type == 'bandpass':
+            freq_max = self.freq_max
+        elif self.filter_type == 'lowpass':
+            freq_max = self.freq
+        else:
+            freq_max = None
+
+        if self.target_dt is not None:
+            assert 0 < self.target_dt < np.inf
+
+            if freq_max and self.target_dt > 0.5/freq_max:
+                warn("target_dt exceeds Nyquist limit of passband")
+
+        elif self.decimate:
+            if not freq_max:
+                raise ValueError(
+                    'decimate requires filter_type=bandpass or lowpass')
+
+            # sampling at twice the Nyquist rate leaves room for the rolloff
+            # of the causal Butterworth filters applied below
+            self.decimate_dt = 0.25/freq_max
+
+
         #
         # check window parameters
         #
@@ -426,6 +469,30 @@ class ProcessData(object):
             tags[index] = 'type:displacement'
 
 
+        #
+        # part 1b: resample traces
+        #
+
+        # with target_dt, data and Green's functions are resampled to the 
+        # same interval regardless of their original sampling, so that they 
+        # can still be compared sample by sample; with decimate, they are 
+        # only ever downsampled, which leaves data and Green's functions that
+        # share the same original sampling consistent
+        if self.target_dt is not None:
+            new_dt = self.target_dt
+        elif self.decimate and dt < self.decimate_dt:
+            new_dt = self.decimate_dt
+        else:
+            new_dt = None
+
+        if new_dt is not None and not np.isclose(dt, new_dt, rtol=1.e-6):
+            for trace in traces:
+                # traces are already band-limited, so Lanczos interpolation
+                # requires no additional anti-aliasing filter
+                trace.interpolate(1./new_dt, method='lanczos', a=20)
+            nt, dt = traces[0].stats.npts, traces[0].stats.delta
+
+
 
         #
         # part 2a: apply distance scaling
@@ -484,6 +551,15 @@ class ProcessData(object):
                     picks['S'] = get_arrival(arrivals, 'S')
 
 
+            elif self.pick_type=='FK_metadata' and isfile(self.FK_database):
+                # packed FK database (see mtuq.io.clients.FK_packed)
+                from mtuq.io.clients.FK_packed import read_picks
+                picks['P'], picks['S'] = read_picks(
+                    self.FK_database,
+                    str(int(np.ceil(origin.depth_in_m/1000.))),
+                    str(int(np.ceil(distance_in_m/1000.))))
+
+
             elif self.pick_type=='FK_metadata':
                 sac_headers = obspy.read('%s/%s_%s/%s.grn.0' %
                     (self.FK_database,
@@ -208,7 +208,9 @@ class ProgressCallback(object):
         self.stop = stop
         self.percent = percent
         self.msg_interval = percent/100.*stop
-        self.msg_count = int(100./percent*start/stop)
+        # rounded up, so that messages already displayed for earlier
+        # iterations are not repeated
+        self.msg_count = -(-100*start//(percent*stop))
         self.iter = start
         self.next_iter = self.msg_count * self.msg_interval
 
@@ -247,3 +249,146 @@ def dataarray_idxmax(da):
     else:
         return da.coords
 
+
+
+def metadata_key(metadata):
+    """ Returns hashable key for `Station` or `Origin` metadata
+
+    Keys are formed from the default attributes of the metadata class, so 
+    that objects which compare equal also have equal keys.  Like ObsPy 
+    comparisons, times are rounded to the precision of each `UTCDateTime`
+    (mixing times of different precision is not supported)
+    """
+    key = [type(metadata).__name__]
+    for name in sorted(type(metadata).defaults):
+        value = metadata.get(name)
+        if isinstance(value, obspy.UTCDateTime):
+            value = round(value.ns, value.precision-9)
+        key += [value]
+    return tuple(key)
+
+
+class MetadataIndexMixin(object):
+    """ Adds station and origin lookup to list-based containers
+
+    Maps station and origin keys (see ``metadata_key``) to list items, so
+    that selection does not require comparing against every item.  The 
+    lookup table is built on first use, updated by ``append`` and discarded
+    by other operations that add, remove or reorder items.
+    """
+    _index = None
+
+
+    def reset_index(self):
+        """ Discards station and origin lookup table
+
+        Keys are computed when the lookup table is built, so if the station
+        or origin attribute of an item is replaced or modified in place
+        afterwards, this method must be called before selecting again
+        """
+        self._index = None
+
+
+    def _lookup(self, metadata):
+        # returns items whose station or origin key matches the given
+        # metadata, a superset of the items that compare equal
+        if self._index is None:
+            self._index = {}
+            for item in self:
+                self._add_to_index(item)
+
+        return self._index.get(metadata_key(metadata), [])
+
+
+    def _add_to_index(self, item):
+        for attr in ['station', 'origin']:
+            if not hasattr(item, attr):
+                continue
+            key = metadata_key(getattr(item, attr))
+            if key not in self._index:
+                self._index[key] = []
+            self._index[key] += [item]
+
+
+    def __getstate__(self):
+        # the lookup table is rebuilt on demand rather than copied or pickled
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        return state
+
+
+    def append(self, item):
+        super(MetadataIndexMixin, self).append(item)
+        if self._index is not None:
+            self._add_to_index(item)
+
+
+    def __setitem__(self, *args):
+        super(MetadataIndexMixin, self).__setitem__(*args)
+        self.reset_index()
+
+
+    def __delitem__(self, *args):
+        super(MetadataIndexMixin, self).__delitem__(*args)
+        self.reset_index()
+
+
+    def __iadd__(self, *args):
+        self.reset_index()
+        return super(MetadataIndexMixin, self).__iadd__(*args)
+
+
+    def extend(self, *args):
+        super(MetadataIndexMixin, self).extend(*args)
+        self.reset_index()
+
+
+    def insert(self, *args):
+        super(MetadataIndexMixin, self).insert(*args)
+        self.reset_index()
+
+
+    def pop(self, *args):
+        self.reset_index()
+        return super(MetadataIndexMixin, self).pop(*args)
+
+
+    def remove(self, *args):
+        super(MetadataIndexMixin, self).remove(*args)
+        self.reset_index()
+
+
+    def clear(self):
+        super(MetadataIndexMixin, self).clear()
+        self.reset_index()
+
+
+    def reverse(self):
+        super(MetadataIndexMixin, self).reverse()
+        self.reset_index()
+
+
+    def sort(self, *args, **kwargs):
+        super(MetadataIndexMixin, self).sort(*args, **kwargs)
+        self.reset_index()
+
+
+def kth_lowest(values, k):
+    """ Returns `k`-th lowest value, or infinity if there are fewer than `k`
+    values
+    """
+    values = np.asarray(values).ravel()
+    if k < 1 or len(values) < k:
+        return np.inf
+    return np.partition(values, k-1)[k-1]
+
+
+def mask_top_k(values, k):
+    """ Sets all but the `k` lowest values to infinity (in place)
+
+    Ties with the `k`-th lowest value are kept, so slightly more than `k`
+    values may remain
+    """
+    threshold = kth_lowest(values, k)
+    values[values > threshold] = np.inf
+    return values
@@ -58,10 +58,20 @@ def resolve_model(name):
         raise ValueError('Bad model')
 
 
+def get_rounded_distance(station, origin):
+    """ Returns epicentral distance in degrees, rounded to 0.001 degrees 
+    (about 100 m)
+
+    Rounding is well below the resolution of syngine's Earth models, and 
+    allows stations at nearly the same distance to share one download
+    """
+    return round(get_distance_in_deg(station, origin), 3)
+
+
 def download_greens_tensor(url, model, station, origin):
     """ Downloads Green's functions through syngine URL interface
     """
-    distance_in_deg = get_distance_in_deg(station, origin)
+    distance_in_deg = get_rounded_distance(station, origin)
 
     url = (url+'/'+'query'
          +'?model='+model
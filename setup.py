@@ -1,20 +1,59 @@
 from __future__ import print_function
 import argparse
 import os
+import shutil
 import sys
+import tempfile
 import numpy
 from setuptools import find_packages, setup, Extension
+from setuptools.command.build_ext import build_ext
 from setuptools.command.test import test as test_command
 
 
-def get_compile_args():
-    compiler = ''
-    compile_args = []
-
+def get_compiler():
     try:
-        compiler = os.environ["CC"]
+        return os.environ["CC"]
     except KeyError:
-        pass
+        return ''
+
+
+def get_openmp_flag(compiler):
+    """ Returns OpenMP compiler flag, or None if the given compiler cannot
+    build and link a small OpenMP program
+    """
+    if get_compiler().endswith("icc"):
+        flag = '-qopenmp'
+    else:
+        flag = '-fopenmp'
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'test_openmp.c')
+        with open(filename, 'w') as file:
+            file.write(
+                "#include <omp.h>\n"
+                "int main(void) { return omp_get_max_threads() < 1; }\n")
+
+        objects = compiler.compile(
+            [filename], output_dir=tmpdir, extra_postargs=[flag])
+        compiler.link_executable(
+            objects, os.path.join(tmpdir, 'test_openmp'),
+            extra_postargs=[flag])
+
+    except Exception:
+        print("OpenMP not supported by compiler. C extensions will run "
+              "single-threaded.")
+        return None
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return flag
+
+
+def get_compile_args():
+    compiler = get_compiler()
+    compile_args = []
 
     if compiler.endswith("icc"):
         compile_args += ['-fast']
@@ -26,6 +65,23 @@ def get_compile_args():
     return compile_args
 
 
+class BuildExt(build_ext):
+    """ Adds OpenMP flags to C extensions if the compiler supports OpenMP
+
+    The check runs only when extensions are actually built, using the same
+    compiler
+    """
+    def build_extensions(self):
+        flag = get_openmp_flag(self.compiler)
+
+        if flag:
+            for extension in self.extensions:
+                extension.extra_compile_args += [flag]
+                extension.extra_link_args += [flag]
+
+        build_ext.build_extensions(self)
+
+
 class PyTest(test_command):
     user_options = [('pytest-args=', 'a', "Arguments to pass to py.test")]
 
@@ -48,6 +104,7 @@ ENTRY_POINTS = {
         'AXISEM_NETCDF = mtuq.io.clients.AxiSEM_NetCDF:Client',
         'FK = mtuq.io.clients.FK_SAC:Client',
         'FK_SAC = mtuq.io.clients.FK_SAC:Client',
+        'FK_PACKED = mtuq.io.clients.FK_packed:Client',
         'SPECFEM3D = mtuq.io.clients.SPECFEM3D_SAC:Client',
         'SPECFEM3D_SAC = mtuq.io.clients.SPECFEM3D_SAC:Client',
         'SYNGINE = mtuq.io.clients.syngine:Client',
@@ -90,11 +147,19 @@ setup(
         "retry", 
         "flake8>=3.0", "pytest", "nose",
     ],
+    cmdclass={'build_ext': BuildExt},
     ext_modules = [
         Extension(
             'mtuq.misfit.c_ext_L2', ['mtuq/misfit/c_ext_L2.c'],
+            depends=['mtuq/misfit/c_ext_L2_kernel.h'],
+            include_dirs=[numpy.get_include()],
+            extra_compile_args=get_compile_args(),
+            optional=True),
+        Extension(
+            'mtuq.misfit.c_ext_L1', ['mtuq/misfit/c_ext_L1.c'],
             include_dirs=[numpy.get_include()],
-            extra_compile_args=get_compile_args()),
+            extra_compile_args=get_compile_args(),
+            optional=True),
     ],
 )
 
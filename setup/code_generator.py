@@ -154,6 +154,69 @@ if __name__=='__main__':
 """
 
 
+Docstring_BenchmarkThreads="""
+if __name__=='__main__':
+    #
+    # Measures how misfit evaluation time scales with the number of threads
+    # used by the fast Python/C misfit implementation
+    #
+    # USAGE
+    #   python benchmark_misfit_threads.py [--max_threads <NTHREADS>]
+    #
+    # Only the time spent in the misfit function is measured; reading and
+    # processing of data and Green's functions are not included. Because 
+    # threads share a single copy of the data and Green's functions, no MPI 
+    # broadcast is required
+    #
+    # Before running this script, it is necessary to unpack the example data 
+    # using data/examples/unpack.bash and the FK Green's functions using 
+    # data/tests/unpack.bash
+    #
+
+    import argparse
+    import multiprocessing
+    import time
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max_threads', type=int,
+        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+
+"""
+
+
+Docstring_BenchmarkLayout="""
+if __name__=='__main__':
+    #
+    # Compares packed and unpacked storage of Green's function 
+    # cross-correlations in the fast Python/C misfit implementation
+    #
+    # USAGE
+    #   python benchmark_misfit_layout.py [--num_threads <NTHREADS>]
+    #
+    # For each station, component and time shift, Green's function 
+    # cross-correlations form a symmetric matrix, of which the packed layout
+    # stores only the upper triangle (21 instead of 36 entries for moment 
+    # tensors).  The unpacked layout is the one used before packing was 
+    # introduced.  Both layouts are evaluated by the current C extension, so
+    # the timings do not include changes to the C kernel itself
+    #
+    # Before running this script, it is necessary to unpack the example data 
+    # using data/examples/unpack.bash and the FK Green's functions using 
+    # data/tests/unpack.bash
+    #
+
+    import argparse
+    import time
+    from mtuq.misfit.operator import MisfitOperator
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_threads', type=int, default=1)
+    args = parser.parse_args()
+
+
+"""
+
+
 Docstring_Gallery="""
 if True:
     #
@@ -684,20 +747,14 @@ Main_GridSearch_DoubleCoupleMagnitudeDepth="""
     #
 
     if rank==0:
-        print('Evaluating body wave misfit...\\n')
-
-    results_bw = grid_search(
-        data_bw, greens_bw, misfit_bw, origins, grid)
-
-    if rank==0:
-        print('Evaluating surface wave misfit...\\n')
+        print('Evaluating body and surface wave misfit...\\n')
 
-    results_sw = grid_search(
-        data_sw, greens_sw, misfit_sw, origins, grid)
+    # body and surface wave misfit are summed in a single pass over the grid
+    results = grid_search(
+        [data_bw, data_sw], [greens_bw, greens_sw], [misfit_bw, misfit_sw],
+        origins, grid)
 
     if rank==0:
-        results = results_bw + results_sw
-
         # source index corresponding to minimum misfit
         idx = results.idxmin('source')
 
@@ -930,6 +987,303 @@ Main_TestMisfit="""
     assert results_0.argmin()==results_1.argmin()==results_2.argmin()
 
 
+    #
+    # Checks that the batched NumPy/BLAS implementation reproduces the 
+    # reference implementation for all norms and several time shift groups
+    # (level3 implements only the L2 and hybrid norms, so for the L1 norm 
+    # optimization_level=3 falls back to optimization_level=2)
+    #
+
+    for _norm, _groups, _data, _greens, _misfit, _label in [
+        ('L2', ['ZR'], data_bw, greens_bw, misfit_bw, 'body wave'),
+        ('L2', ['ZR','T'], data_sw, greens_sw, misfit_sw, 'surface wave'),
+        ('hybrid', ['ZR','T'], data_sw, greens_sw, misfit_sw, 'surface wave'),
+        ('hybrid', ['Z','R','T'], data_sw, greens_sw, misfit_sw, 'surface wave'),
+        ('L1', ['ZR'], data_bw, greens_bw, misfit_bw, 'body wave'),
+        ]:
+
+        print('Evaluating %s misfit (%s norm, time shift groups %s)...\\n' %
+            (_label, _norm, _groups))
+
+        _misfit = Misfit(
+            norm=_norm,
+            time_shift_groups=_groups,
+            time_shift_min=_misfit.time_shift_min,
+            time_shift_max=_misfit.time_shift_max,
+            )
+
+        results_0 = _misfit(
+            _data, _greens, grid, optimization_level=0)
+
+        results_3 = _misfit(
+            _data, _greens, grid, optimization_level=3)
+
+        print('  optimization level:  3\\n', 
+              '  argmin:  %d\\n' % results_3.argmin(), 
+              '  min:     %e\\n\\n' % results_3.min())
+
+        assert results_0.argmin()==results_3.argmin()
+        assert np.allclose(results_0, results_3)
+
+
+    #
+    # Checks that storing cross-correlation arrays in single precision leaves
+    # the best-fitting source unchanged
+    #
+
+    for _misfit, _data, _greens, _label in [
+        (misfit_bw, data_bw, greens_bw, 'body wave'),
+        (misfit_sw, data_sw, greens_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit in single precision...\\n' % _label)
+
+        _misfit.precision = 'float64'
+        results_64 = _misfit(
+            _data, _greens, grid, optimization_level=2)
+
+        _misfit.precision = 'float32'
+        results_32 = _misfit(
+            _data, _greens, grid, optimization_level=2)
+
+        _misfit.precision = 'float64'
+
+        print('  precision:  float32\\n',
+              '  argmin:  %d\\n' % results_32.argmin(),
+              '  min:     %e\\n' % results_32.min(),
+              '  maximum relative difference:  %e\\n\\n' %
+              np.max(np.abs(results_32-results_64)/results_64))
+
+        assert results_32.argmin()==results_64.argmin()
+
+        # per-trace misfit attributes are computed in double precision 
+        # regardless of the precision of the cross-correlation arrays
+        source = grid.get(results_64.argmin())
+
+        attributes = []
+        for precision in ['float64', 'float32']:
+            _misfit.precision = precision
+            _misfit(_data, _greens, source, set_attributes=True)
+            attributes += [[getattr(trace, 'misfit', None)
+                for stream in _data for trace in stream]]
+
+        _misfit.precision = 'float64'
+
+        assert attributes[0]==attributes[1]
+
+
+    #
+    # Checks that evaluating a misfit operator with cached cross-correlations
+    # over grid partitions reproduces the original misfit values
+    #
+
+    for _misfit, _data, _greens, _label in [
+        (misfit_bw, data_bw, greens_bw, 'body wave'),
+        (misfit_sw, data_sw, greens_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit operator...\\n' % _label)
+
+        results = _misfit(
+            _data, _greens, grid, optimization_level=2)
+
+        operator = _misfit.precompute(_data, _greens)
+
+        results_op = np.concatenate(
+            [operator(subset) for subset in grid.partition(3)])
+
+        print('  argmin:  %d\\n' % results_op.argmin(),
+              '  min:     %e\\n\\n' % results_op.min())
+
+        assert np.allclose(results_op, results)
+
+        # contributions of individual traces, which are stored in single
+        # precision, sum to the same misfit values
+        contributions = operator.contributions(grid)
+
+        assert np.allclose(
+            contributions.sum(axis=(1, 2)), results[:, 0], rtol=1.e-5)
+
+
+    #
+    # Checks that screening decimated body wave data leads to the same 
+    # best-fitting source, and that reevaluated sources have exact values
+    #
+
+    print('Screening decimated body wave data...\\n')
+
+    results = misfit_bw(
+        data_bw, greens_bw, grid, optimization_level=2)
+
+    results_screen, exact = misfit_bw.screen(
+        data_bw, greens_bw, grid, decimation=2, tolerance=0.1)
+
+    print('  reevaluated sources:  %d\\n' % exact.sum(),
+          '  argmin:  %d\\n' % results_screen.argmin(),
+          '  min:     %e\\n\\n' % results_screen.min())
+
+    assert results_screen.argmin()==results.argmin()
+    assert np.allclose(results_screen[exact], results[exact])
+
+
+    #
+    # Checks that the L1 C extension agrees with the reference implementation
+    #
+
+    print('Evaluating body wave misfit (L1 norm)...\\n')
+
+    misfit_L1 = Misfit(
+        norm='L1',
+        time_shift_groups=misfit_bw.time_shift_groups,
+        time_shift_min=misfit_bw.time_shift_min,
+        time_shift_max=misfit_bw.time_shift_max,
+        )
+
+    results_0 = misfit_L1(
+        data_bw, greens_bw, grid, optimization_level=0)
+
+    results_2 = misfit_L1(
+        data_bw, greens_bw, grid, optimization_level=2)
+
+    print('  optimization level:  0\\n', 
+          '  argmin:  %d\\n' % results_0.argmin(), 
+          '  min:     %e\\n\\n' % results_0.min())
+
+    print('  optimization level:  2\\n', 
+          '  argmin:  %d\\n' % results_2.argmin(), 
+          '  min:     %e\\n\\n' % results_2.min())
+
+    assert results_0.argmin()==results_2.argmin()
+
+
+    #
+    # Checks that chunked grid searches fall back to the reference 
+    # implementation when the L1 C extension is unavailable
+    #
+
+    print('Evaluating body wave misfit (L1 norm, no C extensions)...\\n')
+
+    c_ext_L2 = level2.c_ext_L2
+    try:
+        level2.c_ext_L2 = None
+
+        results_chunked = grid_search(
+            data_bw, greens_bw, misfit_L1, origin, grid, 
+            chunk_size=10, timed=False, msg_interval=0)
+
+        results_threads = grid_search(
+            data_bw, greens_bw, misfit_L1, origin, grid, 
+            chunk_size=10, timed=False, msg_interval=0, backend='threads')
+
+    finally:
+        level2.c_ext_L2 = c_ext_L2
+
+    assert np.allclose(results_chunked.values.ravel(), results_0.ravel())
+    assert np.allclose(results_threads.values.ravel(), results_0.ravel())
+
+
+    #
+    # Checks that evaluating each orientation once for all magnitudes 
+    # reproduces misfit values obtained one grid point at a time
+    #
+
+    print('Evaluating body wave misfit over several magnitudes...\\n')
+
+    grid_rho = DoubleCoupleGridRegular(
+        npts_per_axis=5,
+        magnitudes=[4.3, 4.5, 4.7])
+
+    results_0 = misfit_bw(
+        data_bw, greens_bw, grid_rho, optimization_level=0)
+
+    results_2 = misfit_bw(
+        data_bw, greens_bw, grid_rho, optimization_level=2)
+
+    print('  argmin:  %d\\n' % results_2.argmin(), 
+          '  min:     %e\\n\\n' % results_2.min())
+
+    assert np.allclose(results_0, results_2)
+
+
+"""
+
+
+
+Main_BenchmarkThreads="""
+    #
+    # The main computational work starts now
+    #
+
+    num_threads = [1]
+    while 2*num_threads[-1] <= args.max_threads:
+        num_threads += [2*num_threads[-1]]
+    if num_threads[-1] < args.max_threads:
+        num_threads += [args.max_threads]
+
+    for data, greens, misfit, label in [
+        (data_bw, greens_bw, misfit_bw, 'body wave'),
+        (data_sw, greens_sw, misfit_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit...\\n' % label)
+
+        elapsed = []
+        for _n in num_threads:
+            misfit.num_threads = _n
+
+            start_time = time.time()
+            results = misfit(data, greens, grid)
+            elapsed += [time.time() - start_time]
+
+            print('  threads:  %3d    time (s):  %8.3f    speedup:  %5.2f' %
+                (_n, elapsed[-1], elapsed[0]/elapsed[-1]))
+
+        print('')
+
+
+"""
+
+
+
+Main_BenchmarkLayout="""
+    #
+    # The main computational work starts now
+    #
+
+    for data, greens, misfit, label in [
+        (data_bw, greens_bw, misfit_bw, 'body wave'),
+        (data_sw, greens_sw, misfit_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit...\\n' % label)
+
+        misfit.num_threads = args.num_threads
+        operator = misfit.precompute(data, greens)
+
+        # packed upper triangles, of shape (NSTA, NC, NPAD, NG*(NG+1)/2)
+        packed = operator._cache['greens_greens']
+
+        # full symmetric matrices, of shape (NSTA, NC, NPAD, NG, NG)
+        ng = int(np.sqrt(2*packed.shape[-1]))
+        i1, i2 = np.triu_indices(ng)
+        unpacked = np.zeros(packed.shape[:-1] + (ng, ng), dtype=packed.dtype)
+        unpacked[..., i1, i2] = packed
+        unpacked[..., i2, i1] = packed
+
+        results = []
+        for layout, greens_greens in [
+            ('unpacked', unpacked), ('packed', packed)]:
+
+            _operator = MisfitOperator(misfit=misfit, 
+                cache=dict(operator._cache, greens_greens=greens_greens))
+
+            start_time = time.time()
+            results += [_operator(grid)]
+            elapsed = time.time() - start_time
+
+            print('  %-8s   size (MB):  %8.1f    time (s):  %8.3f' %
+                (layout, greens_greens.nbytes/1.e6, elapsed))
+
+        assert np.allclose(results[0], results[1])
+        print('')
+
+
 """
 
 
@@ -1055,7 +1409,15 @@ WrapUp_TestGridSearch_DoubleCoupleMagnitudeDepth="""
         #misfit_vs_depth(filename, best_misfit)
 
     if run_checks:
-        pass
+        # checks that a joint grid search returns the weighted sum of 
+        # separate body wave and surface wave grid searches
+        for weights in [[1., 1.], [2., 0.5]]:
+            results_joint = grid_search(
+                [data_bw, data_sw], [greens_bw, greens_sw], 
+                [misfit_bw, misfit_sw], origins, grid, 0, weights=weights)
+
+            assert np.allclose(results_joint, 
+                weights[0]*results_bw + weights[1]*results_sw)
 
     print('SUCCESS\\n')
 
@@ -1301,6 +1663,8 @@ if __name__=='__main__':
         file.write(
             replace(
             Imports,
+            'from mtuq.misfit import Misfit',
+            'from mtuq.misfit import Misfit, level2',
             ))
         file.write(Docstring_TestMisfit)
         file.write(Paths_FK)
@@ -1370,6 +1734,64 @@ if __name__=='__main__':
         file.write(Main_BenchmarkCAP)
 
 
+    with open('tests/benchmark_misfit_threads.py', 'w') as file:
+        file.write(
+            replace(
+            Imports,
+            ))
+        file.write(Docstring_BenchmarkThreads)
+        file.write(Paths_FK)
+        file.write(
+            replace(
+            DataProcessingDefinitions,
+            'pick_type=.*',
+            "pick_type='FK_metadata',",
+            'taup_model=.*,',
+            'FK_database=path_greens,',
+            ))
+        file.write(MisfitDefinitions)
+        file.write(WeightsDefinitions)
+        file.write(Grid_DoubleCouple)
+        file.write(OriginDefinitions)
+        file.write(
+            replace(
+            Main1_SerialGridSearch_DoubleCouple,
+            'greens = download_greens_tensors\(stations, origin, model\)',
+            'db = open_db(path_greens, format=\'FK\', model=model)\n    '
+           +'greens = db.get_greens_tensors(stations, origin)',
+            ))
+        file.write(Main_BenchmarkThreads)
+
+
+    with open('tests/benchmark_misfit_layout.py', 'w') as file:
+        file.write(
+            replace(
+            Imports,
+            ))
+        file.write(Docstring_BenchmarkLayout)
+        file.write(Paths_FK)
+        file.write(
+            replace(
+            DataProcessingDefinitions,
+            'pick_type=.*',
+            "pick_type='FK_metadata',",
+            'taup_model=.*,',
+            'FK_database=path_greens,',
+            ))
+        file.write(MisfitDefinitions)
+        file.write(WeightsDefinitions)
+        file.write(Grid_DoubleCouple)
+        file.write(OriginDefinitions)
+        file.write(
+            replace(
+            Main1_SerialGridSearch_DoubleCouple,
+            'greens = download_greens_tensors\(stations, origin, model\)',
+            'db = open_db(path_greens, format=\'FK\', model=model)\n    '
+           +'greens = db.get_greens_tensors(stations, origin)',
+            ))
+        file.write(Main_BenchmarkLayout)
+
+
     with open('tests/test_graphics.py', 'w') as file:
         file.write(Imports)
         file.write(Docstring_TestGraphics)
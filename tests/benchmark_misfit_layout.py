@@ -0,0 +1,186 @@
+
+import os
+import numpy as np
+
+from mtuq import read, open_db, download_greens_tensors
+from mtuq.event import Origin
+from mtuq.graphics import plot_data_greens, plot_beachball, plot_misfit_dc
+from mtuq.grid import DoubleCoupleGridRegular
+from mtuq.grid_search import grid_search
+from mtuq.misfit import Misfit
+from mtuq.process_data import ProcessData
+from mtuq.util import fullpath
+from mtuq.util.cap import parse_station_codes, Trapezoid
+
+
+
+if __name__=='__main__':
+    #
+    # Compares packed and unpacked storage of Green's function 
+    # cross-correlations in the fast Python/C misfit implementation
+    #
+    # USAGE
+    #   python benchmark_misfit_layout.py [--num_threads <NTHREADS>]
+    #
+    # For each station, component and time shift, Green's function 
+    # cross-correlations form a symmetric matrix, of which the packed layout
+    # stores only the upper triangle (21 instead of 36 entries for moment 
+    # tensors).  The unpacked layout is the one used before packing was 
+    # introduced.  Both layouts are evaluated by the current C extension, so
+    # the timings do not include changes to the C kernel itself
+    #
+    # Before running this script, it is necessary to unpack the example data 
+    # using data/examples/unpack.bash and the FK Green's functions using 
+    # data/tests/unpack.bash
+    #
+
+    import argparse
+    import time
+    from mtuq.misfit.operator import MisfitOperator
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_threads', type=int, default=1)
+    args = parser.parse_args()
+
+
+
+    path_greens=  fullpath('data/tests/benchmark_cap/greens/scak')
+    path_data=    fullpath('data/examples/20090407201255351/*.[zrt]')
+    path_weights= fullpath('data/examples/20090407201255351/weights.dat')
+    event_id=     '20090407201255351'
+    model=        'scak'
+
+
+    process_bw = ProcessData(
+        filter_type='Bandpass',
+        freq_min= 0.1,
+        freq_max= 0.333,
+        pick_type='FK_metadata',
+        FK_database=path_greens,
+        window_type='body_wave',
+        window_length=15.,
+        capuaf_file=path_weights,
+        )
+
+    process_sw = ProcessData(
+        filter_type='Bandpass',
+        freq_min=0.025,
+        freq_max=0.0625,
+        pick_type='FK_metadata',
+        FK_database=path_greens,
+        window_type='surface_wave',
+        window_length=150.,
+        capuaf_file=path_weights,
+        )
+
+
+    misfit_bw = Misfit(
+        norm='L2',
+        time_shift_min=-2.,
+        time_shift_max=+2.,
+        time_shift_groups=['ZR'],
+        )
+
+    misfit_sw = Misfit(
+        norm='L2',
+        time_shift_min=-10.,
+        time_shift_max=+10.,
+        time_shift_groups=['ZR','T'],
+        )
+
+
+    station_id_list = parse_station_codes(path_weights)
+
+
+    #
+    # Next, we specify the moment tensor grid and source-time function
+    #
+
+    grid = DoubleCoupleGridRegular(
+        npts_per_axis=40,
+        magnitudes=[4.5])
+
+    wavelet = Trapezoid(
+        magnitude=4.5)
+
+
+    origin = Origin({
+        'time': '2009-04-07T20:12:55.000000Z',
+        'latitude': 61.454200744628906,
+        'longitude': -149.7427978515625,
+        'depth_in_m': 33033.599853515625,
+        'id': '20090407201255351'
+        })
+
+
+    #
+    # The main I/O work starts now
+    #
+
+    print('Reading data...\n')
+    data = read(path_data, format='sac',
+        event_id=event_id,
+        station_id_list=station_id_list,
+        tags=['units:cm', 'type:velocity']) 
+
+
+    data.sort_by_distance()
+    stations = data.get_stations()
+
+
+    print('Processing data...\n')
+    data_bw = data.map(process_bw)
+    data_sw = data.map(process_sw)
+
+
+    print('Reading Green''s functions...\n')
+    db = open_db(path_greens, format='FK', model=model)
+    greens = db.get_greens_tensors(stations, origin)
+
+
+    print('Processing Greens functions...\n')
+    greens.convolve(wavelet)
+    greens_bw = greens.map(process_bw)
+    greens_sw = greens.map(process_sw)
+
+
+    #
+    # The main computational work starts now
+    #
+
+    for data, greens, misfit, label in [
+        (data_bw, greens_bw, misfit_bw, 'body wave'),
+        (data_sw, greens_sw, misfit_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit...\n' % label)
+
+        misfit.num_threads = args.num_threads
+        operator = misfit.precompute(data, greens)
+
+        # packed upper triangles, of shape (NSTA, NC, NPAD, NG*(NG+1)/2)
+        packed = operator._cache['greens_greens']
+
+        # full symmetric matrices, of shape (NSTA, NC, NPAD, NG, NG)
+        ng = int(np.sqrt(2*packed.shape[-1]))
+        i1, i2 = np.triu_indices(ng)
+        unpacked = np.zeros(packed.shape[:-1] + (ng, ng), dtype=packed.dtype)
+        unpacked[..., i1, i2] = packed
+        unpacked[..., i2, i1] = packed
+
+        results = []
+        for layout, greens_greens in [
+            ('unpacked', unpacked), ('packed', packed)]:
+
+            _operator = MisfitOperator(misfit=misfit, 
+                cache=dict(operator._cache, greens_greens=greens_greens))
+
+            start_time = time.time()
+            results += [_operator(grid)]
+            elapsed = time.time() - start_time
+
+            print('  %-8s   size (MB):  %8.1f    time (s):  %8.3f' %
+                (layout, greens_greens.nbytes/1.e6, elapsed))
+
+        assert np.allclose(results[0], results[1])
+        print('')
+
+
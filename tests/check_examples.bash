@@ -11,6 +11,8 @@ FILENAMES="\
     ../examples/GridSearch.FullMomentTensor.py\
     ../examples/SerialGridSearch.DoubleCouple.py\
     ../tests/benchmark_cap_vs_mtuq.py\
+    ../tests/benchmark_misfit_layout.py\
+    ../tests/benchmark_misfit_threads.py\
     ../tests/test_graphics.py\
     ../tests/test_grid_search_mt.py\
     ../tests/test_grid_search_mt_depth.py\
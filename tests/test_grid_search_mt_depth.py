@@ -167,7 +167,15 @@ if __name__=='__main__':
         #misfit_vs_depth(filename, best_misfit)
 
     if run_checks:
-        pass
+        # checks that a joint grid search returns the weighted sum of 
+        # separate body wave and surface wave grid searches
+        for weights in [[1., 1.], [2., 0.5]]:
+            results_joint = grid_search(
+                [data_bw, data_sw], [greens_bw, greens_sw], 
+                [misfit_bw, misfit_sw], origins, grid, 0, weights=weights)
+
+            assert np.allclose(results_joint, 
+                weights[0]*results_bw + weights[1]*results_sw)
 
     print('SUCCESS\n')
 
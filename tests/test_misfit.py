@@ -7,7 +7,7 @@ from mtuq.event import Origin
 from mtuq.graphics import plot_data_greens, plot_beachball, plot_misfit_dc
 from mtuq.grid import DoubleCoupleGridRegular
 from mtuq.grid_search import grid_search
-from mtuq.misfit import Misfit
+from mtuq.misfit import Misfit, level2
 from mtuq.process_data import ProcessData
 from mtuq.util import fullpath
 from mtuq.util.cap import parse_station_codes, Trapezoid
@@ -205,3 +205,219 @@ if __name__=='__main__':
     assert results_0.argmin()==results_1.argmin()==results_2.argmin()
 
 
+    #
+    # Checks that the batched NumPy/BLAS implementation reproduces the 
+    # reference implementation for all norms and several time shift groups
+    # (level3 implements only the L2 and hybrid norms, so for the L1 norm 
+    # optimization_level=3 falls back to optimization_level=2)
+    #
+
+    for _norm, _groups, _data, _greens, _misfit, _label in [
+        ('L2', ['ZR'], data_bw, greens_bw, misfit_bw, 'body wave'),
+        ('L2', ['ZR','T'], data_sw, greens_sw, misfit_sw, 'surface wave'),
+        ('hybrid', ['ZR','T'], data_sw, greens_sw, misfit_sw, 'surface wave'),
+        ('hybrid', ['Z','R','T'], data_sw, greens_sw, misfit_sw, 'surface wave'),
+        ('L1', ['ZR'], data_bw, greens_bw, misfit_bw, 'body wave'),
+        ]:
+
+        print('Evaluating %s misfit (%s norm, time shift groups %s)...\n' %
+            (_label, _norm, _groups))
+
+        _misfit = Misfit(
+            norm=_norm,
+            time_shift_groups=_groups,
+            time_shift_min=_misfit.time_shift_min,
+            time_shift_max=_misfit.time_shift_max,
+            )
+
+        results_0 = _misfit(
+            _data, _greens, grid, optimization_level=0)
+
+        results_3 = _misfit(
+            _data, _greens, grid, optimization_level=3)
+
+        print('  optimization level:  3\n', 
+              '  argmin:  %d\n' % results_3.argmin(), 
+              '  min:     %e\n\n' % results_3.min())
+
+        assert results_0.argmin()==results_3.argmin()
+        assert np.allclose(results_0, results_3)
+
+
+    #
+    # Checks that storing cross-correlation arrays in single precision leaves
+    # the best-fitting source unchanged
+    #
+
+    for _misfit, _data, _greens, _label in [
+        (misfit_bw, data_bw, greens_bw, 'body wave'),
+        (misfit_sw, data_sw, greens_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit in single precision...\n' % _label)
+
+        _misfit.precision = 'float64'
+        results_64 = _misfit(
+            _data, _greens, grid, optimization_level=2)
+
+        _misfit.precision = 'float32'
+        results_32 = _misfit(
+            _data, _greens, grid, optimization_level=2)
+
+        _misfit.precision = 'float64'
+
+        print('  precision:  float32\n',
+              '  argmin:  %d\n' % results_32.argmin(),
+              '  min:     %e\n' % results_32.min(),
+              '  maximum relative difference:  %e\n\n' %
+              np.max(np.abs(results_32-results_64)/results_64))
+
+        assert results_32.argmin()==results_64.argmin()
+
+        # per-trace misfit attributes are computed in double precision 
+        # regardless of the precision of the cross-correlation arrays
+        source = grid.get(results_64.argmin())
+
+        attributes = []
+        for precision in ['float64', 'float32']:
+            _misfit.precision = precision
+            _misfit(_data, _greens, source, set_attributes=True)
+            attributes += [[getattr(trace, 'misfit', None)
+                for stream in _data for trace in stream]]
+
+        _misfit.precision = 'float64'
+
+        assert attributes[0]==attributes[1]
+
+
+    #
+    # Checks that evaluating a misfit operator with cached cross-correlations
+    # over grid partitions reproduces the original misfit values
+    #
+
+    for _misfit, _data, _greens, _label in [
+        (misfit_bw, data_bw, greens_bw, 'body wave'),
+        (misfit_sw, data_sw, greens_sw, 'surface wave')]:
+
+        print('Evaluating %s misfit operator...\n' % _label)
+
+        results = _misfit(
+            _data, _greens, grid, optimization_level=2)
+
+        operator = _misfit.precompute(_data, _greens)
+
+        results_op = np.concatenate(
+            [operator(subset) for subset in grid.partition(3)])
+
+        print('  argmin:  %d\n' % results_op.argmin(),
+              '  min:     %e\n\n' % results_op.min())
+
+        assert np.allclose(results_op, results)
+
+        # contributions of individual traces, which are stored in single
+        # precision, sum to the same misfit values
+        contributions = operator.contributions(grid)
+
+        assert np.allclose(
+            contributions.sum(axis=(1, 2)), results[:, 0], rtol=1.e-5)
+
+
+    #
+    # Checks that screening decimated body wave data leads to the same 
+    # best-fitting source, and that reevaluated sources have exact values
+    #
+
+    print('Screening decimated body wave data...\n')
+
+    results = misfit_bw(
+        data_bw, greens_bw, grid, optimization_level=2)
+
+    results_screen, exact = misfit_bw.screen(
+        data_bw, greens_bw, grid, decimation=2, tolerance=0.1)
+
+    print('  reevaluated sources:  %d\n' % exact.sum(),
+          '  argmin:  %d\n' % results_screen.argmin(),
+          '  min:     %e\n\n' % results_screen.min())
+
+    assert results_screen.argmin()==results.argmin()
+    assert np.allclose(results_screen[exact], results[exact])
+
+
+    #
+    # Checks that the L1 C extension agrees with the reference implementation
+    #
+
+    print('Evaluating body wave misfit (L1 norm)...\n')
+
+    misfit_L1 = Misfit(
+        norm='L1',
+        time_shift_groups=misfit_bw.time_shift_groups,
+        time_shift_min=misfit_bw.time_shift_min,
+        time_shift_max=misfit_bw.time_shift_max,
+        )
+
+    results_0 = misfit_L1(
+        data_bw, greens_bw, grid, optimization_level=0)
+
+    results_2 = misfit_L1(
+        data_bw, greens_bw, grid, optimization_level=2)
+
+    print('  optimization level:  0\n', 
+          '  argmin:  %d\n' % results_0.argmin(), 
+          '  min:     %e\n\n' % results_0.min())
+
+    print('  optimization level:  2\n', 
+          '  argmin:  %d\n' % results_2.argmin(), 
+          '  min:     %e\n\n' % results_2.min())
+
+    assert results_0.argmin()==results_2.argmin()
+
+
+    #
+    # Checks that chunked grid searches fall back to the reference 
+    # implementation when the L1 C extension is unavailable
+    #
+
+    print('Evaluating body wave misfit (L1 norm, no C extensions)...\n')
+
+    c_ext_L2 = level2.c_ext_L2
+    try:
+        level2.c_ext_L2 = None
+
+        results_chunked = grid_search(
+            data_bw, greens_bw, misfit_L1, origin, grid, 
+            chunk_size=10, timed=False, msg_interval=0)
+
+        results_threads = grid_search(
+            data_bw, greens_bw, misfit_L1, origin, grid, 
+            chunk_size=10, timed=False, msg_interval=0, backend='threads')
+
+    finally:
+        level2.c_ext_L2 = c_ext_L2
+
+    assert np.allclose(results_chunked.values.ravel(), results_0.ravel())
+    assert np.allclose(results_threads.values.ravel(), results_0.ravel())
+
+
+    #
+    # Checks that evaluating each orientation once for all magnitudes 
+    # reproduces misfit values obtained one grid point at a time
+    #
+
+    print('Evaluating body wave misfit over several magnitudes...\n')
+
+    grid_rho = DoubleCoupleGridRegular(
+        npts_per_axis=5,
+        magnitudes=[4.3, 4.5, 4.7])
+
+    results_0 = misfit_bw(
+        data_bw, greens_bw, grid_rho, optimization_level=0)
+
+    results_2 = misfit_bw(
+        data_bw, greens_bw, grid_rho, optimization_level=2)
+
+    print('  argmin:  %d\n' % results_2.argmin(), 
+          '  min:     %e\n\n' % results_2.min())
+
+    assert np.allclose(results_0, results_2)
+
+
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import numpy as np
+
+from unittest import mock
+from obspy import Stream, Trace, UTCDateTime, read
+from obspy.core import AttribDict
+from mtuq.event import Origin
+from mtuq.io.clients import AxiSEM_NetCDF, FK_SAC, FK_packed, syngine
+from mtuq.station import Station
+from mtuq.util.signal import get_distance_in_deg
+from mtuq.util.syngine import GREENS_TENSOR_FILENAMES
+
+
+CHANNELS = [
+    'ZSS', 'ZDS', 'ZDD', 'ZEP',
+    'RSS', 'RDS', 'RDD', 'REP',
+    'TSS', 'TDS',
+    ]
+
+
+class TestAxiSEM(unittest.TestCase):
+
+    def test_cache(self):
+        """ Checks that stations at nearly the same distance share one read,
+        and that the read uses the rounded distance
+        """
+        stations, origin = _stations(), _origin()
+        distances = []
+
+        class _Database(object):
+            def get_greens_function(self, epicentral_distance_in_degree,
+                **kwargs):
+                distances.append(epicentral_distance_in_degree)
+                return _traces(kwargs['origin_time'])
+
+        # instaseis is not needed to read from an already opened database
+        client = AxiSEM_NetCDF.Client.__new__(AxiSEM_NetCDF.Client)
+        client.db = _Database()
+        client.model = 'test'
+        client.kernelwidth = 12
+        client.include_mt = True
+        client.include_force = False
+
+        greens = client.get_greens_tensors(stations, origin)
+
+        assert len(greens)==len(stations)
+        assert distances==[
+            round(get_distance_in_deg(stations[0], origin), 3),
+            round(get_distance_in_deg(stations[2], origin), 3)]
+
+        for tensor, station in zip(greens, stations):
+            assert tensor.station==station
+        assert np.array_equal(greens[0][0].data, greens[1][0].data)
+
+
+
+class TestFK(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'model')
+        self.stations = _stations()
+        self.origins = [_origin(10000.), _origin(15000.)]
+        _fk_database(self.path, self.stations, self.origins)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_packed(self):
+        """ Checks that a packed database gives the same traces and picks as
+        the FK directory tree it was packed from
+        """
+        filename = os.path.join(self.tmpdir, 'model.fk')
+        FK_packed.pack(self.path, filename)
+
+        expected = FK_SAC.Client(self.path).get_greens_tensors(
+            self.stations, self.origins)
+
+        client = FK_packed.Client(filename)
+        greens = client.get_greens_tensors(self.stations, self.origins)
+        client.close()
+
+        assert len(greens)==len(expected)
+        for tensor, _tensor in zip(greens, expected):
+            assert tensor.station==_tensor.station
+            assert tensor.origin==_tensor.origin
+            for trace, _trace in zip(tensor, _tensor):
+                assert trace.stats.channel==_trace.stats.channel
+                assert trace.stats.starttime==_trace.stats.starttime
+                assert trace.stats.delta==_trace.stats.delta
+                assert np.array_equal(trace.data, _trace.data)
+
+        for dirname in os.listdir(self.path):
+            dep = dirname.split('_')[-1]
+            for basename in os.listdir(os.path.join(self.path, dirname)):
+                dst, ext = basename.split('.grn.')
+                if ext!='0':
+                    continue
+
+                sac = read(os.path.join(self.path, dirname, basename),
+                    format='sac')[0].stats.sac
+
+                assert FK_packed.read_picks(filename, dep, dst)==\
+                    (sac.get('t1'), sac.get('t2'))
+
+
+    def test_max_workers(self):
+        """ Checks that concurrent reads return the same Green's tensors, in
+        the same order, as serial reads, reading each depth and distance once
+        """
+        expected = FK_SAC.Client(self.path).get_greens_tensors(
+            self.stations, self.origins)
+
+        client = FK_SAC.Client(self.path)
+        reads = []
+
+        def _read_trace(dep, dst, ext):
+            reads.append((dep, dst))
+            return FK_SAC.Client._read_trace(client, dep, dst, ext)
+
+        with mock.patch.object(client, '_read_trace', _read_trace):
+            greens = client.get_greens_tensors(
+                self.stations, self.origins, max_workers=4)
+
+            # the first two stations are at the same distance
+            assert len(reads)==len(set(reads))*len(FK_SAC.EXTENSIONS)
+            assert len(set(reads))==len(self.origins)*(len(self.stations)-1)
+
+            # Green's tensors are now cached
+            _greens = client.get_greens_tensors(
+                self.stations, self.origins, max_workers=4)
+            assert len(reads)==len(set(reads))*len(FK_SAC.EXTENSIONS)
+
+        for tensors in [greens, _greens]:
+            assert len(tensors)==len(expected)
+            for tensor, _tensor in zip(tensors, expected):
+                assert tensor.station==_tensor.station
+                assert tensor.origin==_tensor.origin
+                for trace, _trace in zip(tensor, _tensor):
+                    assert trace.stats.starttime==_trace.stats.starttime
+                    assert np.array_equal(trace.data, _trace.data)
+
+
+
+class TestSyngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_cache(self):
+        """ Checks that stations at nearly the same distance share one
+        download
+        """
+        stations, origin = _stations(), _origin()
+        distances = []
+
+        def _download_greens_tensor(url, model, station, origin):
+            distances.append(syngine.get_rounded_distance(station, origin))
+            return _zip(_traces(origin.time), os.path.join(
+                self.tmpdir, 'download%d' % len(distances)))
+
+        client = syngine.Client(model='ak135')
+
+        with mock.patch('mtuq.io.clients.syngine.download_greens_tensor',
+                        _download_greens_tensor):
+            greens = client.get_greens_tensors(stations, origin)
+
+        assert len(greens)==len(stations)
+        assert len(distances)==2
+
+        for tensor, station in zip(greens, stations):
+            assert tensor.station==station
+        assert np.array_equal(greens[0][0].data, greens[1][0].data)
+
+
+
+### utility functions
+
+def _origin(depth_in_m=10000.):
+    return Origin({
+        'time': UTCDateTime(0),
+        'latitude': 0.,
+        'longitude': 0.,
+        'depth_in_m': depth_in_m,
+        })
+
+
+def _stations(longitudes=[1., 1.+1.e-6, 1.5]):
+    """ Returns stations, the first two of which are at nearly the same
+    distance
+    """
+    return [Station({
+        'network': 'XX',
+        'station': 'S%02d' % _i,
+        'location': '',
+        'id': 'XX.S%02d.' % _i,
+        'latitude': 0.,
+        'longitude': longitude,
+        'starttime': UTCDateTime(0),
+        'delta': 0.1,
+        'npts': 100,
+        }) for _i, longitude in enumerate(longitudes)]
+
+
+def _traces(starttime, npts=200, dt=0.1):
+    rng = np.random.default_rng()
+    return Stream([Trace(rng.standard_normal(npts), {
+        'channel': channel, 'starttime': starttime, 'delta': dt})
+        for channel in CHANNELS])
+
+
+def _fk_database(path, stations, origins, npts=200, dt=0.1):
+    """ Writes random FK Green's functions for the given stations and 
+    origins, with P and S picks in SAC headers t1, t2 (the latter left
+    undefined for the shallowest origin)
+    """
+    os.makedirs(path)
+    model = os.path.basename(path)
+    client = FK_SAC.Client(path)
+    rng = np.random.default_rng(0)
+
+    for origin in origins:
+        for station in stations:
+            dep, dst = client._get_depth_and_distance(station, origin)
+            dirname = os.path.join(path, '%s_%s' % (model, dep))
+            os.makedirs(dirname, exist_ok=True)
+
+            sac = AttribDict({'t1': float(dst)/6.})
+            if origin!=origins[0]:
+                sac.t2 = float(dst)/3.5
+
+            for ext in FK_SAC.EXTENSIONS:
+                Trace(rng.standard_normal(npts).astype('float32'), {
+                    'delta': dt, 'starttime': UTCDateTime(-2.),
+                    'sac': sac}).write(os.path.join(
+                    dirname, '%s.grn.%s' % (dst, ext)), format='sac')
+
+
+def _zip(stream, dirname):
+    """ Writes traces as SAC files to a zip archive, as downloaded from
+    syngine
+    """
+    os.makedirs(dirname)
+    with zipfile.ZipFile(dirname+'.zip', 'w') as archive:
+        for trace, filename in zip(stream, GREENS_TENSOR_FILENAMES):
+            trace.write(os.path.join(dirname, filename), format='sac')
+            archive.write(os.path.join(dirname, filename), filename)
+    shutil.rmtree(dirname)
+    return dirname
+
+
+
+if __name__=='__main__':
+    unittest.main()
+
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+import unittest
+import warnings
+import numpy as np
+
+from multiprocessing.shared_memory import SharedMemory
+from unittest import mock
+from obspy import Stream, Trace, UTCDateTime
+from mtuq.dataset import Dataset
+from mtuq.event import Origin
+from mtuq.greens_tensor.FK import GreensTensor
+from mtuq.greens_tensor.base import GreensTensorList
+from mtuq.grid import DoubleCoupleGridRegular
+from mtuq.grid_search import adaptive_grid_search, grid_search
+from mtuq.misfit import Misfit
+from mtuq.station import Station
+from mtuq.util import mask_top_k
+
+
+CHANNELS = [
+    'ZSS', 'ZDS', 'ZDD', 'ZEP',
+    'RSS', 'RDS', 'RDD', 'REP',
+    'TSS', 'TDS',
+    ]
+
+
+class TestGridSearch(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+
+        self.grid = DoubleCoupleGridRegular(
+            npts_per_axis=8, magnitudes=[4.5, 4.6])
+
+        self.origins = _origins()
+        self.data, self.greens = _data_greens(
+            self.origins, self.grid.get(300))
+
+        self.misfit = Misfit(
+            norm='L2',
+            time_shift_min=-2.,
+            time_shift_max=+2.,
+            time_shift_groups=['ZR','T'],
+            )
+
+
+    def _grid_search(self, **kwargs):
+        return np.asarray(grid_search(
+            self.data, self.greens, self.misfit, self.origins, self.grid,
+            msg_interval=0, timed=False, **kwargs).values)
+
+
+    def test_top_k(self):
+        """ Checks that pruned grid searches return the same top_k values as
+        a complete grid search, over serial, chunked and threaded paths
+        """
+        values = self._grid_search()
+
+        for top_k in [1, 10, 50]:
+            expected = values.copy()
+            mask_top_k(expected, top_k)
+
+            for kwargs in [
+                {},
+                {'chunk_size': 100},
+                {'backend': 'threads', 'max_workers': 2},
+                {'backend': 'threads', 'max_workers': 2, 'chunk_size': 100},
+                ]:
+
+                results = self._grid_search(top_k=top_k, **kwargs)
+
+                assert np.isfinite(results).sum()==top_k
+                assert np.array_equal(
+                    np.isfinite(results), np.isfinite(expected)), kwargs
+                assert np.allclose(
+                    results[np.isfinite(results)],
+                    expected[np.isfinite(expected)]), kwargs
+
+
+    def test_processes(self):
+        """ Checks that the process pool backend reproduces serial results
+        and releases shared memory afterwards
+        """
+        names = []
+
+        class _SharedMemory(SharedMemory):
+            # records names of shared memory blocks created by grid_search
+            def __init__(self, *args, **kwargs):
+                super(_SharedMemory, self).__init__(*args, **kwargs)
+                if kwargs.get('create'):
+                    names.append(self.name)
+
+        values = self._grid_search()
+
+        with mock.patch('mtuq.grid_search.SharedMemory', _SharedMemory):
+            results = self._grid_search(backend='processes', max_workers=2)
+
+        assert np.allclose(results, values)
+
+        # cross-correlations for each origin are held in shared memory
+        assert len(names) > 0
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                SharedMemory(name=name)
+
+
+    def test_adaptive(self):
+        """ Checks that refining a coarse grid recovers the minimum of an 
+        exhaustive search over a finer grid, to within one coarse grid cell
+        """
+        coarse = DoubleCoupleGridRegular(npts_per_axis=5, magnitudes=[4.5])
+        fine = DoubleCoupleGridRegular(npts_per_axis=20, magnitudes=[4.5])
+
+        # coarse grid spacing
+        spacing = {'kappa': 72., 'sigma': 36., 'h': 0.2}
+
+        df = adaptive_grid_search(
+            self.data, self.greens, self.misfit, self.origins, coarse,
+            nbest=5, nlevels=3, msg_interval=0, timed=False).reset_index()
+
+        for _i, origin in enumerate(self.origins):
+            values = self.misfit(self.data, self.greens.select(origin), fine)
+            expected = fine.get_dict(values.argmin())
+
+            refined = df[df['origin_idx']==_i]
+            best = refined.loc[refined[0].idxmin()]
+
+            # refinement adds points to the coarse grid
+            assert len(refined) > coarse.size
+            assert best[0] <= refined[0].iloc[:coarse.size].min()
+
+            for dim in spacing:
+                difference = abs(best[dim] - expected[dim])
+                if dim=='kappa':
+                    difference = min(difference, 360.-difference)
+                assert difference <= spacing[dim], dim
+
+
+    def test_mixed_sampling(self):
+        """ Checks that stations with different time sampling give the same
+        results at optimization levels 0 and 2, including the L1 norm, for 
+        which level2 falls back to level0
+        """
+        grid = DoubleCoupleGridRegular(npts_per_axis=4, magnitudes=[4.5])
+        origins = self.origins[:1]
+
+        data, greens = _data_greens(origins, self.grid.get(300),
+            npts=[200, 100], dt=[0.1, 0.2], npad=[20, 10])
+
+        for norm in ['L2', 'hybrid', 'L1']:
+            misfit = Misfit(
+                norm=norm,
+                time_shift_min=-2.,
+                time_shift_max=+2.,
+                time_shift_groups=['ZR','T'],
+                )
+
+            expected = misfit(data, greens, grid, optimization_level=0)
+
+            if norm=='L1':
+                with self.assertWarns(UserWarning):
+                    values = misfit(data, greens, grid, optimization_level=2)
+            else:
+                values = misfit(data, greens, grid, optimization_level=2)
+
+            assert np.allclose(values, expected), norm
+
+            # chunks reuse cross-correlations, where supported
+            results = grid_search(data, greens, misfit, origins, grid,
+                chunk_size=20, msg_interval=0, timed=False)
+
+            assert np.allclose(
+                results.values.reshape(expected.shape), expected), norm
+
+
+
+### utility functions
+
+def _origins(depths=[10000., 15000.]):
+    return [Origin({
+        'time': UTCDateTime(0),
+        'latitude': 0.,
+        'longitude': 0.,
+        'depth_in_m': depth,
+        }) for depth in depths]
+
+
+def _data_greens(origins, source, nsta=5, npts=200, dt=0.1, npad=20):
+    """ Returns random Green's functions for each station and origin, and
+    data generated from the first origin using the given source
+
+    `npts`, `dt` and `npad` can also be lists, which are cycled through to
+    give stations different time sampling
+    """
+    rng = np.random.default_rng(0)
+
+    data = Dataset()
+    greens = GreensTensorList()
+
+    samplings = [_cycle(value, nsta) for value in (npts, dt, npad)]
+
+    for _i, (npts, dt, npad) in enumerate(zip(*samplings)):
+        station = Station({
+            'network': 'XX',
+            'station': 'S%02d' % _i,
+            'location': '',
+            'id': 'XX.S%02d.' % _i,
+            'latitude': 1.+0.3*_i,
+            'longitude': 0.5+0.2*_i,
+            'starttime': UTCDateTime(0),
+            'delta': dt,
+            'npts': npts,
+            })
+
+        for origin in origins:
+            traces = []
+            for channel in CHANNELS:
+                # smooth random time series, padded to allow time shifts
+                trace = Trace(np.convolve(
+                    rng.standard_normal(npts+2*npad), np.hanning(15), 'same'),
+                    {'delta': dt, 'channel': channel})
+                trace.npts_left = npad
+                trace.npts_right = npad
+                traces += [trace]
+
+            greens.append(GreensTensor(
+                traces, station=station, origin=origin, tags=['type:greens']))
+
+        tensor = greens.select(origins[0]).select(station)[0]
+        tensor._set_components(['Z', 'R', 'T'])
+        synthetics = tensor.get_synthetics(source)
+
+        # time-shifted synthetics with added noise
+        shift = rng.integers(-5, 5)
+        stream = Stream()
+        for trace in synthetics:
+            stream += Trace(
+                trace.data[npad+shift:npad+shift+npts] +
+                0.05*np.std(trace.data)*rng.standard_normal(npts),
+                {'delta': dt, 'npts': npts, 'channel': trace.stats.channel,
+                 'network': 'XX', 'station': station.station})
+        stream.station = station
+        stream.origin = origins[0]
+        data.append(stream)
+
+    return data, greens
+
+
+def _cycle(value, n):
+    if isinstance(value, list):
+        return [value[_i % len(value)] for _i in range(n)]
+    else:
+        return [value]*n
+
+
+
+if __name__=='__main__':
+    unittest.main()
+
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+import copy
+import pickle
+import unittest
+import numpy as np
+
+from obspy import Stream, Trace, UTCDateTime
+from mtuq.dataset import Dataset
+from mtuq.event import Origin
+from mtuq.greens_tensor.base import GreensTensor, GreensTensorList
+from mtuq.station import Station
+
+
+class TestGreensTensorList(unittest.TestCase):
+
+    def test_select(self):
+        """ Checks that selection agrees with comparing against every tensor
+        """
+        stations, origins = _stations(), _origins()
+        greens = _greens(stations, origins)
+
+        for selector in stations + origins:
+            expected = [tensor for tensor in greens
+                if selector in [tensor.station, tensor.origin]]
+            assert list(greens.select(selector))==expected
+
+
+    def test_select_time(self):
+        """ Checks that origins with times that compare equal, but differ
+        below UTCDateTime precision, select the same tensors
+        """
+        stations, origins = _stations(), _origins()
+        greens = _greens(stations, origins)
+
+        for ns in [1, 499, -499]:
+            origin = origins[0].copy()
+            origin.time = UTCDateTime(ns=origins[0].time.ns+ns)
+            assert origin==origins[0]
+            assert list(greens.select(origin))==list(greens.select(origins[0]))
+
+        # times that differ at UTCDateTime precision select nothing
+        origin = origins[0].copy()
+        origin.time = UTCDateTime(ns=origins[0].time.ns+1000)
+        assert origin!=origins[0]
+        assert len(greens.select(origin))==0
+
+
+    def test_reset_index(self):
+        """ Checks that selection sees in-place changes to origins after
+        reset_index is called
+        """
+        stations, origins = _stations(), _origins()
+        greens = _greens(stations, origins)
+
+        # builds lookup table
+        assert len(greens.select(origins[0]))==len(stations)
+
+        new_origin = origins[0].copy()
+        new_origin.depth_in_m = 99000.
+        greens[0].origin.depth_in_m = 99000.
+
+        greens.reset_index()
+        assert list(greens.select(new_origin))==[greens[0]]
+        assert len(greens.select(origins[0]))==len(stations)-1
+
+
+    def test_mutation(self):
+        """ Checks that selection sees tensors added or removed after the
+        lookup table is built
+        """
+        stations, origins = _stations(), _origins()
+        greens = _greens(stations, origins)
+        origin = origins[1]
+
+        # builds lookup table
+        assert len(greens.select(origin))==len(stations)
+
+        tensor = greens.pop()
+        assert len(greens.select(origin))==len(stations)-1
+
+        greens.append(tensor)
+        assert len(greens.select(origin))==len(stations)
+
+        greens.extend([tensor])
+        assert len(greens.select(origin))==len(stations)+1
+
+        del greens[-1]
+        greens.sort(key=lambda tensor: tensor.station.latitude)
+        expected = [tensor for tensor in greens if tensor.origin==origin]
+        assert list(greens.select(origin))==expected
+
+
+
+class TestDataset(unittest.TestCase):
+
+    def test_select(self):
+        """ Checks that selection agrees with comparing against every stream
+        """
+        stations, origins = _stations(), _origins()
+        data = _data(stations, origins)
+
+        for selector in stations + origins:
+            expected = [stream for stream in data
+                if selector in [stream.station, stream.origin]]
+            assert list(data.select(selector))==expected
+
+        assert [stream.id for stream in data.select(['XX.S01.'])]==\
+            ['XX.S01.']*len(origins)
+
+
+    def test_select_time(self):
+        """ Checks that origins with times that compare equal, but differ
+        below UTCDateTime precision, select the same streams
+        """
+        stations, origins = _stations(), _origins()
+        data = _data(stations, origins)
+
+        origin = origins[0].copy()
+        origin.time = UTCDateTime(ns=origins[0].time.ns+1)
+        assert origin==origins[0]
+        assert list(data.select(origin))==list(data.select(origins[0]))
+
+
+    def test_reset_index(self):
+        """ Checks that selection sees in-place changes to stations after
+        reset_index is called
+        """
+        stations, origins = _stations(), _origins()
+        data = _data(stations, origins)
+
+        # builds lookup table
+        assert len(data.select(stations[0]))==len(origins)
+
+        new_station = stations[0].copy()
+        new_station.latitude = 45.
+        data[0].station.latitude = 45.
+
+        data.reset_index()
+        assert list(data.select(new_station))==[data[0]]
+        assert len(data.select(stations[0]))==len(origins)-1
+
+
+    def test_copy(self):
+        """ Checks that copies, deep copies and unpickled datasets have 
+        lookup tables of their own
+        """
+        stations, origins = _stations(), _origins()
+        data = _data(stations, origins)
+        origin = origins[1]
+
+        # builds lookup table
+        assert len(data.select(origin))==len(stations)
+
+        for other in [
+            copy.copy(data),
+            copy.deepcopy(data),
+            pickle.loads(pickle.dumps(data))]:
+
+            assert other._index is None
+            assert len(other.select(origin))==len(stations)
+
+            # selected streams belong to the copy, not to the original
+            for stream in other.select(origin):
+                assert any(stream is _stream for _stream in other)
+
+            other.pop()
+            assert len(other.select(origin))==len(stations)-1
+            assert len(data.select(origin))==len(stations)
+
+
+
+### utility functions
+
+def _stations(nsta=3):
+    return [Station({
+        'network': 'XX',
+        'station': 'S%02d' % _i,
+        'location': '',
+        'id': 'XX.S%02d.' % _i,
+        'latitude': 1.+_i,
+        'longitude': 1.,
+        'starttime': UTCDateTime(0),
+        'delta': 0.1,
+        'npts': 10,
+        }) for _i in range(nsta)]
+
+
+def _origins(depths=[10000., 20000.]):
+    return [Origin({
+        'time': UTCDateTime(0),
+        'latitude': 0.,
+        'longitude': 0.,
+        'depth_in_m': depth,
+        }) for depth in depths]
+
+
+def _greens(stations, origins):
+    greens = GreensTensorList()
+    for origin in origins:
+        for station in stations:
+            greens.append(GreensTensor([Trace(np.zeros(10), {'delta': 0.1})],
+                station=station, origin=origin))
+    return greens
+
+
+
+def _data(stations, origins):
+    data = Dataset()
+    for origin in origins:
+        for station in stations:
+            stream = Stream([Trace(np.zeros(10), {'delta': 0.1,
+                'network': station.network, 'station': station.station})])
+            stream.station = station.copy()
+            stream.origin = origin.copy()
+            data.append(stream)
+    return data
+
+
+
+if __name__=='__main__':
+    unittest.main()
+
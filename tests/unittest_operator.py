@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import numpy as np
+
+from mtuq.dataset import Dataset
+from mtuq.greens_tensor.base import GreensTensorList
+from mtuq.grid import DoubleCoupleGridRegular
+from mtuq.misfit import Misfit, open_operator, reweight
+from unittest_grid_search import _data_greens, _origins
+
+
+class TestMisfitOperator(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.grid = DoubleCoupleGridRegular(
+            npts_per_axis=5, magnitudes=[4.5, 4.6])
+
+        origins = _origins()[:1]
+        self.data, self.greens = _data_greens(origins, self.grid.get(100))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def test_save(self):
+        """ Checks that operators read from file give the same results as
+        the operators that were saved
+        """
+        sources = np.array([self.grid.get(_i).as_vector()
+            for _i in range(0, self.grid.size, 7)])
+
+        for norm in ['L2', 'hybrid', 'L1']:
+            operator = _misfit(norm).precompute(self.data, self.greens)
+
+            filename = os.path.join(self.tmpdir, '%s.npz' % norm)
+            operator.save(filename)
+            other = open_operator(filename)
+
+            assert other.norm==operator.norm
+            assert other.optimization_level==operator.optimization_level
+            assert other.stations==operator.stations
+            assert other.components==operator.components
+
+            assert np.array_equal(other(self.grid), operator(self.grid)), norm
+            assert np.array_equal(other(sources), operator(sources)), norm
+
+            if norm!='L1':
+                assert np.array_equal(
+                    other.contributions(self.grid),
+                    operator.contributions(self.grid)), norm
+
+
+    def test_reweight(self):
+        """ Checks that reweighting per-trace contributions agrees with an
+        operator built from reweighted data and Green's functions
+        """
+        weights = np.array([0., 1., 2., 0.5, 1.])
+
+        for norm in ['L2', 'hybrid']:
+            operator = _misfit(norm).precompute(self.data, self.greens)
+            contributions = operator.contributions(self.grid)
+
+            # unit weights reproduce the original misfit values
+            assert np.allclose(
+                reweight(contributions, operator.station_weights()),
+                operator(self.grid), rtol=1.e-5)
+
+            # L2 misfit is quadratic in amplitude and hybrid misfit linear,
+            # while time shifts do not depend on amplitude
+            if norm=='L2':
+                factors = np.sqrt(weights)
+            else:
+                factors = weights
+
+            data, greens = _rescale(self.data, self.greens, factors)
+            expected = _misfit(norm).precompute(data, greens)(self.grid)
+
+            assert np.allclose(reweight(contributions, weights), expected,
+                rtol=1.e-5, atol=1.e-5*expected.max()), norm
+
+            # excluding a station agrees with leaving it out altogether
+            station = operator.stations[2]
+            expected = _misfit(norm).precompute(
+                _exclude(self.data, station),
+                _exclude(self.greens, station))(self.grid)
+
+            assert np.allclose(
+                reweight(contributions, operator.station_weights([station])),
+                expected, rtol=1.e-5), norm
+
+
+
+### utility functions
+
+def _misfit(norm):
+    return Misfit(
+        norm=norm,
+        time_shift_min=-2.,
+        time_shift_max=+2.,
+        time_shift_groups=['ZR','T'],
+        )
+
+
+def _rescale(data, greens, factors):
+    """ Returns copies of data and Green's functions, in which all traces of
+    the i-th station are multiplied by factors[i]
+    """
+    data, greens = copy.deepcopy(data), copy.deepcopy(greens)
+
+    for stream, factor in zip(data, factors):
+        for trace in stream:
+            trace.data *= factor
+
+        for tensor in greens.select(stream.station):
+            for trace in tensor:
+                trace.data *= factor
+
+            # forces Green's function arrays to be recomputed
+            tensor.components = None
+
+    return data, greens
+
+
+def _exclude(dataset, station):
+    """ Returns dataset without the given station
+    """
+    if isinstance(dataset, Dataset):
+        return Dataset([stream for stream in dataset
+            if stream.station.id!=station])
+    else:
+        return GreensTensorList([tensor for tensor in dataset
+            if tensor.station.id!=station])
+
+
+
+if __name__=='__main__':
+    unittest.main()
+
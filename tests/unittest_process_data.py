@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import unittest
+import warnings
+import numpy as np
+
+from obspy import Stream, Trace, UTCDateTime
+from mtuq.event import Origin
+from mtuq.greens_tensor.FK import GreensTensor
+from mtuq.process_data import ProcessData
+from mtuq.station import Station
+
+
+CHANNELS = [
+    'ZSS', 'ZDS', 'ZDD', 'ZEP',
+    'RSS', 'RDS', 'RDD', 'REP',
+    'TSS', 'TDS',
+    ]
+
+
+class TestResampling(unittest.TestCase):
+
+    def test_decimate(self):
+        """ Checks that decimation never increases the number of samples
+        """
+        for dt in [0.01, 0.1, 0.25, 0.5]:
+            process = _process_data(decimate=True)
+
+            for traces in _traces(dt):
+                npts = traces[0].stats.npts
+                processed = process(traces)
+
+                for trace in processed:
+                    assert trace.stats.npts <= npts
+                    assert trace.stats.delta >= dt or\
+                        np.isclose(trace.stats.delta, dt)
+
+                    # traces are downsampled to 0.25/freq_max
+                    if dt < 0.25:
+                        assert np.isclose(trace.stats.delta, 0.25)
+
+
+    def test_target_dt(self):
+        """ Checks that data and Green's functions are resampled to the
+        given interval, whether coarser or finer than the original one
+        """
+        for dt in [0.01, 0.1, 0.5]:
+            for target_dt in [0.05, 0.2]:
+                process = _process_data(target_dt=target_dt)
+
+                for traces in _traces(dt):
+                    processed = process(traces)
+
+                    for trace in processed:
+                        assert np.isclose(trace.stats.delta, target_dt)
+
+
+
+### utility functions
+
+def _process_data(**parameters):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ProcessData(
+            filter_type='bandpass',
+            freq_min=0.05,
+            freq_max=1.,
+            window_type=None,
+            apply_weights=False,
+            apply_scaling=False,
+            **parameters)
+
+
+def _traces(dt, npts=2000):
+    """ Returns random data and Green's functions for a single station
+    """
+    origin = Origin({
+        'time': UTCDateTime(0),
+        'latitude': 0.,
+        'longitude': 0.,
+        'depth_in_m': 10000.,
+        })
+
+    station = Station({
+        'network': 'XX',
+        'station': 'S01',
+        'location': '',
+        'id': 'XX.S01.',
+        'latitude': 1.,
+        'longitude': 1.,
+        'starttime': UTCDateTime(0),
+        'delta': dt,
+        'npts': npts,
+        })
+
+    rng = np.random.default_rng(0)
+
+    data = Stream([Trace(rng.standard_normal(npts), {
+        'network': 'XX', 'station': 'S01', 'channel': 'BH'+component,
+        'starttime': UTCDateTime(0), 'delta': dt}) for component in 'ZRT'])
+    data.id = station.id
+    data.station = station
+    data.origin = origin
+    data.tags = ['units:m', 'type:velocity']
+
+    greens = GreensTensor([Trace(rng.standard_normal(npts), {
+        'channel': channel, 'starttime': UTCDateTime(0), 'delta': dt})
+        for channel in CHANNELS], station=station, origin=origin)
+    greens.tags = ['units:m', 'type:greens']
+
+    return data, greens
+
+
+
+if __name__=='__main__':
+    unittest.main()
+